@@ -0,0 +1,540 @@
+import ast
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import tokenize
+from bisect import bisect_left, bisect_right
+
+import report_data
+import storage
+import trading_calendar
+
+# 自訂法人籌碼警示規則：取代每天人工翻看「土洋同買超 / 土洋對作」清單。
+# 規則存在 alert_rules.json (網頁端 /alerts/rules 維護)，例如
+#   {"rules": [{"id": "big_buy_3d", "name": "外資買超逾5億且投信買超 連3日",
+#               "when": "foreign_val > 5億 and it_val > 0", "days": 3},
+#              {"id": "core_opposite", "name": "觀察名單土洋對作", "when": "code in watchlist and opposite",
+#               "watchlist": "core"}],
+#    "watchlists": {"core": ["2330", "2317"]}}
+# 條件式只允許欄位、數字 (可加 億 / 萬)、比較、and / or / not、+ - * /、abs / min / max 與 in；
+# 四則運算只能用在數值欄位與數字上，字串只能出現在比較 (name == '台積電'、code in ['2330', '2317']) 中，
+# 載入時編譯一次。analyze() 每產出一天就只以當天資料 + 每條規則的連續天數狀態增量計算，不重新掃描歷史；
+# 結果寫入 alert_state.json，由 /alerts 提供。
+# 每天先對用到的欄位排序一次，規則中最嚴格的「欄位 比較 數字」條件以二分搜尋取出候選股票，只對候選股票求值。
+
+RULES_FILE = os.environ.get('ALERT_RULES_FILE', 'alert_rules.json')
+STATE_FILE = os.environ.get('ALERT_STATE_FILE', 'alert_state.json')
+# 保留最近幾個交易日的比對結果
+HISTORY_DAYS = int(os.environ.get('ALERT_HISTORY_DAYS', '20'))
+
+MAX_RULE_LENGTH = 500
+# 條件中數字的絕對值上限 (1000 兆元，遠大於任何單日買賣超)
+MAX_CONSTANT = 1e15
+
+NUMERIC_FIELDS = ('price', 'vwap', 'foreign_shares', 'it_shares', 'foreign_val', 'it_val')
+TEXT_FIELDS = ('code', 'name', 'market')
+# 衍生欄位: 名稱 -> (運算式, 可用來取候選的範圍條件)
+DERIVED = {
+    'total_val': ("d['foreign_val'] + d['it_val']", ()),
+    'same_buy': ("(d['foreign_val'] > 0 and d['it_val'] > 0)", (('foreign_val', '>', 0), ('it_val', '>', 0))),
+    'same_sell': ("(d['foreign_val'] < 0 and d['it_val'] < 0)", (('foreign_val', '<', 0), ('it_val', '<', 0))),
+    'opp_fb_is': ("(d['foreign_val'] > 0 > d['it_val'])", (('foreign_val', '>', 0), ('it_val', '<', 0))),
+    'opp_fs_ib': ("(d['foreign_val'] < 0 < d['it_val'])", (('foreign_val', '<', 0), ('it_val', '>', 0))),
+    'opposite': ("(d['foreign_val'] * d['it_val'] < 0)", (('flow_product', '<', 0),)),
+}
+FUNCTIONS = {'abs': abs, 'min': min, 'max': max}
+UNITS = {'億': 100000000, '萬': 10000}
+# 結果中每檔股票保存的當天數值
+STOCK_FIELDS = ('code', 'name', 'market', 'price', 'foreign_shares', 'it_shares', 'foreign_val', 'it_val')
+# 可排序取候選的數值欄位 (total_val 也是數值)；abs(欄位) 另外以絕對值排序
+RANGE_FIELDS = NUMERIC_FIELDS + ('total_val',)
+# 只在索引中使用的虛擬欄位: 外資 x 投信 (小於 0 即對作)
+_VIRTUAL = {
+    'total_val': lambda d: d['foreign_val'] + d['it_val'],
+    'flow_product': lambda d: d['foreign_val'] * d['it_val'],
+}
+
+_COMPARE_OPS = {ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '=='}
+_FLIPPED = {'>': '<', '>=': '<=', '<': '>', '<=': '>=', '==': '=='}
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Gt, ast.GtE, ast.Lt, ast.LtE,
+    ast.Eq, ast.NotEq, ast.In, ast.NotIn, ast.Name, ast.Load, ast.Constant, ast.List, ast.Tuple, ast.Set, ast.Call,
+)
+_CONTAINERS = (ast.List, ast.Tuple, ast.Set)
+
+class RuleError(ValueError):
+    pass
+
+class Rule:
+    """
+    編譯後的規則: ranges / codes 為可由當天排序索引判斷的條件，
+    predicate(d) 為其餘需要逐檔判斷的條件 (沒有時為 None)。
+    """
+    __slots__ = ('id', 'name', 'when', 'days', 'market', 'watchlist', 'codes', 'ranges', 'predicate', 'key', 'filter_key')
+
+    def to_json(self):
+        rule = {'id': self.id, 'name': self.name, 'when': self.when, 'days': self.days}
+        if self.market:
+            rule['market'] = self.market
+        if self.watchlist:
+            rule['watchlist'] = self.watchlist
+        return rule
+
+def _number(node):
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _number(node.operand)
+        return None if value is None else (-value if isinstance(node.op, ast.USub) else value)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    return None
+
+def _constants(node):
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)) and all(isinstance(e, ast.Constant) for e in node.elts):
+        return frozenset(str(e.value) for e in node.elts)
+    return None
+
+def _range_field(node):
+    """可排序的欄位名稱 (field 或 abs(field))，其他運算式回傳 None。"""
+    if isinstance(node, ast.Name) and node.id in RANGE_FIELDS:
+        return node.id
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'abs' \
+            and len(node.args) == 1 and isinstance(node.args[0], ast.Name) and node.args[0].id in RANGE_FIELDS:
+        return f'abs({node.args[0].id})'
+    return None
+
+def _index_hint(node, watchlist):
+    """
+    最上層 and 中的一個條件若可完全由當天的排序索引判斷，回傳 (範圍條件 [(欄位, 比較, 數字)], 代號集合或 None)；
+    否則回傳 None (需逐檔求值)。
+    """
+    if isinstance(node, ast.Name) and DERIVED.get(node.id, (None, ()))[1]:
+        return list(DERIVED[node.id][1]), None
+    if not (isinstance(node, ast.Compare) and len(node.ops) == 1):
+        return None
+    left, right, op = node.left, node.comparators[0], type(node.ops[0])
+    if op in _COMPARE_OPS:
+        if _range_field(left) and _number(right) is not None:
+            return [(_range_field(left), _COMPARE_OPS[op], _number(right))], None
+        if _range_field(right) and _number(left) is not None:
+            return [(_range_field(right), _FLIPPED[_COMPARE_OPS[op]], _number(left))], None
+    if isinstance(left, ast.Name) and left.id == 'code':
+        if op is ast.Eq and isinstance(right, ast.Constant) and isinstance(right.value, str):
+            return [], frozenset([right.value])
+        if op is ast.In:
+            codes = watchlist if isinstance(right, ast.Name) and right.id == 'watchlist' else _constants(right)
+            if codes is not None:
+                return [], codes
+    return None
+
+class _Fields(ast.NodeTransformer):
+    def visit_Name(self, node):
+        if node.id in NUMERIC_FIELDS or node.id in TEXT_FIELDS:
+            return ast.copy_location(ast.Subscript(value=ast.Name('d', ast.Load()), slice=ast.Constant(node.id), ctx=ast.Load()), node)
+        if node.id in DERIVED:
+            return ast.copy_location(ast.parse(DERIVED[node.id][0], mode='eval').body, node)
+        if node.id == 'watchlist':
+            return ast.copy_location(ast.Name('_watchlist', ast.Load()), node)
+        return node
+
+def _apply_units(when):
+    """把數字後面的 億 / 萬 換算成數值 (5億 -> 500000000.0)；以 token 為單位處理，字串內容不受影響。"""
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(when).readline):
+        if tok.type == tokenize.NAME and tok.string in UNITS and tokens and tokens[-1][0] == tokenize.NUMBER:
+            value = ast.literal_eval(tokens[-1][1])
+            if type(value) not in (int, float):
+                raise SyntaxError('億 / 萬 只能接在數字後面')
+            tokens[-1] = (tokenize.NUMBER, repr(float(value) * UNITS[tok.string]))
+        else:
+            tokens.append((tok.type, tok.string))
+    return tokenize.untokenize(tokens)
+
+def _is_numeric(node):
+    """可以參與四則運算的運算式：數值欄位、數字，以及由它們組成的 + - * /、正負號與 abs / min / max。"""
+    if isinstance(node, ast.Name):
+        return node.id in RANGE_FIELDS
+    if isinstance(node, ast.Constant):
+        return type(node.value) in (int, float)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        return _is_numeric(node.operand)
+    if isinstance(node, ast.BinOp):
+        return _is_numeric(node.left) and _is_numeric(node.right)
+    if isinstance(node, ast.Call):
+        return isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and all(map(_is_numeric, node.args))
+    return False
+
+def _check_node(node, parent):
+    """節點種類以外的限制，不符合時回傳錯誤訊息。"""
+    if isinstance(node, ast.BinOp) or (isinstance(node, ast.UnaryOp) and not isinstance(node.op, ast.Not)):
+        if not _is_numeric(node):
+            return f'{ast.unparse(node)}: 運算只能用在數值欄位與數字上'
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            return f'只能呼叫 {", ".join(FUNCTIONS)}'
+        if not node.args or not all(map(_is_numeric, node.args)):
+            return f'{ast.unparse(node)}: 參數只能是數值欄位與數字'
+    elif isinstance(node, ast.Compare):
+        # 文字欄位只能與字串比較：code in [2330] 在索引路徑與逐檔求值的路徑上結果會不同
+        operands = [node.left] + node.comparators
+        if any(isinstance(o, ast.Name) and o.id in TEXT_FIELDS for o in operands):
+            for o in operands:
+                values = o.elts if isinstance(o, _CONTAINERS) else [o]
+                if any(isinstance(v, ast.Constant) and type(v.value) is not str for v in values):
+                    return f"{ast.unparse(node)}: {' / '.join(TEXT_FIELDS)} 只能與字串比較 (例如 code in ['2330'])"
+    elif isinstance(node, _CONTAINERS):
+        in_compare = isinstance(parent, ast.Compare) and any(
+            c is node and isinstance(op, (ast.In, ast.NotIn)) for op, c in zip(parent.ops, parent.comparators))
+        if not in_compare or not all(isinstance(e, ast.Constant) for e in node.elts):
+            return '清單只能用在 in 比較的右邊，且只能包含代號或數字'
+    elif isinstance(node, ast.Constant):
+        if type(node.value) in (int, float):
+            # not <=: 也擋掉 nan
+            if not abs(node.value) <= MAX_CONSTANT:
+                return f'數字 {node.value!r} 超過上限 {MAX_CONSTANT:g}'
+        elif type(node.value) is str:
+            if not isinstance(parent, (ast.Compare,) + _CONTAINERS):
+                return f'字串 {node.value!r} 只能用在比較中'
+        elif type(node.value) is not bool:
+            return f'不支援的常數 {node.value!r}'
+    return None
+
+def compile_rule(rule, watchlists=None):
+    """驗證並編譯單一規則 (dict)，格式錯誤時丟出 RuleError。"""
+    rule_id = str(rule.get('id') or '').strip()
+    if not re.fullmatch(r'[\w-]{1,64}', rule_id):
+        raise RuleError('id 只能使用英數字、底線與連字號 (1-64 字元)')
+    when = str(rule.get('when') or '').strip()
+    if not when:
+        raise RuleError(f'{rule_id}: 缺少條件 when')
+    if len(when) > MAX_RULE_LENGTH:
+        raise RuleError(f'{rule_id}: 條件過長 (上限 {MAX_RULE_LENGTH} 字元)')
+    try:
+        days = int(rule.get('days', 1))
+    except (TypeError, ValueError):
+        raise RuleError(f'{rule_id}: days 必須是整數')
+    if not 1 <= days <= HISTORY_DAYS:
+        raise RuleError(f'{rule_id}: days 必須介於 1 與 {HISTORY_DAYS}')
+    market = rule.get('market') or None
+    if market and market not in dict(report_data.MARKETS):
+        raise RuleError(f'{rule_id}: 未知的市場 {market}')
+    watchlist_name = rule.get('watchlist') or None
+    if watchlist_name and watchlist_name not in (watchlists or {}):
+        raise RuleError(f'{rule_id}: 找不到觀察名單 {watchlist_name}')
+    watchlist = frozenset(str(c) for c in (watchlists or {}).get(watchlist_name, ())) if watchlist_name else None
+
+    try:
+        tree = ast.parse(_apply_units(when), mode='eval')
+    except (SyntaxError, tokenize.TokenError, ValueError) as e:
+        raise RuleError(f'{rule_id}: 條件語法錯誤: {e.msg if isinstance(e, SyntaxError) else e.args[0]}')
+    parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RuleError(f'{rule_id}: 不支援的語法 {type(node).__name__}')
+        error = _check_node(node, parents.get(node))
+        if error:
+            raise RuleError(f'{rule_id}: {error}')
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS and node.id not in NUMERIC_FIELDS + TEXT_FIELDS \
+                and node.id not in DERIVED and node.id != 'watchlist':
+            raise RuleError(f'{rule_id}: 未知的名稱 {node.id}')
+        if isinstance(node, ast.Name) and node.id == 'watchlist' and watchlist is None:
+            raise RuleError(f'{rule_id}: 條件使用 watchlist 但規則沒有指定觀察名單')
+
+    compiled = Rule()
+    compiled.id = rule_id
+    compiled.name = str(rule.get('name') or rule_id)
+    compiled.when = when
+    compiled.days = days
+    compiled.market = market
+    compiled.watchlist = watchlist_name
+    # 可由索引判斷的條件在求值前先篩掉，其餘條件才編譯成逐檔求值的函式 (全部可由索引判斷時為 None)
+    conjuncts = tree.body.values if isinstance(tree.body, ast.BoolOp) and isinstance(tree.body.op, ast.And) else [tree.body]
+    compiled.ranges, compiled.codes, residual = [], None, []
+    for node in conjuncts:
+        hint = _index_hint(node, watchlist)
+        if hint is None:
+            residual.append(node)
+            continue
+        compiled.ranges.extend(hint[0])
+        if hint[1] is not None:
+            compiled.codes = hint[1] if compiled.codes is None else compiled.codes & hint[1]
+
+    # 篩選條件相同 (只差連續天數或名稱) 的規則在同一天共用比對結果
+    compiled.filter_key = (tuple(sorted(compiled.ranges)), compiled.codes, market,
+                           ast.unparse(ast.BoolOp(op=ast.And(), values=residual)) if residual else None)
+    compiled.predicate = None
+    if residual:
+        lam = ast.parse('lambda d: None', mode='eval')
+        lam.body.body = _Fields().visit(residual[0] if len(residual) == 1 else ast.BoolOp(op=ast.And(), values=residual))
+        ast.fix_missing_locations(lam)
+        namespace = {'__builtins__': {}, '_watchlist': watchlist or frozenset(), **FUNCTIONS}
+        compiled.predicate = eval(compile(lam, f'<rule {rule_id}>', 'eval'), namespace)
+    # 條件、天數、市場或觀察名單改變時，先前累積的連續天數不再有效
+    compiled.key = hashlib.sha1(json.dumps([when, days, market, sorted(watchlist or ())]).encode('utf-8')).hexdigest()[:12]
+    return compiled
+
+def _write(path, data):
+    storage.write_json(path, data, separators=(',', ':'))
+
+def load_rules(path=RULES_FILE):
+    """回傳 (原始設定, 編譯後的規則清單)。個別規則有誤時略過並印出原因，不影響其他規則。"""
+    config = storage.read_json(path) or {'rules': [], 'watchlists': {}}
+    config.setdefault('rules', [])
+    config.setdefault('watchlists', {})
+    rules = []
+    for rule in config['rules']:
+        try:
+            rules.append(compile_rule(rule, config['watchlists']))
+        except RuleError as e:
+            print(f"[ALERTS] 略過規則: {e}")
+    return config, rules
+
+def _change_rules(change, path=RULES_FILE):
+    # 規則由多個 gunicorn worker 修改，狀態由 analyze 行程 (可能同時多個) 更新，兩者都在檔案鎖內讀-改-寫
+    with storage.locked(path):
+        config = storage.read_json(path) or {'rules': [], 'watchlists': {}}
+        config.setdefault('rules', [])
+        config.setdefault('watchlists', {})
+        result = change(config)
+        _write(path, config)
+    return result
+
+def save_rule(rule, path=RULES_FILE):
+    """新增或取代同 id 的規則，回傳編譯後的規則 (格式錯誤時丟出 RuleError，不寫入)。"""
+    def change(config):
+        compiled = compile_rule(rule, config['watchlists'])
+        config['rules'] = [r for r in config['rules'] if r.get('id') != compiled.id] + [compiled.to_json()]
+        return compiled
+    return _change_rules(change, path)
+
+def delete_rule(rule_id, path=RULES_FILE):
+    def change(config):
+        before = len(config['rules'])
+        config['rules'] = [r for r in config['rules'] if r.get('id') != rule_id]
+        return len(config['rules']) < before
+    return _change_rules(change, path)
+
+def save_watchlist(name, codes, path=RULES_FILE):
+    if not re.fullmatch(r'[\w-]{1,64}', name or ''):
+        raise RuleError('觀察名單名稱只能使用英數字、底線與連字號 (1-64 字元)')
+    codes = sorted({str(c).strip() for c in codes if str(c).strip()})
+    def change(config):
+        config['watchlists'][name] = codes
+        return codes
+    return _change_rules(change, path)
+
+class _Day:
+    """單日資料與依欄位排序好的索引 (同一天所有規則共用，用到的欄位才排序)。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.codes = [d['code'] for d in rows]
+        self.markets = [d['market'] for d in rows]
+        self.positions = {code: i for i, code in enumerate(self.codes)}
+        self._sorted = {}
+
+    def _field(self, field):
+        """回傳 (排序後的值, 排序後各位置的列, 各列在排序中的位置, 各列的值)。"""
+        if field not in self._sorted:
+            if field.startswith('abs('):
+                values = [abs(v) for v in self._field(field[4:-1])[3]]
+            elif field in _VIRTUAL:
+                values = list(map(_VIRTUAL[field], self.rows))
+            else:
+                values = [d[field] for d in self.rows]
+            order = sorted(range(len(values)), key=values.__getitem__)
+            position = [0] * len(order)
+            for pos, i in enumerate(order):
+                position[i] = pos
+            self._sorted[field] = ([values[i] for i in order], order, position, values)
+        return self._sorted[field]
+
+    def bounds(self, field, op, value):
+        """符合「field op value」的列在排序後的範圍 (lo, hi)。"""
+        values = self._field(field)[0]
+        if op == '>':
+            return bisect_right(values, value), len(values)
+        if op == '>=':
+            return bisect_left(values, value), len(values)
+        if op == '<':
+            return 0, bisect_left(values, value)
+        if op == '<=':
+            return 0, bisect_right(values, value)
+        return bisect_left(values, value), bisect_right(values, value)
+
+    def candidates(self, rule):
+        """
+        回傳符合規則所有索引條件 (範圍、代號、市場) 的列，不依順序。
+        以命中最少的範圍 (或代號集合) 為起點，其餘範圍只比較各列在排序中的位置，不必再讀取數值。
+        """
+        spans = sorted((self.bounds(field, op, value) + (field,) for field, op, value in rule.ranges),
+                       key=lambda span: span[1] - span[0])
+        from_codes = rule.codes is not None and (not spans or len(rule.codes) < spans[0][1] - spans[0][0])
+        if from_codes:
+            best = [self.positions[c] for c in rule.codes if c in self.positions]
+        elif spans:
+            lo, hi, field = spans.pop(0)
+            best = self._field(field)[1][lo:hi]
+        else:
+            best = range(len(self.rows))
+        for lo, hi, field in spans:
+            position = self._field(field)[2]
+            best = [i for i in best if lo <= position[i] < hi]
+        if rule.codes is not None and not from_codes:
+            codes = self.codes
+            best = [i for i in best if codes[i] in rule.codes]
+        if rule.market:
+            markets = self.markets
+            best = [i for i in best if markets[i] == rule.market]
+        return best
+
+    def stocks(self, codes):
+        rows, positions = self.rows, self.positions
+        return {code: {f: rows[positions[code]][f] for f in STOCK_FIELDS} for code in codes}
+
+def _safe(predicate, d):
+    # 個別股票的資料讓條件無法求值 (除以 0、缺值、溢位等) 時視為不符合，不影響其他股票與規則
+    try:
+        return predicate(d)
+    except Exception:
+        return False
+
+def evaluate_day(rules, rows, state, date_str):
+    """
+    以當天資料增量計算所有規則，回傳 (新狀態, 當天結果)。
+    state 為 {rule_id: {'key', 'date', 'counts': {code: 連續天數}, 'prev_date', 'prev_counts'}}，
+    只記錄前一天符合條件的股票；當天不符合的股票連續天數歸零 (直接不記錄)。
+    同一日期重跑時以前一天的 counts 重新計算 (prev_counts)。
+    上次計算的日期與當天之間有已知開盤、卻沒有計算過的交易日時 (漏跑或回補順序錯亂)，連續天數從頭計算。
+    當天結果為 {'rules': {rule_id: {code: 連續天數}}, 'stocks': {code: 當天數值}}，
+    同一檔股票被多條規則選中時數值只存一份；排序留到讀取時 (expand) 才做。
+    """
+    day = _Day(rows)
+    new_state, matches, matched, shared, gaps = {}, {}, set(), {}, {}
+    for rule in rules:
+        old = state.get(rule.id)
+        if old and old.get('key') != rule.key:
+            old = None
+        if old and old['date'] == date_str:
+            base, base_date = old.get('prev_counts', {}), old.get('prev_date')
+        elif old and old['date'] > date_str:
+            # 較舊的日期 (回補) 不改變目前的連續天數
+            new_state[rule.id] = old
+            continue
+        else:
+            base, base_date = (old['counts'], old['date']) if old else ({}, None)
+        if base_date:
+            if base_date not in gaps:
+                gaps[base_date] = bool(trading_calendar.open_days_between(base_date, date_str))
+            if gaps[base_date]:
+                base = {}
+
+        codes = day.codes
+        hits = shared.get(rule.filter_key)
+        if hits is None:
+            hits, predicate = day.candidates(rule), rule.predicate
+            if predicate is not None:
+                try:
+                    hits = [i for i in hits if predicate(rows[i])]
+                except Exception:
+                    hits = [i for i in hits if _safe(predicate, rows[i])]
+            shared[rule.filter_key] = hits
+        counts = {codes[i]: base.get(codes[i], 0) + 1 for i in hits}
+        found = counts if rule.days == 1 else {code: n for code, n in counts.items() if n >= rule.days}
+        matched.update(found)
+        new_state[rule.id] = {'key': rule.key, 'date': date_str, 'counts': counts, 'prev_date': base_date, 'prev_counts': base}
+        matches[rule.id] = found
+    return new_state, {'rules': matches, 'stocks': day.stocks(matched)}
+
+def expand(day_result, rule_id):
+    """當天某規則的完整結果 [{code, name, market, days, price, ...}, ...]，連續天數長的在前，同天數依買賣超規模。"""
+    stocks = day_result['stocks']
+    found = [dict(stocks[code], days=days) for code, days in day_result['rules'].get(rule_id, {}).items()]
+    found.sort(key=lambda m: (-m['days'], -(abs(m['foreign_val']) + abs(m['it_val']))))
+    return found
+
+class AlertStore(storage.WatchedFile):
+    """警示的比對狀態與最近 HISTORY_DAYS 天的結果 (alert_state.json)。"""
+
+    def __init__(self, path=STATE_FILE, load=True):
+        self.path = path
+        self.lock = threading.Lock()
+        self.rules = {}     # rule_id -> 每條規則的連續天數狀態
+        self.matches = {}   # date -> {'rules': {rule_id: {code: 連續天數}}, 'stocks': {code: 當天數值}}
+        self.names = {}     # rule_id -> 規則名稱 (產出結果時的名稱)
+        if load:
+            self.load()
+
+    @property
+    def dates(self):
+        return sorted(self.matches, reverse=True)
+
+    def load(self):
+        signature = storage.file_signature(self.path)
+        state = storage.read_json(self.path)
+        if state is None:
+            return
+        self.rules = state['rules']
+        self.matches = state['matches']
+        self.names = state.get('names', {})
+        self.signature = signature
+
+    def save(self):
+        _write(self.path, {'rules': self.rules, 'matches': self.matches, 'names': self.names})
+        self.signature = storage.file_signature(self.path)
+
+    def add_day(self, date_str, rows, rules):
+        """
+        加入一天的結果並回傳 (見 evaluate_day)。比已記錄的最新日期還舊的日期 (回補) 不計算、回傳 None：
+        連續天數只能依日期順序累積，需要時以 rebuild() 重新計算。
+        """
+        if self.matches and date_str < max(self.matches):
+            return None
+        self.rules, day_matches = evaluate_day(rules, rows, self.rules, date_str)
+        self.names = {rule.id: rule.name for rule in rules}
+        self.matches[date_str] = day_matches
+        for old_date in sorted(self.matches)[:-HISTORY_DAYS]:
+            del self.matches[old_date]
+        return day_matches
+
+def update(date_str, rows, path=STATE_FILE, rules_path=RULES_FILE):
+    """analyze() 完成後呼叫：以當天資料計算所有規則並存檔，回傳當天結果 (見 evaluate_day)。"""
+    _, rules = load_rules(rules_path)
+    if not rules:
+        return {}
+    with storage.locked(path):
+        store = AlertStore(path)
+        matches = store.add_day(date_str, rows, rules)
+        if matches is None:
+            print(f"[ALERTS] {date_str} 早於已計算的日期，略過 (需要時執行 python alerts.py rebuild)")
+            return {}
+        store.save()
+    return matches
+
+def rebuild(pattern='market_analysis_*.json', path=STATE_FILE, rules_path=RULES_FILE):
+    """由既有的 sidecar 依日期順序重新計算 (新增規則後想看過去的結果時使用)。"""
+    _, rules = load_rules(rules_path)
+    store = AlertStore(path, load=False)
+    files = sorted(f for f in glob.glob(pattern)
+                   if os.path.basename(f)[len('market_analysis_'):-len('.json')].isdigit())
+    for filename in files:
+        date_str = os.path.basename(filename)[len('market_analysis_'):-len('.json')]
+        markets = report_data.load_sidecar(filename)
+        store.add_day(date_str, [d for rows in markets.values() for d in rows], rules)
+    with storage.locked(path):
+        store.save()
+    return len(files)
+
+if __name__ == '__main__':
+    import sys
+
+    # 由既有 sidecar 重新計算: python alerts.py rebuild
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild':
+        n = rebuild()
+        print(f"[ALERTS] 已由 sidecar 重新計算 {n} 個交易日")
+    else:
+        print("Usage: python alerts.py rebuild")
@@ -1,63 +1,205 @@
-import requests
+import asyncio
 import json
+import os
 import ssl
 from datetime import datetime, timedelta
 import time
 import traceback
-import pandas as pd
-import concurrent.futures
-
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-    'Accept': 'application/json, text/javascript, */*; q=0.01',
-    'Accept-Language': 'zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7',
-    'Connection': 'keep-alive',
-    'Referer': 'https://www.tpex.org.tw/'
+import report_data
+import report_store
+import ranking
+import excel_writer
+import http_client
+import raw_cache
+import trading_calendar
+import rolling
+import alerts
+import manifest
+import stock_history
+import metrics
+import progress
+
+# 一次分析依序經過的階段 (metrics.stage 的名稱，不含預檢)。開始時以 plan 事件送給網頁端計算進度百分比，
+# 新增階段時只需更新這裡
+STAGES = ['fetch.twse', 'parse.twse', 'fetch.tpex', 'parse.tpex', 'rank', 'write.sidecar', 'write.history',
+          'write.rolling', 'write.alerts', 'workbook.build', 'workbook.save', 'publish', 'write.report_store']
+
+# 記憶體受限模式 (小型主機): 兩個市場依序抓取，同一時間只保留一個市場的原始回應
+LOW_MEMORY = os.environ.get('LOW_MEMORY', 'false').lower() == 'true'
+
+def _twse_price_table(mi_data):
+    for table in mi_data.get('tables') or []:
+        if '每日收盤行情' in (table.get('title') or ''):
+            return table
+    return None
+
+def _first_table_rows(data):
+    tables = data.get('tables')
+    return bool(tables) and bool(tables[0].get('data'))
+
+# 各端點的回應要能被解析器使用才算有效 (交易所的「查無資料」、錯誤或空表格也是 JSON)；
+# 只有有效的回應才寫入 raw_cache，也只有有效的快取才會取代網路請求
+PAYLOAD_CHECKS = {
+    'twse_mi_ms': lambda d: d.get('stat') == 'OK',
+    'twse_t86': lambda d: bool(d.get('data')) and 'fields' in d,
+    'twse_mi_index': lambda d: bool((_twse_price_table(d) or {}).get('data')),
+    'tpex_3itrade': _first_table_rows,
+    'tpex_quotes': _first_table_rows,
 }
 
-def get_json(url):
-    try:
-        session = requests.Session()
-        # Disable SSL verification to prevent "CERTIFICATE VERIFY FAILED" on some Linux/Docker environments like Render
-        res = session.get(url, headers=headers, timeout=15, verify=False)
-        # Check HTTP response status and throw if not 200
-        res.raise_for_status()
-        return res.json()
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
-        return None
+def usable(endpoint, data):
+    if not isinstance(data, dict):
+        return False
+    check = PAYLOAD_CHECKS.get(endpoint)
+    return check is None or check(data)
+
+def _cached(cache_key):
+    endpoint, date_str = cache_key
+    if raw_cache.OFFLINE or raw_cache.is_immutable(date_str):
+        data = raw_cache.load(endpoint, date_str)
+        if data is not None and usable(endpoint, data):
+            return data
+    return None
+
+def _remember(cache_key, data):
+    if cache_key and raw_cache.is_immutable(cache_key[1]) and usable(cache_key[0], data):
+        try:
+            raw_cache.store(cache_key[0], cache_key[1], data)
+        except OSError as e:
+            print(f"[CACHE] 無法寫入快取 {cache_key}: {e}")
+
+def get_json(url, cache_key=None):
+    """
+    透過共用的連線池與重試機制取得資料 (見 http_client.py)。
+    cache_key 為 (endpoint, YYYYMMDD)：過去日期的有效回應會存入 raw_cache 並優先由磁碟讀取，
+    離線模式 (--offline) 下只讀快取、完全不連網。
+    """
+    if cache_key:
+        cached = _cached(cache_key)
+        if cached is not None:
+            return cached
+        if raw_cache.OFFLINE:
+            print(f"[OFFLINE] 快取中沒有 {cache_key[0]} {cache_key[1]} 的資料")
+            return None
+
+    data = http_client.get_json(url, endpoint=cache_key[0] if cache_key else None)
+    _remember(cache_key, data)
+    return data
+
+async def fetch_json(fetcher, url, cache_key=None, refetch=False):
+    """
+    get_json 的非同步版本：經由 http_client.AsyncFetcher 抓取，快取規則相同。
+    refetch 為 True 時不讀 raw_cache，直接連網並以新的有效回應覆寫快取 (離線模式仍只讀快取)。
+    """
+    if cache_key and (raw_cache.OFFLINE or not refetch):
+        cached = _cached(cache_key)
+        if cached is not None:
+            return cached
+        if raw_cache.OFFLINE:
+            print(f"[OFFLINE] 快取中沒有 {cache_key[0]} {cache_key[1]} 的資料")
+            return None
+
+    data = await fetcher.get_json(url, endpoint=cache_key[0] if cache_key else None)
+    _remember(cache_key, data)
+    return data
+
+def precheck_url(date_str):
+    # MI_INDEX type=MS 是市場成交概況，回傳資料極少
+    return f"https://www.twse.com.tw/exchangeReport/MI_INDEX?response=json&date={date_str}&type=MS"
+
+def twse_requests(date):
+    """上市的 [(raw_cache 端點, URL)]：法人買賣超、收盤行情。"""
+    return [
+        ('twse_t86', f"https://www.twse.com.tw/fund/T86?response=json&date={date}&selectType=ALL"),
+        ('twse_mi_index', f"https://www.twse.com.tw/exchangeReport/MI_INDEX?response=json&date={date}&type=ALLBUT0999"),
+    ]
+
+def tpex_requests(date_roc):
+    """上櫃的 [(raw_cache 端點, URL)]，日期為民國格式 '115/02/23'。"""
+    return [
+        # tpex T86 equivalent
+        ('tpex_3itrade', f"https://www.tpex.org.tw/web/stock/3insti/daily_trade/3itrade_hedge_result.php?l=zh-tw&se=EW&t=D&d={date_roc}"),
+        # tpex MI_INDEX equivalent
+        ('tpex_quotes', f"https://www.tpex.org.tw/web/stock/aftertrading/daily_close_quotes/stk_quote_result.php?l=zh-tw&d={date_roc}"),
+    ]
+
+def roc_date(date_str):
+    """'20260223' -> '115/02/23'"""
+    return f"{int(date_str[:4]) - 1911:03d}/{date_str[4:6]}/{date_str[6:8]}"
 
 def validate_trading_day(date_str):
     """
     使用體積極小的 '市場成交概況' API 來快速預檢當天是否為有效交易日。
     這比直接抓整份法人買賣超 (T86) 輕量得多，適合用來做前置測試。
+    已知的開盤/休市日 (含週末) 直接由本地交易日曆回答，不發出請求。
     """
-    # MI_INDEX type=MS 是市場成交概況，回傳資料極少
-    url = f"https://www.twse.com.tw/exchangeReport/MI_INDEX?response=json&date={date_str}&type=MS"
-    data = get_json(url)
+    known = trading_calendar.lookup(date_str)
+    if known is not None:
+        return known
+
+    with metrics.stage('precheck'):
+        data = get_json(precheck_url(date_str), cache_key=('twse_mi_ms', date_str))
+    if data is None:
+        # 連線失敗無法判斷，不寫入日曆
+        return False
     # 如果 data['stat'] 為 'OK'，代表當天有交易紀錄
-    return data and data.get('stat') == 'OK'
+    is_open = data.get('stat') == 'OK'
+    trading_calendar.record(date_str, is_open)
+    return is_open
 
-def fetch_twse(date="20260223"):
-    t86_url = f"https://www.twse.com.tw/fund/T86?response=json&date={date}&selectType=ALL"
-    mi_url = f"https://www.twse.com.tw/exchangeReport/MI_INDEX?response=json&date={date}&type=ALLBUT0999"
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        f_t86 = executor.submit(get_json, t86_url)
-        f_mi = executor.submit(get_json, mi_url)
-        t86_data = f_t86.result()
-        mi_data = f_mi.result()
-    
+def is_common_stock(code):
+    # 排除 ETF 與非普通股 (代號長度非 4 或 0 開頭)
+    return len(code) == 4 and not code.startswith('0')
+
+def _vwap_or_close(close_p, vol_str, val_str):
+    if vol_str.isdigit() and val_str.isdigit():
+        vol = int(vol_str)
+        if vol > 0:
+            return int(val_str) / vol
+    return close_p
+
+def _join_prices(market, rows, idx_code, idx_name, idx_foreign, idx_it, prices):
+    """以代號將法人買賣超列與價格表合併成每檔一個 dict。"""
+    results = []
+    append = results.append
+    for row in rows:
+        code = str(row[idx_code]).strip()
+        price = prices.get(code)
+        # If no price or price is 0, we can calculate value (prices 只含普通股)
+        if price is None:
+            continue
+        try:
+            foreign_shares = int(str(row[idx_foreign]).replace(',', ''))
+            it_shares = int(str(row[idx_it]).replace(',', ''))
+        except (ValueError, IndexError):
+            continue
+        close_p, vwap = price
+        append({
+            'market': market,
+            'code': code,
+            'name': str(row[idx_name]).strip(),
+            'price': close_p,
+            'vwap': vwap,
+            'foreign_val': foreign_shares * vwap,
+            'it_val': it_shares * vwap,
+            'foreign_shares': foreign_shares,
+            'it_shares': it_shares
+        })
+    return results
+
+def parse_twse(t86_data, mi_data):
+    """將 TWSE T86 與 MI_INDEX 的原始回應整理成每檔一筆的 dict 清單。"""
     if not t86_data or 'data' not in t86_data:
         print("Failed to get TWSE T86")
         return []
         
+    # prices: code -> (收盤價, 均價)，只保留收盤價非 0 的普通股，後續合併時只需一次查表
     prices = {}
     if mi_data and 'tables' in mi_data:
         # MI_INDEX tables structure, usually the 9th table is closing prices
         target_table = None
         for table in mi_data['tables']:
-            title = table.get('title', '')
+            title = table.get('title') or ''
             if '每日收盤行情' in title:
                 target_table = table
                 break
@@ -72,27 +214,21 @@ def fetch_twse(date="20260223"):
                 
                 for row in target_table['data']:
                     code = row[idx_mi_code].strip()
-                    price_str = row[idx_mi_close].replace(',', '')
-                    vol_str = row[idx_mi_vol].replace(',', '')
-                    val_str = row[idx_mi_val].replace(',', '')
-                    
+                    if not is_common_stock(code):
+                        prices.pop(code, None)
+                        continue
                     try:
-                        close_p = float(price_str)
+                        close_p = float(row[idx_mi_close].replace(',', ''))
                     except ValueError:
                         close_p = 0.0
-                        
-                    vwap = close_p
-                    if vol_str.isdigit() and val_str.isdigit():
-                        vol = int(vol_str)
-                        val = int(val_str)
-                        if vol > 0:
-                            vwap = val / vol
-                    
-                    prices[code] = {'close': close_p, 'vwap': vwap}
+                    if close_p == 0:
+                        prices.pop(code, None)
+                        continue
+                    vwap = _vwap_or_close(close_p, row[idx_mi_vol].replace(',', ''), row[idx_mi_val].replace(',', ''))
+                    prices[code] = (close_p, vwap)
             except Exception as e:
                 print("Error parsing TWSE MI_INDEX fields:", e)
     
-    results = []
     t86_fields = t86_data['fields']
     idx_code = t86_fields.index('證券代號')
     idx_name = t86_fields.index('證券名稱')
@@ -107,71 +243,33 @@ def fetch_twse(date="20260223"):
     except StopIteration:
         idx_it = next(i for i, f in enumerate(t86_fields) if '投信' in f and '買賣超' in f)
 
-    for row in t86_data['data']:
-        code = row[idx_code].strip()
-        name = row[idx_name].strip()
-        
-        # If no price or price is 0, we can calculate value
-        if code not in prices or prices[code]['close'] == 0:
-            continue
-            
-        # 排除 ETF 與非普通股 (代號長度非 4 或 0 開頭)
-        if len(code) != 4 or code.startswith('0'):
-            continue
-            
-        try:
-            foreign_shares = int(row[idx_foreign].replace(',', ''))
-            it_shares = int(row[idx_it].replace(',', ''))
-        except ValueError:
-            continue
-            
-        foreign_value = foreign_shares * prices[code]['vwap']
-        it_value = it_shares * prices[code]['vwap']
-        
-        results.append({
-            'market': 'TWSE',
-            'code': code,
-            'name': name,
-            'price': prices[code]['close'],
-            'vwap': prices[code]['vwap'],
-            'foreign_val': foreign_value,
-            'it_val': it_value,
-            'foreign_shares': foreign_shares,
-            'it_shares': it_shares
-        })
-        
-    return results
+    return _join_prices('TWSE', t86_data['data'], idx_code, idx_name, idx_foreign, idx_it, prices)
 
-def fetch_tpex(date_roc="115/02/23"):
-    # tpex T86 equivalent
-    t86_url = f"https://www.tpex.org.tw/web/stock/3insti/daily_trade/3itrade_hedge_result.php?l=zh-tw&se=EW&t=D&d={date_roc}"
-    # tpex MI_INDEX equivalent
-    mi_url = f"https://www.tpex.org.tw/web/stock/aftertrading/daily_close_quotes/stk_quote_result.php?l=zh-tw&d={date_roc}"
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        f_t86 = executor.submit(get_json, t86_url)
-        f_mi = executor.submit(get_json, mi_url)
-        t86_data = f_t86.result()
-        mi_data = f_mi.result()
-    
-    results = []
+def parse_tpex(t86_data, mi_data):
+    """將 TPEx 三大法人與收盤行情的原始回應整理成每檔一筆的 dict 清單。"""
     if not t86_data or 'tables' not in t86_data or not t86_data['tables']:
         print("Failed to get TPEX T86")
-        return results
+        return []
         
     if not mi_data or 'tables' not in mi_data or not mi_data['tables']:
         print("Failed to get TPEX closing prices")
-        return results
+        return []
         
     prices = {}
     mi_table = mi_data['tables'][0]
     for row in mi_table.get('data', []):
         code = row[0].strip()
+        if not is_common_stock(code):
+            prices.pop(code, None)
+            continue
         price_str = row[2].replace(',', '') # idx 2 is '收盤'
         try:
             close_p = float(price_str)
         except ValueError:
             close_p = 0.0
+        if close_p == 0:
+            prices.pop(code, None)
+            continue
             
         vwap = close_p
         try:
@@ -185,43 +283,29 @@ def fetch_tpex(date_roc="115/02/23"):
         except Exception:
             pass
             
-        prices[code] = {'close': close_p, 'vwap': vwap}
+        prices[code] = (close_p, vwap)
             
-    t86_table = t86_data['tables'][0]
-    for row in t86_table.get('data', []):
-        # TPEX format: 0=代號, 1=名稱
-        # 4=外資買賣超, 7=外資自營買賣超, 10=外資合計, 13=投信買賣超
-        code = str(row[0]).strip()
-        name = str(row[1]).strip()
-        if code not in prices or prices[code]['close'] == 0:
-            continue
-            
-        # 排除 ETF 與非普通股 (代號長度非 4 或 0 開頭)
-        if len(code) != 4 or code.startswith('0'):
-            continue
-            
-        try:
-            foreign_shares = int(str(row[4]).replace(',', ''))
-            it_shares = int(str(row[13]).replace(',', ''))
-        except (ValueError, IndexError):
-            continue
-            
-        foreign_value = foreign_shares * prices[code]['vwap']
-        it_value = it_shares * prices[code]['vwap']
-        
-        results.append({
-            'market': 'TPEX',
-            'code': code,
-            'name': name,
-            'price': prices[code]['close'],
-            'vwap': prices[code]['vwap'],
-            'foreign_val': foreign_value,
-            'it_val': it_value,
-            'foreign_shares': foreign_shares,
-            'it_shares': it_shares
-        })
-        
-    return results
+    # TPEX format: 0=代號, 1=名稱
+    # 4=外資買賣超, 7=外資自營買賣超, 10=外資合計, 13=投信買賣超
+    return _join_prices('TPEX', t86_data['tables'][0].get('data', []), 0, 1, 4, 13, prices)
+
+async def _fetch_requests(fetcher, requests, date, refetch=False):
+    return await asyncio.gather(*(fetch_json(fetcher, url, (endpoint, date), refetch) for endpoint, url in requests))
+
+async def fetch_twse(fetcher, date="20260223", refetch=False):
+    with metrics.stage('fetch.twse'):
+        t86_data, mi_data = await _fetch_requests(fetcher, twse_requests(date), date, refetch)
+
+    # 兩份回應到齊就在事件迴圈中解析，另一個市場的請求同時繼續進行
+    with metrics.stage('parse.twse'):
+        return parse_twse(t86_data, mi_data)
+
+async def fetch_tpex(fetcher, date_roc="115/02/23", refetch=False):
+    with metrics.stage('fetch.tpex'):
+        t86_data, mi_data = await _fetch_requests(fetcher, tpex_requests(date_roc), raw_cache.roc_to_date(date_roc), refetch)
+
+    with metrics.stage('parse.tpex'):
+        return parse_tpex(t86_data, mi_data)
 
 def format_val(val):
     if val >= 0:
@@ -229,29 +313,109 @@ def format_val(val):
     else:
         return f"{val/100000000:.2f}億元"
 
-def analyze(target_date_str=None):
+def analyze(target_date_str=None, refetch=False):
     if not target_date_str:
         target_date_str = datetime.now().strftime('%Y%m%d')
-        
+
+    progress.emit('plan', date=target_date_str, stages=STAGES)
+    # 在報表清單標記為產出中；沒有發佈 (休市、失敗或例外) 時清除標記
+    manifest.mark_in_progress(target_date_str)
+    published = False
+    try:
+        published = _analyze(target_date_str, refetch)
+        return published
+    finally:
+        if not published:
+            manifest.abort(target_date_str)
+
+async def _fetch_market(fetcher, fetch, date, gate, refetch):
+    # 單一市場的例外不影響另一個市場，視為該市場失敗 (之後重跑只重抓這個市場)
+    async with gate:
+        try:
+            return await fetch(fetcher, date, refetch)
+        except Exception as e:
+            print(f"[ERROR] {fetch.__name__}({date}) 失敗: {e}")
+            traceback.print_exc()
+            return []
+
+async def fetch_markets(markets, on_market, refetch=False):
+    """
+    在同一個事件迴圈中抓取多個市場 (markets: {market_key: (fetch_twse / fetch_tpex, 日期)})，
+    所有請求共用 AsyncFetcher 的同時請求與每主機上限。每個市場一解析完成就呼叫 on_market(market_key, rows)，
+    不必等其他市場。refetch 為 True 時這些市場的原始回應不讀 raw_cache，重新抓取並覆寫快取。
+    """
+    # 記憶體受限模式: 市場依序抓取，同一時間只保留一個市場的原始回應
+    gate = asyncio.Semaphore(1 if LOW_MEMORY else len(markets))
+    async with http_client.AsyncFetcher() as fetcher:
+        async def run(market_key):
+            return market_key, await _fetch_market(fetcher, *markets[market_key], gate, refetch)
+        for done in asyncio.as_completed([run(market_key) for market_key in markets]):
+            market_key, rows = await done
+            on_market(market_key, rows)
+
+def _save_market_part(date_str, market_key, rows, status):
+    try:
+        report_data.write_market_part(date_str, market_key, rows, status)
+    except OSError as e:
+        print(f"無法保存 {market_key} 市場資料: {e}")
+
+def _analyze(target_date_str, refetch=False):
     year = int(target_date_str[:4])
     month = target_date_str[4:6]
     day = target_date_str[6:8]
-    roc_year = year - 1911
-    
+
     twse_date = target_date_str
-    tpex_date = f"{roc_year:03d}/{month}/{day}"
-    
-    print(f"Fetching data from TWSE ({twse_date}) and TPEx ({tpex_date}) in parallel...")
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        f_twse = executor.submit(fetch_twse, twse_date)
-        f_tpex = executor.submit(fetch_tpex, tpex_date)
-        twse_data = f_twse.result()
-        tpex_data = f_tpex.result()
-    
-    all_data = twse_data + tpex_data
+    tpex_date = roc_date(target_date_str)
+    fetchers = {'TWSE': (fetch_twse, twse_date), 'TPEX': (fetch_tpex, tpex_date)}
+
+    # 各市場結果分開保存；重跑同一天時沿用已成功的市場，只抓缺少或上次失敗的市場 (--refetch 全部重抓，重抓失敗的市場仍沿用先前的資料)
+    market_data = {}
+    if not refetch:
+        for market_key, _ in report_data.MARKETS:
+            rows = report_data.load_market_part(target_date_str, market_key)
+            if rows:
+                market_data[market_key] = rows
+    missing = [market_key for market_key, _ in report_data.MARKETS if market_key not in market_data]
+    if market_data:
+        print(f"沿用已取得的市場資料: {', '.join(market_data)}；重新抓取: {', '.join(missing) or '無'}")
+
+    for market_key, rows in market_data.items():
+        progress.emit('market', date=target_date_str, market=market_key, status='ok', rows=len(rows), source='saved')
+
+    fetched = {}
+
+    def on_market(market_key, rows):
+        # 先完成的市場立即保存並通知網頁端，不必等另一個市場
+        fetched[market_key] = rows
+        if rows:
+            _save_market_part(target_date_str, market_key, rows, 'ok')
+            progress.emit('market', date=target_date_str, market=market_key, status='ok', rows=len(rows), source='fetched')
+
+    if missing:
+        print(f"Fetching data from {' and '.join(f'{m} ({fetchers[m][1]})' for m in missing)} in parallel...")
+        asyncio.run(fetch_markets({m: fetchers[m] for m in missing}, on_market, refetch))
+    market_data.update(fetched)
+
+    # --refetch 時重新抓取失敗的市場沿用上次成功的資料，一次暫時的連線問題不會讓完整的報表變成 partial
+    if refetch:
+        for market_key, rows in list(fetched.items()):
+            saved = None if rows else report_data.load_market_part(target_date_str, market_key)
+            if saved:
+                print(f"{market_key} 重新抓取失敗，沿用先前取得的資料 ({len(saved)} 筆)")
+                market_data[market_key] = saved
+                del fetched[market_key]
+                progress.emit('market', date=target_date_str, market=market_key, status='ok', rows=len(saved), source='saved')
+
+    all_data = [d for market_key, _ in report_data.MARKETS for d in market_data[market_key]]
     if not all_data:
         print(f"No data for {target_date_str}. The market might be closed.")
         return False # Return False instead of raising, to let the loop handle it
+
+    # 休市日兩個市場都沒有資料，不留下 failed 紀錄；只有另一個市場有資料時才標記失敗
+    for market_key, rows in fetched.items():
+        if not rows:
+            _save_market_part(target_date_str, market_key, rows, 'failed')
+            progress.emit('market', date=target_date_str, market=market_key, status='failed', rows=0, source='fetched')
     
     # ... rest of analysis logic ...
     # (Note: Need to make sure all_data logic can continue or return status)
@@ -262,48 +426,39 @@ def analyze(target_date_str=None):
     print(f"Successfully processed {len(all_data)} stocks.")
     print("="*60)
     
-    # Sort by foreign value
-    foreign_buy = sorted([d for d in all_data if d['foreign_val'] > 0], key=lambda x: x['foreign_val'], reverse=True)
-    foreign_sell = sorted([d for d in all_data if d['foreign_val'] < 0], key=lambda x: x['foreign_val'])
-    
-    # Sort by IT value
-    it_buy = sorted([d for d in all_data if d['it_val'] > 0], key=lambda x: x['it_val'], reverse=True)
-    it_sell = sorted([d for d in all_data if d['it_val'] < 0], key=lambda x: x['it_val'])
+    # 一次掃描完成所有排名分類 (主控台取前 10 名，工作表使用完整排序的區塊)
+    with metrics.stage('rank'):
+        rankings = ranking.rank(all_data, k=10)
+    top = rankings['top']
     
     print("\n### 外資買超排名 (依成交值)")
-    for i, d in enumerate(foreign_buy[:10], 1):
+    for i, d in enumerate(top['foreign_buy'], 1):
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : {format_val(d['foreign_val'])}")
         
     print("\n### 外資賣超排名 (依成交值)")
-    for i, d in enumerate(foreign_sell[:10], 1):
+    for i, d in enumerate(top['foreign_sell'], 1):
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : {format_val(d['foreign_val'])}")
         
     print("\n### 投信買超排名 (依成交值)")
-    for i, d in enumerate(it_buy[:10], 1):
+    for i, d in enumerate(top['it_buy'], 1):
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : {format_val(d['it_val'])}")
         
     print("\n### 投信賣超排名 (依成交值)")
-    for i, d in enumerate(it_sell[:10], 1):
+    for i, d in enumerate(top['it_sell'], 1):
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : {format_val(d['it_val'])}")
 
     print("\n" + "="*60)
     
     # 同向與反向分析
     # 同向買超: 外資買超 > 0 且 投信買超 > 0, 依加總值排序
-    same_buy = [d for d in all_data if d['foreign_val'] > 0 and d['it_val'] > 0]
-    same_buy.sort(key=lambda x: x['foreign_val'] + x['it_val'], reverse=True)
-    
     print("\n### 土洋同買超 (外資與投信皆買超，依總買超金額排序)")
-    for i, d in enumerate(same_buy[:10], 1):
+    for i, d in enumerate(top['same_buy'], 1):
         total = d['foreign_val'] + d['it_val']
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : 總計 {format_val(total)} (外資 {format_val(d['foreign_val'])}, 投信 {format_val(d['it_val'])})")
         
     # 同向賣超: 外資賣超 < 0 且 投信賣超 < 0
-    same_sell = [d for d in all_data if d['foreign_val'] < 0 and d['it_val'] < 0]
-    same_sell.sort(key=lambda x: x['foreign_val'] + x['it_val'])
-    
     print("\n### 土洋同賣超 (外資與投信皆賣超，依總賣超金額排序)")
-    for i, d in enumerate(same_sell[:10], 1):
+    for i, d in enumerate(top['same_sell'], 1):
         total = d['foreign_val'] + d['it_val']
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : 總計 {format_val(total)} (外資 {format_val(d['foreign_val'])}, 投信 {format_val(d['it_val'])})")
         
@@ -311,193 +466,102 @@ def analyze(target_date_str=None):
     
     # 土洋對作: 外資與投信方向相反
     # 分為: 外資買/投信賣, 外資賣/投信買 (依兩者絕對值加總排序表示激烈程度)
-    opp_fb_is = [d for d in all_data if d['foreign_val'] > 0 > d['it_val']]
-    opp_fb_is.sort(key=lambda x: abs(x['foreign_val']) + abs(x['it_val']), reverse=True)
-    
     print("\n### 土洋對作: 外資買超、投信賣超 (依對作規模排序)")
-    for i, d in enumerate(opp_fb_is[:10], 1):
+    for i, d in enumerate(top['opp_fb_is'], 1):
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : 外資 {format_val(d['foreign_val'])}, 投信 {format_val(d['it_val'])}")
         
-    opp_fs_ib = [d for d in all_data if d['foreign_val'] < 0 < d['it_val']]
-    opp_fs_ib.sort(key=lambda x: abs(x['foreign_val']) + abs(x['it_val']), reverse=True)
-    
     print("\n### 土洋對作: 外資賣超、投信買超 (依對作規模排序)")
-    for i, d in enumerate(opp_fs_ib[:10], 1):
+    for i, d in enumerate(top['opp_fs_ib'], 1):
         print(f"{i:2d}. {d['code']:<6} {d['name']:<10} : 外資 {format_val(d['foreign_val'])}, 投信 {format_val(d['it_val'])}")
         
     print("\n" + "="*60 + "\n完成！")
 
-    # 輸出成四欄位、分上市櫃的 Excel 報表
+    # 先寫出給網頁端使用的 JSON sidecar，Excel 僅作為下載用的人讀報表
+    sidecar = None
+    try:
+        with metrics.stage('write.sidecar'):
+            sidecar = report_data.write_sidecar(target_date_str, all_data)
+        print(f"已輸出報表資料檔: {sidecar}")
+    except Exception as e:
+        print(f"輸出報表資料檔時發生錯誤: {e}")
+
+    # 寫入以股票代號索引的個股歷史
     try:
-        import openpyxl
-        from openpyxl.styles import PatternFill, Font, Alignment
-    except ImportError:
-        import subprocess
-        import sys
-        print("首次執行，正在安裝 openpyxl 套件...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "openpyxl"])
-        import openpyxl
-        from openpyxl.styles import PatternFill, Font, Alignment
+        with metrics.stage('write.history'):
+            stock_history.record_day(target_date_str, all_data)
+    except Exception as e:
+        print(f"寫入個股歷史時發生錯誤: {e}")
 
+    # 併入 N 日滾動法人統計 (只加上當天、扣掉離開視窗的那天)
     try:
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active) # 移除預設工作表
-        
-        # 建立格式與字體
-        report_date = f"{year}/{month}/{day}"
-        
-        light_red_fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-        dark_red_fill = PatternFill(start_color="FF8080", end_color="FF8080", fill_type="solid")
-        light_green_fill = PatternFill(start_color="E6FFE6", end_color="E6FFE6", fill_type="solid")
-        dark_green_fill = PatternFill(start_color="80FF80", end_color="80FF80", fill_type="solid")
-        
-        date_font = Font(name='微軟正黑體', size=12, bold=True, color="000000")
-        header_font = Font(name='微軟正黑體', size=12, bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-        sub_header_fill = PatternFill(start_color="DCE6F1", end_color="DCE6F1", fill_type="solid")
-        sub_header_font = Font(name='微軟正黑體', size=11, bold=True)
-        base_font = Font(name='微軟正黑體', size=11)
-        
-        center_align = Alignment(horizontal='center', vertical='center')
-        left_align = Alignment(horizontal='left', vertical='center')
-        right_align = Alignment(horizontal='right', vertical='center')
-        
-        for market_key, sheet_name in [('TWSE', '上市'), ('TPEX', '上櫃')]:
-            ws = wb.create_sheet(title=sheet_name)
-            
-            # 第一列: 日期
-            ws.append([f"{report_date}"])
-            ws.cell(row=1, column=1).font = date_font
-            ws.cell(row=1, column=1).alignment = left_align
-            
-            # 篩選出該市場的資料
-            market_data = [d for d in all_data if d['market'] == market_key]
-            
-            # 依買賣超金額排序 (由大到小 / 由深到淺即負數由小到大)
-            fb = sorted([d for d in market_data if d['foreign_shares'] > 0], key=lambda x: x['foreign_val'], reverse=True)
-            fs = sorted([d for d in market_data if d['foreign_shares'] < 0], key=lambda x: x['foreign_val'])
-            ib = sorted([d for d in market_data if d['it_shares'] > 0], key=lambda x: x['it_val'], reverse=True)
-            isell = sorted([d for d in market_data if d['it_shares'] < 0], key=lambda x: x['it_val'])
-            
-            max_rows = max(len(fb), len(fs), len(ib), len(isell))
-            
-            # 第二列: 大標題
-            row2 = [
-                "外資買超", "", "", "", "", "", "",
-                "外資賣超", "", "", "", "", "", "",
-                "投信買超", "", "", "", "", "", "",
-                "投信賣超", "", "", "", "", ""
-            ]
-            ws.append(row2)
-            
-            # 第三列: 子標題
-            sub_headers = [
-                "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)", "",
-                "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)", "",
-                "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)", "",
-                "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)"
-            ]
-            ws.append(sub_headers)
-            
-            # 合併第二列儲存格
-            ws.merge_cells("A2:F2")
-            ws.merge_cells("H2:M2")
-            ws.merge_cells("O2:T2")
-            ws.merge_cells("V2:AA2")
-            
-            # 設定前三列樣式
-            for cell in ws[2]:
-                cell.font = header_font
-                cell.alignment = center_align
-                if cell.value:
-                    cell.fill = header_fill
-            for cell in ws[3]:
-                cell.font = sub_header_font
-                cell.alignment = center_align
-                if cell.value:
-                    cell.fill = sub_header_fill
-            
-            # 計算每檔股票的狀態 (同向或反向)
-            stock_state = {}
-            for d in market_data:
-                f_val, i_val = d['foreign_shares'], d['it_shares']
-                if (f_val > 0 and i_val > 0) or (f_val < 0 and i_val < 0):
-                    if abs(f_val) > abs(i_val):
-                        stock_state[d['code']] = (dark_red_fill, light_red_fill)
-                    else:
-                        stock_state[d['code']] = (light_red_fill, dark_red_fill)
-                elif (f_val > 0 and i_val < 0) or (f_val < 0 and i_val > 0):
-                    if abs(f_val) > abs(i_val):
-                        stock_state[d['code']] = (dark_green_fill, light_green_fill)
-                    else:
-                        stock_state[d['code']] = (light_green_fill, dark_green_fill)
-                else:
-                    stock_state[d['code']] = (None, None)
-
-            # 輔助函式：取得股票資料與對應的顏色
-            def get_stock_data(lst, idx, val_key, shares_key, is_foreign):
-                if idx < len(lst):
-                    st = lst[idx]
-                    fills = stock_state.get(st['code'], (None, None))
-                    fill = fills[0] if is_foreign else fills[1]
-                    code_val = int(st['code']) if st['code'].isdigit() else st['code']
-                    return [code_val, st['name'], st['price'], st['vwap'], st[shares_key], st[val_key] / 1000000], fill
-                return ["", "", "", "", "", ""], None
-
-            # 寫入各分類的排名資料
-            for row_i in range(max_rows):
-                fb_data, fb_fill = get_stock_data(fb, row_i, 'foreign_val', 'foreign_shares', True)
-                fs_data, fs_fill = get_stock_data(fs, row_i, 'foreign_val', 'foreign_shares', True)
-                ib_data, ib_fill = get_stock_data(ib, row_i, 'it_val', 'it_shares', False)
-                is_data, is_fill = get_stock_data(isell, row_i, 'it_val', 'it_shares', False)
-                
-                row_idx = row_i + 4 # 標題佔 3 列
-                
-                col_settings = [
-                    (1, fb_data[0], None, None), (2, fb_data[1], fb_fill, None), (3, fb_data[2], None, '#,##0.00'), (4, fb_data[3], None, '#,##0.00'), (5, fb_data[4], None, '#,##0'), (6, fb_data[5], None, '#,##0.00'),
-                    (8, fs_data[0], None, None), (9, fs_data[1], fs_fill, None), (10, fs_data[2], None, '#,##0.00'), (11, fs_data[3], None, '#,##0.00'), (12, fs_data[4], None, '#,##0'), (13, fs_data[5], None, '#,##0.00'),
-                    (15, ib_data[0], None, None), (16, ib_data[1], ib_fill, None), (17, ib_data[2], None, '#,##0.00'), (18, ib_data[3], None, '#,##0.00'), (19, ib_data[4], None, '#,##0'), (20, ib_data[5], None, '#,##0.00'),
-                    (22, is_data[0], None, None), (23, is_data[1], is_fill, None), (24, is_data[2], None, '#,##0.00'), (25, is_data[3], None, '#,##0.00'), (26, is_data[4], None, '#,##0'), (27, is_data[5], None, '#,##0.00')
-                ]
-                
-                for col, val, fill, num_fmt in col_settings:
-                    if val != "":
-                        cell = ws.cell(row=row_idx, column=col, value=val)
-                        cell.font = base_font
-                        cell.alignment = right_align if isinstance(val, (int, float)) else center_align
-                        if fill and col in [2, 9, 16, 23]: # Only highlight the Name column
-                            cell.fill = fill
-                        if num_fmt and isinstance(val, (int, float)):
-                            cell.number_format = num_fmt
-
-            # 調整欄位寬度
-            for c in ['A', 'H', 'O', 'V']:
-                ws.column_dimensions[c].width = 10
-            for c in ['B', 'I', 'P', 'W']:
-                ws.column_dimensions[c].width = 12
-            for c in ['C', 'J', 'Q', 'X']:
-                ws.column_dimensions[c].width = 10
-            for c in ['D', 'K', 'R', 'Y']:
-                ws.column_dimensions[c].width = 11
-            for c in ['E', 'L', 'S', 'Z']:
-                ws.column_dimensions[c].width = 16
-            for c in ['F', 'M', 'T', 'AA']:
-                ws.column_dimensions[c].width = 13
-            for c in ['G', 'N', 'U']:
-                ws.column_dimensions[c].width = 3
-
-        filename = f"market_analysis_{target_date_str}.xlsx"
-        wb.save(filename)
+        with metrics.stage('write.rolling'):
+            updated = rolling.update(target_date_str, all_data)
+        if updated:
+            print(f"已更新滾動統計: {rolling.STATE_FILE}")
+    except Exception as e:
+        print(f"更新滾動統計時發生錯誤: {e}")
+
+    # 自訂警示規則: 只以當天資料與各規則的連續天數狀態增量計算
+    try:
+        with metrics.stage('write.alerts'):
+            alert_result = alerts.update(target_date_str, all_data)
+        for rule_id, found in alert_result.get('rules', {}).items():
+            if found:
+                codes = [m['code'] for m in alerts.expand(alert_result, rule_id)[:10]]
+                print(f"[ALERTS] {rule_id}: {len(found)} 檔 ({', '.join(codes)}{' ...' if len(found) > 10 else ''})")
+    except Exception as e:
+        print(f"計算警示規則時發生錯誤: {e}")
+
+    # 輸出成四欄位、分上市櫃的 Excel 報表
+    filename = f"market_analysis_{target_date_str}.xlsx"
+    try:
+        excel_writer.write_report(filename, f"{year}/{month}/{day}", rankings['blocks'])
         print(f"\n已成功輸出多欄位變色 Excel 報表: {filename}")
     except Exception as e:
+        filename = None
         print(f"\n輸出報表時發生錯誤: {e}")
 
+    # 發佈到報表清單，網頁端據此列出日期與各市場狀態
+    with metrics.stage('publish'):
+        entry = manifest.publish(target_date_str, {m: len(rows) for m, rows in market_data.items()},
+                                 xlsx_path=filename, sidecar_path=sidecar)
+    print(f"報表清單已更新: {target_date_str} ({entry['status']})")
+
+    # 預先產生網頁端的各種回應並寫入跨行程共用的 report_store，所有 worker 第一次開啟就不必再解析
+    try:
+        with metrics.stage('write.report_store'):
+            report_store.store_report(target_date_str, entry)
+        print(f"已寫入報表快取: {report_store.DB_FILE}")
+    except Exception as e:
+        print(f"寫入報表快取時發生錯誤: {e}")
+    progress.emit('published', date=target_date_str, status=entry['status'])
+    if entry['status'] == 'partial':
+        failed = [m for m, info in entry['markets'].items() if info['status'] != 'ok']
+        print(f"[WARN] {', '.join(failed)} 沒有資料，重新執行同一日期時只會重抓這些市場")
+
+    return True
+
 if __name__ == '__main__':
     import sys
-    input_date = sys.argv[1] if len(sys.argv) > 1 else None
+
+    # 批次回補模式: python analyze.py backfill 20250101 20251231 [--workers 4] [--rate 0.5]
+    if len(sys.argv) > 1 and sys.argv[1] == 'backfill':
+        import backfill
+        sys.exit(backfill.main(sys.argv[2:]))
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    # --refetch: 忽略已保存的各市場資料，全部重新抓取
+    refetch = '--refetch' in sys.argv
+    input_date = args[0] if args else None
+
+    # --offline: 只使用 raw_cache 中的原始回應重跑，不連線交易所
+    if '--offline' in sys.argv:
+        raw_cache.OFFLINE = True
+        print("Offline replay mode: serving exchange responses from raw_cache only.")
     
     # 無論是有輸入日期還是自動觸發，如果發現當天沒開盤，都應該回溯尋找
     success = False
+    published = False
     
     # 決定起始日期
     if input_date:
@@ -517,7 +581,7 @@ if __name__ == '__main__':
         if validate_trading_day(current_date_str):
             print(f"[OK] 成功命中有效交易日: {current_date_str}！ 準備開始執行重型分析任務...")
             try:
-                analyze(current_date_str)
+                published = analyze(current_date_str, refetch=refetch)
                 success = True
                 break
             except Exception as e:
@@ -529,6 +593,15 @@ if __name__ == '__main__':
             print(f"[WARN] 日期 {current_date_str} 休市中，自動跳過...")
             continue
     
+    http_client.print_stats()
+
+    # 各階段耗時摘要 (會出現在網頁觸發的工作日誌中)，並留給 /metrics 讀取
+    print(metrics.run_summary())
+    try:
+        metrics.write_run_timings(current_date_str, published)
+    except OSError as e:
+        print(f"無法寫入計時檔: {e}")
+
     if not success:
         print("[CRITICAL] 任務失敗：在最近的 10 天內找不到任何開盤紀錄，請檢查證交所連線或網站狀態。")
         sys.exit(1)
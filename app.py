@@ -1,9 +1,41 @@
+import json
 import os
-from flask import Flask, render_template, request, jsonify, send_file, Response
-import pandas as pd
+import threading
+import time
+from collections import OrderedDict
+from flask import Flask, render_template, request, jsonify, send_file, Response, g
+import report_data
+import report_store
+import http_encoding
+import trading_calendar
+import rolling
+import alerts
+import manifest
+import stock_history
+import export
+import metrics
+from jobs import JobRunner
 
 app = Flask(__name__)
 
+# 報表快取：序列化好的 JSON、壓縮結果與排序索引放在跨行程共用的 report_store (SQLite)，
+# 行程內只以日期為 key 記住來源簽章與 ETag 用的內容雜湊，檔案 mtime/size 變動即失效
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', '16'))
+_report_cache = OrderedDict()
+_report_cache_lock = threading.Lock()
+_report_cache_stats = {'hits': 0, 'misses': 0, 'builds': 0}
+
+# 背景分析工作 (同日期去重、限制同時執行數)
+job_runner = JobRunner()
+# 進度串流 (SSE) 沒有新事件時送出 keepalive 的間隔秒數
+SSE_KEEPALIVE = int(os.environ.get('SSE_KEEPALIVE', '15'))
+# 滾動統計在第一次查詢 /rolling/top 時才載入，縮短冷啟動時間
+rolling_store = rolling.RollingStore(load=False)
+# 警示規則的比對結果 (由 analyze 寫入)，第一次查詢 /alerts 時才載入
+alert_store = alerts.AlertStore(load=False)
+# 報表清單：analyze 發佈報表時更新，網頁端在檔案變動時才重新載入
+report_manifest = manifest.Manifest()
+
 # Basic Authentication Configuration
 # 設定環境變數啟動「VIP 專屬包廂」保護機制
 USE_AUTH = os.environ.get('USE_AUTH', 'false').lower() == 'true'
@@ -19,10 +51,26 @@ def authenticate():
     'Login Required to access Institutional Tracker.', 401,
     {'WWW-Authenticate': 'Basic realm="VIP Login Required"'})
 
+# 各路由的請求延遲 (Prometheus histogram)，以路由樣式而非實際路徑分類，避免 label 無限增長
+REQUEST_SECONDS = metrics.Histogram('http_request_duration_seconds', 'Flask request latency by route',
+                                    ['route', 'method', 'status'])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
+
 @app.before_request
 def require_login():
-    # Allow health check to pass without auth to help keep-alive services
-    if request.path == '/health':
+    # Allow health check (and metrics scraping) to pass without auth to help keep-alive services
+    if request.path in ('/health', '/metrics'):
         return
     # Only enforce if USE_AUTH is true
     if USE_AUTH:
@@ -35,6 +83,26 @@ def health():
     print(">>> Health check ping received! Keeping server awake. <<<")
     return "OK", 200
 
+@app.route('/metrics')
+def prometheus_metrics():
+    with _report_cache_lock:
+        hits = _report_cache_stats['hits']
+        misses = _report_cache_stats['misses']
+        cache_size = len(_report_cache)
+        builds = _report_cache_stats['builds']
+    lines = metrics.gauge_lines('report_cache_hits_total', 'Report cache hits', [((), hits)])
+    lines += metrics.gauge_lines('report_cache_misses_total', 'Report cache misses', [((), misses)])
+    lines += metrics.gauge_lines('report_cache_hit_ratio', 'Report cache hit ratio',
+                                 [((), hits / (hits + misses) if hits + misses else 0.0)])
+    lines += metrics.gauge_lines('report_cache_entries', 'Reports held in the cache', [((), cache_size)])
+    lines += metrics.gauge_lines('report_store_builds_total', 'Reports this worker had to build into the shared store',
+                                 [((), builds)])
+    lines += metrics.gauge_lines('analysis_jobs', 'Analysis jobs by state',
+                                 [(('queued',), job_runner.queue_depth()), (('running',), job_runner.running_count())],
+                                 ['state'])
+    lines += metrics.last_run_lines()
+    return Response(metrics.render(lines), mimetype='text/plain; version=0.0.4')
+
 # Ensure the template directory exists
 os.makedirs('templates', exist_ok=True)
 os.makedirs('static', exist_ok=True)
@@ -45,108 +113,400 @@ def index():
 
 @app.route('/get_available_dates')
 def get_available_dates():
-    # Scan current directory for files matching market_analysis_YYYYMMDD.xlsx
-    dates = []
-    for filename in os.listdir('.'):
-        if filename.startswith('market_analysis_') and filename.endswith('.xlsx'):
-            date_str = filename.replace('market_analysis_', '').replace('.xlsx', '')
-            if len(date_str) == 8:
-                dates.append(date_str)
-    dates.sort(reverse=True)
-    return jsonify({'dates': dates})
+    # 已發佈的日期 (新到舊)、各日期狀態 complete / partial / in_progress 與有 Excel 可下載的日期，來自報表清單
+    body = app.json.dumps({'dates': report_manifest.dates(), 'status': report_manifest.statuses(),
+                           'downloads': report_manifest.downloads()},
+                          separators=(',', ':')).encode('utf-8')
+    return _conditional_json(http_encoding.content_etag(body, 'dates'), lambda: body)
+
+def _conditional_json(etag, get_body, encoding='identity'):
+    """帶強 ETag 的 JSON 回應；If-None-Match 相符時直接回 304，不產生 body。"""
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(get_body(), mimetype='application/json')
+        if encoding != 'identity':
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    resp.vary.add('Accept-Encoding')
+    # 瀏覽器可快取，但每次使用前都要帶 ETag 回來驗證
+    resp.cache_control.no_cache = True
+    return resp
+
+def _report_source(date_str):
+    """
+    由報表清單回傳 (檔名, 快取簽章)，不必逐一檢查檔案。
+    優先使用 analyze 產出的 JSON sidecar，舊日期沒有 sidecar 時才退回 Excel。
+    """
+    return report_store.source(report_manifest.get(date_str))
+
+def get_cached_entry(date_str, filename, signature):
+    """
+    回傳 {'digests': {格式: 內容雜湊}} (ETag 用)。
+    報表內容本身由 report_store 讀取: 通常 analyze 發佈時已寫入；沒有 (舊報表、store 被清除) 時
+    由這個 worker 產生並寫入，其他 worker 之後直接共用。
+    """
+    with _report_cache_lock:
+        entry = _report_cache.get(date_str)
+        if entry and entry[0] == signature:
+            _report_cache.move_to_end(date_str)
+            _report_cache_stats['hits'] += 1
+            return entry[1]
+        _report_cache_stats['misses'] += 1
+
+    # 在鎖外讀取/建構報表，避免阻塞其他執行緒的快取命中
+    digests = report_store.digests(date_str, signature)
+    if digests is None:
+        digests = report_store.save(date_str, signature, report_store.build_variants(filename))
+        with _report_cache_lock:
+            _report_cache_stats['builds'] += 1
+    cached = {'digests': digests}
+
+    with _report_cache_lock:
+        _report_cache[date_str] = (signature, cached)
+        _report_cache.move_to_end(date_str)
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+    return cached
+
+def _stored_variant(date_str, filename, signature, variant):
+    """由 report_store 讀取一個回應；剛好被其他行程清掉或取代時重建一次。"""
+    body = report_store.get(date_str, signature, variant)
+    if body is None:
+        with _report_cache_lock:
+            _report_cache.pop(date_str, None)
+        report_store.save(date_str, signature, report_store.build_variants(filename))
+        body = report_store.get(date_str, signature, variant)
+    return body
+
+@app.route('/expected_date')
+def expected_date():
+    # 預設抓取日期：依本地交易日曆跳過週末與已知休市日
+    return jsonify({'date': trading_calendar.expected_trading_day()})
 
 @app.route('/get_report/<date_str>')
 def get_report(date_str):
-    filename = f'market_analysis_{date_str}.xlsx'
-    if not os.path.exists(filename):
+    # 只有逐列格式；舊的 ?format=columnar 等未知格式回傳 400，不默默改回逐列
+    if request.args.get('format', report_store.FORMATS[0]) not in report_store.FORMATS:
+        return jsonify({'error': f"Unknown format: {request.args['format']} (rows)"}), 400
+    filename, signature = _report_source(date_str)
+    if signature is None:
         return jsonify({'error': 'Report not found'}), 404
     
     try:
-        # Read all sheets
-        xls = pd.ExcelFile(filename)
-        result = {}
-        for sheet_name in xls.sheet_names:
-            print(f"Reading sheet: {sheet_name}")
-            # First, read without header to get the raw data layout
-            df = pd.read_excel(xls, sheet_name=sheet_name, header=None)
-            
-            # The structure is known: 
-            # Row 0: Date
-            # Row 1: Main headers (外資買超, etc)
-            # Row 2: Sub headers
-            # Row 3 onwards: Data
-            
-            # Extract header info
-            main_headers = df.iloc[1].fillna('').tolist()
-            sub_headers = df.iloc[2].fillna('').tolist()
-            
-            # Extract data
-            data_rows = []
-            for i in range(3, len(df)):
-                row_data = df.iloc[i].fillna('').tolist()
-                # Check if row is completely empty
-                if not all(str(item).strip() == '' for item in row_data):
-                    data_rows.append(row_data)
-            
-            result[sheet_name] = {
-                'main_headers': main_headers,
-                'sub_headers': sub_headers,
-                'data': data_rows
-            }
-            
-        return jsonify(result)
+        entry = get_cached_entry(date_str, filename, signature)
+        # 依 Accept-Encoding 回傳預先壓縮好的 br/gzip
+        encoding = http_encoding.choose_encoding(request.accept_encodings)
+
+        def encoded_body():
+            variant = report_store.encoded_variant(report_store.FORMATS[0], encoding)
+            body = report_store.get(date_str, signature, variant)
+            if body is None:
+                # 發佈時沒有預先壓縮的編碼: 壓縮一次並補存，之後所有 worker 共用
+                body = http_encoding.compress(_stored_variant(date_str, filename, signature, report_store.FORMATS[0]), encoding)
+                report_store.put(date_str, signature, variant, body)
+            return body
+
+        etag = f"{entry['digests'][report_store.FORMATS[0]]}-{report_store.FORMATS[0]}-{encoding}"
+        return _conditional_json(etag, encoded_body, encoding)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/report/<date_str>')
+def api_report(date_str):
+    """
+    篩選、排序、分頁後的報表區塊，由預先排序好的索引直接切片:
+    /api/report/20260223?market=TWSE&side=foreign_buy,it_buy&sort=val&limit=35&offset=0
+    side 省略時回傳四個區塊；limit=0 表示全部。
+    """
+    market = request.args.get('market', 'TWSE').upper()
+    sort_key = request.args.get('sort', 'val')
+    sides = [s for s in request.args.get('side', '').split(',') if s] or report_data.SIDES
+    try:
+        limit = int(request.args.get('limit', 35))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+
+    if market not in dict(report_data.MARKETS):
+        return jsonify({'error': f'Unknown market: {market}'}), 400
+    if sort_key not in report_data.SORT_KEYS:
+        return jsonify({'error': f'Unknown sort key: {sort_key}'}), 400
+    unknown = [s for s in sides if s not in report_data.SIDES]
+    if unknown or limit < 0 or offset < 0:
+        return jsonify({'error': f'Invalid side/limit/offset: {unknown or [limit, offset]}'}), 400
+
+    filename, signature = _report_source(date_str)
+    if signature is None:
+        return jsonify({'error': 'Report not found'}), 404
+
+    try:
+        get_cached_entry(date_str, filename, signature)
+        # 只讀取需要的區塊與排序
+        index = {side: {sort_key: json.loads(_stored_variant(
+                     date_str, filename, signature, report_store.index_variant(market, side, sort_key)))}
+                 for side in sides}
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+    body = app.json.dumps(_block_payload(date_str, market, index, sort_key, sides, offset, limit),
+                          separators=(',', ':')).encode('utf-8')
+    return _conditional_json(http_encoding.content_etag(body, 'api'), lambda: body)
+
+def _block_payload(date_str, market, index, sort_key, sides=report_data.SIDES, offset=0, limit=35):
+    """/api/report 與分析進度串流共用的區塊格式。"""
+    end = offset + limit if limit else None
+    return {
+        'date': date_str,
+        'market': market,
+        'sort': sort_key,
+        'offset': offset,
+        'limit': limit,
+        'sub_headers': report_data.SUB_HEADERS[:6],
+        'sides': {side: {'total': len(index[side][sort_key]), 'rows': index[side][sort_key][offset:end]} for side in sides}
+    }
+
+@app.route('/cache_stats')
+def cache_stats():
+    with _report_cache_lock:
+        hits = _report_cache_stats['hits']
+        misses = _report_cache_stats['misses']
+        return jsonify({
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'size': len(_report_cache),
+            'capacity': REPORT_CACHE_SIZE,
+            'builds': _report_cache_stats['builds'],
+            'dates': list(_report_cache.keys())
+        })
+
+@app.route('/rolling/top')
+def rolling_top():
+    # N 日滾動法人統計排行，例如 /rolling/top?metric=foreign_sum_5&n=20&order=desc&market=TWSE
+    metric = request.args.get('metric', f'foreign_sum_{rolling.WINDOWS[0]}')
+    order = request.args.get('order', 'desc')
+    market = request.args.get('market') or None
+    try:
+        n = max(1, min(int(request.args.get('n', 20)), 500))
+    except ValueError:
+        return jsonify({'error': 'n must be an integer'}), 400
+    if metric not in rolling.metric_names():
+        return jsonify({'error': f'Unknown metric: {metric}', 'metrics': rolling.metric_names()}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': f'Unknown order: {order} (asc or desc)'}), 400
+    if market and market not in dict(report_data.MARKETS):
+        return jsonify({'error': f'Unknown market: {market}'}), 400
+
+    rolling_store.reload_if_changed()
+    return jsonify({
+        'as_of': rolling_store.as_of,
+        'days': len(rolling_store.dates),
+        'metric': metric,
+        'order': order,
+        'data': rolling_store.top(metric, n, ascending=(order == 'asc'), market=market)
+    })
+
+@app.route('/stock/<code>')
+def stock(code):
+    # 個股最近 N 個交易日的價格與外資、投信買賣超，例如 /stock/2330?days=60
+    try:
+        days = max(1, min(int(request.args.get('days', 60)), 1000))
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+
+    rows = stock_history.series(code, days)
+    if not rows:
+        return jsonify({'error': 'Stock not found'}), 404
+    latest = rows[-1]
+    return jsonify({
+        'code': code,
+        'name': latest['name'],
+        'market': latest['market'],
+        'days': len(rows),
+        'series': [{k: r[k] for k in stock_history.COLUMNS if k not in ('market', 'name')} for r in rows]
+    })
+
+@app.route('/alerts')
+def alert_matches():
+    # 警示規則的比對結果，例如 /alerts?date=20260223&rule=big_buy_3d；date 省略時為最新一天
+    alert_store.reload_if_changed()
+    dates = alert_store.dates
+    date_str = request.args.get('date') or (dates[0] if dates else None)
+    day_result = alert_store.matches.get(date_str)
+    if day_result is None:
+        return jsonify({'error': 'No alert results for this date', 'dates': dates}), 404
+
+    rule_ids = [request.args['rule']] if request.args.get('rule') else list(day_result['rules'])
+    unknown = [r for r in rule_ids if r not in day_result['rules']]
+    if unknown:
+        return jsonify({'error': f'Unknown rule: {unknown[0]}', 'rules': list(day_result['rules'])}), 404
+    return jsonify({
+        'date': date_str,
+        'dates': dates,
+        'rules': {rule_id: {'name': alert_store.names.get(rule_id, rule_id),
+                            'matches': alerts.expand(day_result, rule_id)} for rule_id in rule_ids}
+    })
+
+@app.route('/alerts/rules')
+def alert_rules():
+    config, _ = alerts.load_rules()
+    return jsonify({'rules': config['rules'], 'watchlists': config['watchlists'],
+                    'fields': list(alerts.NUMERIC_FIELDS + alerts.TEXT_FIELDS), 'derived': list(alerts.DERIVED)})
+
+@app.route('/alerts/rules/<rule_id>', methods=['PUT', 'DELETE'])
+def alert_rule(rule_id):
+    # PUT 新增或取代規則 (JSON: when, days, name, market, watchlist)；新規則由下一次分析開始計算
+    if request.method == 'DELETE':
+        if not alerts.delete_rule(rule_id):
+            return jsonify({'error': 'Rule not found'}), 404
+        return jsonify({'deleted': rule_id})
+    rule = dict(request.get_json(silent=True) or {}, id=rule_id)
+    try:
+        compiled = alerts.save_rule(rule)
+    except alerts.RuleError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(compiled.to_json())
+
+@app.route('/alerts/watchlists/<name>', methods=['PUT'])
+def alert_watchlist(name):
+    # 觀察名單，JSON: {"codes": ["2330", ...]}
+    codes = (request.get_json(silent=True) or {}).get('codes')
+    if not isinstance(codes, list):
+        return jsonify({'error': 'codes must be a list'}), 400
+    try:
+        codes = alerts.save_watchlist(name, codes)
+    except alerts.RuleError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'name': name, 'codes': codes})
+
 @app.route('/download/<date_str>')
 def download(date_str):
-    filename = f'market_analysis_{date_str}.xlsx'
-    if os.path.exists(filename):
-        return send_file(filename, as_attachment=True)
+    info = (report_manifest.get(date_str) or {}).get('xlsx')
+    if info:
+        return send_file(os.path.abspath(info['path']), as_attachment=True)
     return 'File not found', 404
 
+@app.route('/export')
+def export_range():
+    # 一段日期的個股資料，例如 /export?start=20260101&end=20260331&market=TWSE&codes=2330,2317&format=parquet
+    # 邊讀邊送 (chunked)，不在記憶體中組出整份檔案
+    fmt = request.args.get('format', 'csv')
+    start = request.args.get('start', '')
+    end = request.args.get('end', start)
+    market = request.args.get('market')
+    try:
+        chunks = export.stream(fmt, start, end, market, request.args.get('codes'))
+    except export.ExportError as e:
+        return jsonify({'error': str(e), 'formats': export.supported_formats()}), 400
+    if chunks is None:
+        return jsonify({'error': 'No data for this range'}), 404
+    resp = Response(chunks, mimetype=export.MIMETYPES[fmt])
+    resp.headers['Content-Disposition'] = f'attachment; filename="{export.filename(fmt, start, end, market)}"'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
 @app.route('/trigger_analysis', methods=['POST'])
 def trigger_analysis():
-    # Execute analyze.py to generate new data
+    # Queue analyze.py in the background and return a job id immediately
     try:
-        import subprocess
-        
-        target_date = None
+        target_date_str = None
         if request.is_json:
             data = request.json or {}
             target_date = data.get('date') # e.g. YYYY-MM-DD
-            
-        cmd = ["python", "analyze.py"]
-        if target_date:
-            target_date_str = target_date.replace("-", "")
-            cmd.append(target_date_str)
-            print(f"Manual trigger activated for date {target_date_str}...")
+            if target_date:
+                target_date_str = target_date.replace("-", "") if isinstance(target_date, str) else ''
+                if len(target_date_str) != 8 or not target_date_str.isdigit():
+                    return jsonify({"status": "error", "message": f"日期格式錯誤: {target_date}"}), 400
+
+        job, created = job_runner.submit(target_date_str)
+        if created:
+            print(f"Manual trigger activated for {target_date_str or 'today'} (job {job.id})...")
         else:
-            print("Manual trigger activated for today...")
-            
-        process = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace')
-        
-        debug_output = process.stdout + "\n" + process.stderr
-        
-        if process.returncode != 0:
-            return jsonify({
-                "status": "error", 
-                "message": "分析失敗: 執行過程發生錯誤或沒有資料。",
-                "debug_log": debug_output
-            }), 500
-            
+            print(f"Trigger for {target_date_str or 'today'} joined running job {job.id}")
+
         return jsonify({
-            "status": "success", 
-            "message": "分析完成，新的報表已產出！",
-            "debug_log": debug_output
-        })
+            "status": job.status,
+            "job_id": job.id,
+            "deduplicated": not created,
+            "message": "分析工作已排入佇列。" if created else "相同日期的分析正在進行中，已合併至既有工作。"
+        }), 202
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"status": "error", "message": f"系統錯誤: {str(e)}", "debug_log": traceback.format_exc()}), 500
 
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    result = job.to_dict()
+    if job.status == 'success':
+        result['message'] = "分析完成，新的報表已產出！"
+    elif job.status == 'error':
+        result['message'] = "分析失敗: 執行過程發生錯誤或沒有資料。"
+    return jsonify(result)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """
+    分析進度的 Server-Sent Events 串流:
+      status     工作開始執行
+      plan       analyze 將依序執行的階段名稱 (stages)，用來計算進度百分比
+      stage      analyze 各階段開始 / 結束 (stage, state, seconds)
+      market     某個市場已取得資料；status 為 ok 時附上與 /api/report 相同格式的排序區塊 (sort / limit 參數同 /api/report)
+      published  報表已發佈 (status 為 complete / partial)
+      done       工作結束 (status, returncode)，之後關閉串流
+    每個事件帶有 id，瀏覽器重新連線時以 Last-Event-ID 從下一個事件接續。
+    """
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    sort_key = request.args.get('sort', 'val')
+    if sort_key not in report_data.SORT_KEYS:
+        return jsonify({'error': f'Unknown sort key: {sort_key}'}), 400
+    try:
+        limit = int(request.args.get('limit', 35))
+        next_id = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        return jsonify({'error': 'limit and Last-Event-ID must be integers'}), 400
+
+    def market_payload(event):
+        if event.get('status') != 'ok':
+            return event
+        rows = report_data.load_market_part(event['date'], event['market'])
+        if not rows:
+            return event
+        index = report_data.market_index(rows, event['market'])
+        return dict(event, **_block_payload(event['date'], event['market'], index, sort_key, limit=limit))
+
+    def stream():
+        nonlocal next_id
+        while True:
+            events = job.wait_events(next_id, SSE_KEEPALIVE)
+            if not events:
+                # 註解行: 讓代理伺服器與瀏覽器知道連線仍在
+                yield ': keepalive\n\n'
+                continue
+            for event in events:
+                if event['event'] == 'market':
+                    event = market_payload(event)
+                yield f"id: {next_id}\nevent: {event['event']}\ndata: {app.json.dumps(event, separators=(',', ':'))}\n\n"
+                next_id += 1
+                if event['event'] == 'done':
+                    return
+
+    resp = Response(stream(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    # nginx 等反向代理預設會緩衝回應，SSE 需關閉
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
 if __name__ == '__main__':
     print("啟動網頁伺服器: http://localhost:5000")
     app.run(debug=True, port=5000)
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import alerts
+import analyze
+import http_client
+import manifest
+import raw_cache
+import rolling
+import storage
+import trading_calendar
+
+# 歷史資料批次回補：
+#   python analyze.py backfill 20250101 20251231 [--workers 4] [--rate 0.5] [--offline]
+# 先以單一事件迴圈預先抓取所有日期的原始回應到 raw_cache (同時請求數與每主機上限見 http_client.AsyncFetcher，
+# 並共用每主機的速率上限，避免被交易所封鎖)，再以多個執行緒由快取產出各日期的報表。
+# 完成 (或確認休市) 的日期記錄在 checkpoint 檔，中斷後重跑會自動跳過。
+
+CHECKPOINT_FILE = 'backfill_checkpoint.json'
+DEFAULT_WORKERS = 4
+# 證交所大約每 5 秒 3 個請求以上就可能暫時封鎖 IP
+DEFAULT_RATE = 0.5
+# 預先抓取時同時進行的日期數：櫃買的速率較寬鬆會先跑很遠，不設上限時所有日期的工作會一次全部建立
+PREFETCH_DATES = int(os.environ.get('BACKFILL_PREFETCH_DATES', '8'))
+
+class Checkpoint:
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'done': [], 'closed': [], 'failed': []}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.state.update(json.load(f))
+
+    def finished(self, date_str):
+        # 休市只有在交易日曆確認時才算完成；舊版 checkpoint 可能把抓取失敗記成 closed
+        if date_str in self.state['done']:
+            return True
+        return date_str in self.state['closed'] and trading_calendar.lookup(date_str) is False
+
+    def mark(self, date_str, status):
+        with self.lock:
+            for key in ('done', 'closed', 'failed'):
+                if date_str in self.state[key]:
+                    self.state[key].remove(date_str)
+            self.state[status].append(date_str)
+            self.state[status].sort()
+            storage.write_json(self.path, self.state, indent=2)
+
+def date_range(start_str, end_str):
+    start = datetime.strptime(start_str, '%Y%m%d')
+    end = datetime.strptime(end_str, '%Y%m%d')
+    dates = []
+    while start <= end:
+        # 週末一定休市，不必發任何請求
+        if start.weekday() < 5:
+            dates.append(start.strftime('%Y%m%d'))
+        start += timedelta(days=1)
+    return dates
+
+def report_exists(date_str, reports=None):
+    # 只有兩個市場都齊全的報表才算完成，partial 的日期會再跑一次
+    reports = reports if reports is not None else manifest.Manifest()
+    return reports.is_complete(date_str)
+
+async def _prefetch_date(fetcher, date_str):
+    """預檢並抓取一個日期的所有原始回應到 raw_cache。回傳 'open' / 'closed' / 'unknown' (預檢失敗)。"""
+    is_open = trading_calendar.lookup(date_str)
+    if is_open is None:
+        data = await analyze.fetch_json(fetcher, analyze.precheck_url(date_str), ('twse_mi_ms', date_str))
+        if data is None:
+            return 'unknown'
+        is_open = data.get('stat') == 'OK'
+        trading_calendar.record(date_str, is_open)
+    if not is_open:
+        return 'closed'
+    requests = analyze.twse_requests(date_str) + analyze.tpex_requests(analyze.roc_date(date_str))
+    # 已有快取的端點不再讀取
+    await asyncio.gather(*(_store(fetcher, url, (endpoint, date_str))
+                           for endpoint, url in requests if not raw_cache.has(endpoint, date_str)))
+    return 'open'
+
+async def _store(fetcher, url, cache_key):
+    # 只需要寫入 raw_cache：不回傳內容，gather 就不會把已解碼的回應留到同一日期的其他端點都完成
+    await analyze.fetch_json(fetcher, url, cache_key)
+    return None
+
+async def _prefetch(dates):
+    counts = {'open': 0, 'closed': 0, 'unknown': 0}
+    slots = asyncio.Semaphore(PREFETCH_DATES)
+    async with http_client.AsyncFetcher() as fetcher:
+        async def run(date_str):
+            async with slots:
+                return date_str, await _prefetch_date(fetcher, date_str)
+        for done in asyncio.as_completed([run(d) for d in dates]):
+            date_str, status = await done
+            counts[status] += 1
+            print(f"[PREFETCH] {date_str}: {status} ({sum(counts.values())}/{len(dates)})")
+    return counts
+
+def prefetch(dates):
+    """
+    在一個事件迴圈中抓取所有日期的原始回應，寫入 raw_cache 供之後的 analyze 直接讀取。
+    同時進行的請求數由 http_client.MAX_IN_FLIGHT 與 PER_HOST_CONCURRENCY 決定，不隨日期數增加執行緒；
+    同時處理的日期最多 PREFETCH_DATES 個，各端點的回應寫入快取後即釋放。
+    raw_cache 只保存過去的日期，今天的資料留給 analyze 自行抓取；離線模式下不需要預先抓取。
+    """
+    dates = [d for d in dates if raw_cache.is_immutable(d)]
+    if raw_cache.OFFLINE or not dates:
+        return None
+    started = time.perf_counter()
+    counts = asyncio.run(_prefetch(dates))
+    print(f"Prefetched {len(dates)} dates in {time.perf_counter() - started:.1f}s: "
+          f"{counts['open']} trading days, {counts['closed']} closed, {counts['unknown']} precheck failed")
+    return counts
+
+def _not_done(date_str):
+    # 預檢沒有結果 (連線錯誤、被限流、離線時快取沒有) 或抓不到資料都不代表休市，
+    # 只有交易日曆確認休市的日期記為 closed，其餘記為 failed，之後重跑會再處理
+    return 'closed' if trading_calendar.lookup(date_str) is False else 'failed'
+
+def process_date(date_str):
+    """回傳 'done' / 'closed' / 'failed'。"""
+    if not analyze.validate_trading_day(date_str):
+        return _not_done(date_str)
+    try:
+        return 'done' if analyze.analyze(date_str) else _not_done(date_str)
+    except Exception as e:
+        print(f"[ERROR] {date_str} 分析失敗: {e}")
+        traceback.print_exc()
+        return 'failed'
+
+def run_backfill(start_str, end_str, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, checkpoint_path=CHECKPOINT_FILE):
+    checkpoint = Checkpoint(checkpoint_path)
+    reports = manifest.Manifest()
+    pending = []
+    skipped = 0
+    for date_str in date_range(start_str, end_str):
+        if checkpoint.finished(date_str) or report_exists(date_str, reports):
+            skipped += 1
+            continue
+        pending.append(date_str)
+
+    print(f"Backfill {start_str} ~ {end_str}: {len(pending)} dates to process, {skipped} already finished.")
+    if not pending:
+        return {'done': 0, 'closed': 0, 'failed': 0, 'skipped': skipped, 'elapsed': 0.0}
+
+    http_client.set_rate_limit(rate)
+    started = time.perf_counter()
+    prefetch(pending)
+    # 原始回應已在快取中，各日期的解析與報表產出不再等待網路
+    counts = {'done': 0, 'closed': 0, 'failed': 0}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_date, d): d for d in pending}
+        for future in concurrent.futures.as_completed(futures):
+            date_str = futures[future]
+            status = future.result()
+            checkpoint.mark(date_str, status)
+            counts[status] += 1
+            finished = sum(counts.values())
+            print(f"[BACKFILL] {date_str}: {status} ({finished}/{len(pending)})")
+
+    elapsed = time.perf_counter() - started
+    per_min = sum(counts.values()) / elapsed * 60 if elapsed > 0 else 0.0
+    print("=" * 60)
+    print(f"Backfill finished in {elapsed:.1f}s: {counts['done']} reports, {counts['closed']} closed, "
+          f"{counts['failed']} failed, {skipped} skipped")
+    print(f"Throughput: {per_min:.1f} dates/min")
+    http_client.print_stats()
+
+    # 回補的日期是平行、不依順序完成的，滾動統計與警示的連續天數需依日期順序重建
+    if counts['done']:
+        days = rolling.RollingStore().rebuild()
+        print(f"Rolling aggregates rebuilt ({days} trading days in window)")
+        days = alerts.rebuild()
+        print(f"Alert streaks rebuilt ({days} trading days replayed)")
+    return dict(counts, skipped=skipped, elapsed=elapsed)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='analyze.py backfill', description='批次回補歷史報表')
+    parser.add_argument('start', help='起始日期 YYYYMMDD')
+    parser.add_argument('end', help='結束日期 YYYYMMDD')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='預先抓取後同時產出報表的日期數')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='每個主機每秒最多請求數')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help='checkpoint 檔路徑')
+    parser.add_argument('--offline', action='store_true', help='只使用 raw_cache 重跑，不連網')
+    args = parser.parse_args(argv)
+
+    if args.offline:
+        raw_cache.OFFLINE = True
+    result = run_backfill(args.start, args.end, args.workers, args.rate, args.checkpoint)
+    return 1 if result['failed'] else 0
@@ -0,0 +1,128 @@
+"""
+警示規則引擎基準測試：以 fixture 當天的資料為底合成連續多個交易日，產生數百條常見型態的規則
+(金額門檻、土洋同買/同賣/對作、觀察名單、連續 N 日、單一市場)，量測
+  - 編譯全部規則的時間
+  - 每個新交易日增量計算全部規則的時間 (中位數 / 最大值) 與符合筆數
+超過預算即 exit 1。
+
+    python benchmarks/bench_alerts.py                        # 預設 300 條規則、20 個交易日、每日預算 20 ms
+    python benchmarks/bench_alerts.py --rules 1000 --budget-ms 50
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import alerts
+
+DEFAULT_DATE = '20260223'
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+BUDGET_MS = 20
+
+# 規則範本: (條件, 是否使用觀察名單)
+TEMPLATES = [
+    ('foreign_val > {big}億 and it_val > 0', False),
+    ('it_val > {mid}萬 and foreign_val > 0', False),
+    ('same_buy and total_val > {big}億', False),
+    ('same_sell and total_val < -{big}億', False),
+    ('opp_fb_is and foreign_val > {big}億 and it_val < -{mid}萬', False),
+    ('opp_fs_ib and it_val > {mid}萬', False),
+    ('foreign_shares > {shares} and price < vwap', False),
+    ('abs(it_val) > {big}億', False),
+    ('code in watchlist and opposite', True),
+    ('code in watchlist and (foreign_val > {mid}萬 or it_val > {mid}萬)', True),
+]
+
+def make_rules(n, codes, seed=0):
+    """回傳 (規則設定, 觀察名單)。"""
+    rng = random.Random(seed)
+    watchlists = {f'list{i}': rng.sample(codes, 20) for i in range(10)}
+    rules = []
+    for i in range(n):
+        when, uses_watchlist = TEMPLATES[i % len(TEMPLATES)]
+        rule = {
+            'id': f'rule{i}',
+            'when': when.format(big=rng.choice([1, 2, 3, 5]), mid=rng.choice([1000, 3000, 5000]),
+                                shares=rng.choice([1000000, 3000000])),
+            'days': rng.choice([1, 1, 2, 3, 5]),
+        }
+        if uses_watchlist:
+            rule['watchlist'] = rng.choice(list(watchlists))
+        if rng.random() < 0.3:
+            rule['market'] = rng.choice(['TWSE', 'TPEX'])
+        rules.append(rule)
+    return rules, watchlists
+
+def main():
+    parser = argparse.ArgumentParser(description='警示規則引擎基準測試')
+    parser.add_argument('date', nargs='?', default=DEFAULT_DATE, help='fixture 或 raw_cache 中的日期 YYYYMMDD')
+    parser.add_argument('--rules', type=int, default=300)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='每個交易日計算全部規則的預算 (中位數)')
+    parser.add_argument('--output', help='結果 JSON 路徑 (預設 benchmarks/results/alerts_<時間>.json)')
+    args = parser.parse_args()
+
+    import analyze
+    from bench_memory import prior_trading_days, synth_day
+    from bench_parse import load_payloads
+    payloads = load_payloads(args.date)
+    all_data = analyze.parse_twse(payloads['twse_t86'], payloads['twse_mi_index']) + \
+        analyze.parse_tpex(payloads['tpex_3itrade'], payloads['tpex_quotes'])
+    rng = random.Random(args.date)
+    days = [(d, synth_day(all_data, rng)) for d in prior_trading_days(args.date, args.days - 1)] + [(args.date, all_data)]
+
+    config, watchlists = make_rules(args.rules, [d['code'] for d in all_data])
+    start = time.perf_counter()
+    rules = [alerts.compile_rule(rule, watchlists) for rule in config]
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    state, times, matches = {}, [], []
+    for date_str, rows in days:
+        start = time.perf_counter()
+        state, result = alerts.evaluate_day(rules, rows, state, date_str)
+        times.append((time.perf_counter() - start) * 1000)
+        matches.append(sum(len(found) for found in result['rules'].values()))
+
+    summary = {
+        'compile_ms': compile_ms,
+        'day_median_ms': statistics.median(times),
+        'day_max_ms': max(times),
+        'matches_median': statistics.median(matches),
+    }
+    print(f"{len(rules)} 條規則、{len(days)} 個交易日、每日 {len(all_data)} 檔股票")
+    print(f"compile          {compile_ms:>8.2f} ms")
+    print(f"per day          {summary['day_median_ms']:>8.2f} ms (max {summary['day_max_ms']:.2f}, 預算 {args.budget_ms:.0f} ms)")
+    print(f"matches per day  {summary['matches_median']:>8.0f}")
+
+    result = {
+        'date': args.date,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'rules': len(rules),
+        'days': len(days),
+        'summary': summary,
+        'day_ms': times,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"alerts_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"\n結果已寫入 {output}")
+
+    if summary['day_median_ms'] > args.budget_ms:
+        print(f"\nOVER BUDGET: {summary['day_median_ms']:.1f} ms > {args.budget_ms:.0f} ms")
+        return 1
+    print("\n在預算內")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+比較 Excel 報表兩種寫法 (standard 逐格設定 / fast write-only 串流) 的耗時與峰值記憶體。
+使用 raw_cache 中錄下的原始回應，每種寫法在獨立子行程中執行，峰值 RSS 才不會互相影響：
+
+    python benchmarks/bench_excel.py 20260223 --repeat 3
+
+在 20260223 fixture 上兩者耗時相近 (差異在雜訊內)，穩定的差別是 fast 的峰值 RSS 低約 11–15 MB。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analyze
+import excel_writer
+import ranking
+from bench_parse import load_payloads
+
+def peak_rss_mb():
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def run_child(date_str, mode, repeat):
+    p = load_payloads(date_str)
+    all_data = analyze.parse_twse(p['twse_t86'], p['twse_mi_index']) + analyze.parse_tpex(p['tpex_3itrade'], p['tpex_quotes'])
+    blocks = ranking.rank(all_data)['blocks']
+    del p
+
+    rss_before = peak_rss_mb()
+    best = float('inf')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'report.xlsx')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            excel_writer.write_report(filename, f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}", blocks, mode=mode)
+            best = min(best, time.perf_counter() - start)
+        size = os.path.getsize(filename)
+    print(json.dumps({'mode': mode, 'seconds': best, 'rss_before_mb': rss_before,
+                      'peak_rss_mb': peak_rss_mb(), 'bytes': size, 'stocks': len(all_data)}))
+
+def main():
+    parser = argparse.ArgumentParser(description='Excel 寫出效能比較 (standard vs fast)')
+    parser.add_argument('date', help='已錄製於 raw_cache 的日期 YYYYMMDD')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', choices=['standard', 'fast'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.date, args.child, args.repeat)
+        return
+
+    results = {}
+    for mode in ('standard', 'fast'):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), args.date, '--repeat', str(args.repeat), '--child', mode],
+                             capture_output=True, text=True, check=True)
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    for mode, r in results.items():
+        print(f"{mode:<8}: {r['stocks']} stocks | {r['seconds'] * 1000:.0f} ms | "
+              f"peak RSS {r['peak_rss_mb']:.1f} MB (+{r['peak_rss_mb'] - r['rss_before_mb']:.1f} MB while writing) | "
+              f"{r['bytes'] / 1024:.0f} KB")
+    std, fast = results['standard'], results['fast']
+    print(f"fast vs standard: x{std['seconds'] / fast['seconds']:.2f} wall time, "
+          f"{std['peak_rss_mb'] - fast['peak_rss_mb']:.1f} MB lower peak RSS")
+
+if __name__ == '__main__':
+    main()
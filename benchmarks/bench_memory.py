@@ -0,0 +1,200 @@
+"""
+峰值記憶體基準測試：以全新的 Python 行程分別執行下列流程，讀取行程的峰值 RSS (/proc/self/status 的 VmHWM，
+其他平台以 ru_maxrss 代替)，超過上限即 exit 1。
+
+  analyze   LOW_MEMORY=true 下以 raw_cache 離線重跑一天的 analyze() (含 Excel、sidecar、已有 20 個交易日的滾動統計)
+  web       import app 後依序請求 /get_report (gzip)、/api/report 與只有 Excel 的舊報表
+
+    python benchmarks/bench_memory.py                       # 預設上限 100 MB (或環境變數 MEMORY_CEILING_MB)
+    python benchmarks/bench_memory.py --ceiling-mb 80
+    python benchmarks/bench_memory.py --no-low-memory       # 以一般模式執行 analyze，比較差異
+
+交易所回應來自 benchmarks/fixtures (或 raw_cache)，所有檔案都產生在暫存目錄，不影響工作目錄。
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_DATE = '20260223'
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+CEILING_MB = float(os.environ.get('MEMORY_CEILING_MB', '100'))
+# 滾動統計預先放入的交易日數 (最長視窗)
+HISTORY_DAYS = 20
+
+PEAK_HELPER = r'''
+import json, resource, sys
+def peak_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+'''
+
+# 結果以 JSON 印在最後一行 (analyze 本身的日誌在前面)
+ANALYZE_PROBE = PEAK_HELPER + r'''
+import analyze
+start_kb = peak_kb()
+published = analyze.analyze(sys.argv[1])
+print(json.dumps({'published': published, 'import_kb': start_kb, 'peak_kb': peak_kb()}))
+'''
+
+WEB_PROBE = PEAK_HELPER + r'''
+import app
+steps = [('import app', 200, peak_kb())]
+client = app.app.test_client()
+for url in json.loads(sys.argv[1]):
+    resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    resp.get_data()
+    steps.append((url, resp.status_code, peak_kb()))
+print(json.dumps({'steps': steps, 'peak_kb': peak_kb()}))
+'''
+
+def prior_trading_days(date_str, n):
+    """date_str 之前的 n 個平日 (由舊到新)，合成歷史資料用，不需要與實際休市日一致。"""
+    day = datetime.strptime(date_str, '%Y%m%d')
+    days = []
+    while len(days) < n:
+        day -= timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y%m%d'))
+    return days[::-1]
+
+def synth_day(all_data, rng):
+    """以 fixture 當天的資料為底，隨機縮放買賣超並略過少數股票，模擬其他交易日。"""
+    rows = []
+    for d in all_data:
+        if rng.random() < 0.05:
+            continue
+        scale = rng.uniform(-1.5, 1.5)
+        rows.append(dict(d, foreign_shares=int(d['foreign_shares'] * scale), it_shares=int(d['it_shares'] * scale),
+                         foreign_val=d['foreign_val'] * scale, it_val=d['it_val'] * scale))
+    return rows
+
+def prepare(work_dir, date_str):
+    """
+    暫存目錄中準備:
+      raw_cache      目標日期的交易所回應 (analyze 離線重跑用)
+      20 個交易日    合成的 sidecar 與由其重建的滾動統計
+      舊報表         前一個交易日只有 Excel (沒有 sidecar) 的已發佈報表，測試 openpyxl 讀取路徑
+    回傳舊報表的日期。
+    """
+    from bench_parse import load_payloads
+    payloads = load_payloads(date_str)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        import analyze
+        import excel_writer
+        import manifest
+        import ranking
+        import raw_cache
+        import report_data
+        import rolling
+
+        raw_cache.CACHE_DIR = os.path.join(work_dir, 'raw_cache')
+        for endpoint, payload in payloads.items():
+            raw_cache.store(endpoint, date_str, payload)
+
+        all_data = analyze.parse_twse(payloads['twse_t86'], payloads['twse_mi_index']) + \
+            analyze.parse_tpex(payloads['tpex_3itrade'], payloads['tpex_quotes'])
+        rng = random.Random(date_str)
+        history = prior_trading_days(date_str, HISTORY_DAYS)
+        for day in history:
+            report_data.write_sidecar(day, synth_day(all_data, rng))
+        rolling.RollingStore(path=os.path.join(work_dir, 'rolling_state.json'), load=False).rebuild()
+
+        # 舊報表: 把 sidecar 換成 Excel 並只以 Excel 發佈
+        legacy_date = history[-1]
+        legacy_data = report_data.load_sidecar(report_data.sidecar_path(legacy_date))
+        legacy_rows = [d for rows in legacy_data.values() for d in rows]
+        xlsx = f"market_analysis_{legacy_date}.xlsx"
+        excel_writer.write_report(xlsx, legacy_date, ranking.rank(legacy_rows)['blocks'])
+        os.remove(report_data.sidecar_path(legacy_date))
+        counts = {market_key: len(rows) for market_key, rows in legacy_data.items()}
+        manifest.publish(legacy_date, counts, xlsx_path=xlsx)
+        return legacy_date
+    finally:
+        os.chdir(cwd)
+
+def run_probe(work_dir, probe, args, env_extra):
+    env = dict(os.environ, PYTHONPATH=ROOT, RAW_CACHE_DIR=os.path.join(work_dir, 'raw_cache'),
+               RAW_CACHE_OFFLINE='true', **env_extra)
+    proc = subprocess.run([sys.executable, '-c', probe, *args], cwd=work_dir, env=env,
+                          capture_output=True, text=True, encoding='utf-8')
+    if proc.returncode != 0:
+        sys.exit(f"probe 失敗:\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='峰值記憶體基準測試')
+    parser.add_argument('date', nargs='?', default=DEFAULT_DATE, help='fixture 或 raw_cache 中的日期 YYYYMMDD')
+    parser.add_argument('--ceiling-mb', type=float, default=CEILING_MB, help='各流程峰值 RSS 的上限')
+    parser.add_argument('--no-low-memory', action='store_true', help='analyze 不設定 LOW_MEMORY=true')
+    parser.add_argument('--output', help='結果 JSON 路徑 (預設 benchmarks/results/memory_<時間>.json)')
+    args = parser.parse_args()
+
+    low_memory = 'false' if args.no_low_memory else 'true'
+    with tempfile.TemporaryDirectory() as work_dir:
+        legacy_date = prepare(work_dir, args.date)
+        analyze_result = run_probe(work_dir, ANALYZE_PROBE, [args.date], {'LOW_MEMORY': low_memory})
+        if not analyze_result['published']:
+            sys.exit(f"analyze 沒有發佈 {args.date} 的報表")
+        urls = [f'/get_report/{args.date}',
+                f'/api/report/{args.date}?market=TWSE', f'/api/report/{args.date}?market=TPEX',
+                f'/get_report/{legacy_date}']
+        web_result = run_probe(work_dir, WEB_PROBE, [json.dumps(urls)], {'LOW_MEMORY': 'true'})
+
+    failed = {url: status for url, status, _ in web_result['steps'] if status != 200}
+    if failed:
+        sys.exit(f"網頁請求失敗: {failed}")
+
+    peaks = {'analyze': analyze_result['peak_kb'] / 1024, 'web': web_result['peak_kb'] / 1024}
+    print(f"analyze (LOW_MEMORY={low_memory})")
+    print(f"  import analyze                           {analyze_result['import_kb'] / 1024:>8.1f} MB")
+    print(f"  peak                                     {peaks['analyze']:>8.1f} MB")
+    print("web")
+    for url, _, kb in web_result['steps']:
+        print(f"  {url:<40} {kb / 1024:>8.1f} MB")
+    print(f"\n上限 {args.ceiling_mb:.0f} MB")
+
+    result = {
+        'date': args.date,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'low_memory': low_memory == 'true',
+        'history_days': HISTORY_DAYS,
+        'ceiling_mb': args.ceiling_mb,
+        'peak_mb': peaks,
+        'analyze': analyze_result,
+        'web': web_result,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"memory_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"結果已寫入 {output}")
+
+    over = [f"{name} {mb:.1f} MB" for name, mb in peaks.items() if mb > args.ceiling_mb]
+    if over:
+        print("\nOVER CEILING: " + '; '.join(over))
+        return 1
+    print("在上限內")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
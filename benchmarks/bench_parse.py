@@ -0,0 +1,175 @@
+"""
+比較 fetch_twse / fetch_tpex 舊版解析與現行 parse_twse / parse_tpex 的速度，並確認輸出完全相同。
+使用 raw_cache 中錄下的原始回應 (或 benchmarks/fixtures 中的 fixture)，不連網：
+
+    python analyze.py 20260223              # 先正常跑一次，讓 raw_cache 存下該日回應
+    python benchmarks/bench_parse.py 20260223 --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyze
+import fixtures
+import raw_cache
+
+def legacy_parse_twse(t86_data, mi_data):
+    """舊版解析 (價格表先建 dict of dict、每列都清洗)，作為比較基準與正確性對照。"""
+    if not t86_data or 'data' not in t86_data:
+        return []
+    prices = {}
+    if mi_data and 'tables' in mi_data:
+        target_table = None
+        for table in mi_data['tables']:
+            if '每日收盤行情' in (table.get('title') or ''):
+                target_table = table
+                break
+        if target_table and 'fields' in target_table:
+            mi_fields = target_table['fields']
+            idx_mi_code = mi_fields.index('證券代號')
+            idx_mi_close = mi_fields.index('收盤價')
+            idx_mi_vol = mi_fields.index('成交股數')
+            idx_mi_val = mi_fields.index('成交金額')
+            for row in target_table['data']:
+                code = row[idx_mi_code].strip()
+                price_str = row[idx_mi_close].replace(',', '')
+                vol_str = row[idx_mi_vol].replace(',', '')
+                val_str = row[idx_mi_val].replace(',', '')
+                try:
+                    close_p = float(price_str)
+                except ValueError:
+                    close_p = 0.0
+                vwap = close_p
+                if vol_str.isdigit() and val_str.isdigit():
+                    vol = int(vol_str)
+                    val = int(val_str)
+                    if vol > 0:
+                        vwap = val / vol
+                prices[code] = {'close': close_p, 'vwap': vwap}
+
+    results = []
+    t86_fields = t86_data['fields']
+    idx_code = t86_fields.index('證券代號')
+    idx_name = t86_fields.index('證券名稱')
+    try:
+        idx_foreign = next(i for i, f in enumerate(t86_fields) if '外陸資買賣超股數(不含外資自營商)' in f)
+    except StopIteration:
+        idx_foreign = next(i for i, f in enumerate(t86_fields) if '外資' in f and '買賣超' in f)
+    try:
+        idx_it = next(i for i, f in enumerate(t86_fields) if f == '投信買賣超股數')
+    except StopIteration:
+        idx_it = next(i for i, f in enumerate(t86_fields) if '投信' in f and '買賣超' in f)
+
+    for row in t86_data['data']:
+        code = row[idx_code].strip()
+        name = row[idx_name].strip()
+        if code not in prices or prices[code]['close'] == 0:
+            continue
+        if len(code) != 4 or code.startswith('0'):
+            continue
+        try:
+            foreign_shares = int(row[idx_foreign].replace(',', ''))
+            it_shares = int(row[idx_it].replace(',', ''))
+        except ValueError:
+            continue
+        results.append({
+            'market': 'TWSE', 'code': code, 'name': name,
+            'price': prices[code]['close'], 'vwap': prices[code]['vwap'],
+            'foreign_val': foreign_shares * prices[code]['vwap'],
+            'it_val': it_shares * prices[code]['vwap'],
+            'foreign_shares': foreign_shares, 'it_shares': it_shares
+        })
+    return results
+
+def legacy_parse_tpex(t86_data, mi_data):
+    if not t86_data or not t86_data.get('tables') or not mi_data or not mi_data.get('tables'):
+        return []
+    prices = {}
+    for row in mi_data['tables'][0].get('data', []):
+        code = row[0].strip()
+        try:
+            close_p = float(row[2].replace(',', ''))
+        except ValueError:
+            close_p = 0.0
+        vwap = close_p
+        try:
+            if len(row) > 9:
+                vol_str = str(row[8]).replace(',', '')
+                val_str = str(row[9]).replace(',', '')
+                if vol_str.isdigit() and val_str.isdigit() and int(vol_str) > 0:
+                    vwap = int(val_str) / int(vol_str)
+                elif str(row[7]).replace('.', '').replace(',', '').isdigit():
+                    vwap = float(str(row[7]).replace(',', ''))
+        except Exception:
+            pass
+        prices[code] = {'close': close_p, 'vwap': vwap}
+
+    results = []
+    for row in t86_data['tables'][0].get('data', []):
+        code = str(row[0]).strip()
+        name = str(row[1]).strip()
+        if code not in prices or prices[code]['close'] == 0:
+            continue
+        if len(code) != 4 or code.startswith('0'):
+            continue
+        try:
+            foreign_shares = int(str(row[4]).replace(',', ''))
+            it_shares = int(str(row[13]).replace(',', ''))
+        except (ValueError, IndexError):
+            continue
+        results.append({
+            'market': 'TPEX', 'code': code, 'name': name,
+            'price': prices[code]['close'], 'vwap': prices[code]['vwap'],
+            'foreign_val': foreign_shares * prices[code]['vwap'],
+            'it_val': it_shares * prices[code]['vwap'],
+            'foreign_shares': foreign_shares, 'it_shares': it_shares
+        })
+    return results
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def load_payloads(date_str):
+    """優先使用 raw_cache 中實際錄下的回應，沒有時使用 benchmarks/fixtures 中簽入的 fixture。"""
+    payloads = {key: raw_cache.load(key, date_str) for key in fixtures.ENDPOINTS}
+    missing = [key for key, value in payloads.items() if value is None]
+    if missing:
+        payloads = fixtures.load(date_str)
+        if payloads is None:
+            sys.exit(f"raw_cache 與 benchmarks/fixtures 中都沒有 {date_str} 的 {', '.join(missing)}，"
+                     f"請先執行 python analyze.py {date_str}")
+    return payloads
+
+def main():
+    parser = argparse.ArgumentParser(description='解析階段效能比較 (舊版 vs 現行)')
+    parser.add_argument('date', help='已錄製於 raw_cache 或 benchmarks/fixtures 的日期 YYYYMMDD')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    p = load_payloads(args.date)
+    cases = [
+        ('TWSE', lambda: legacy_parse_twse(p['twse_t86'], p['twse_mi_index']),
+                 lambda: analyze.parse_twse(p['twse_t86'], p['twse_mi_index'])),
+        ('TPEX', lambda: legacy_parse_tpex(p['tpex_3itrade'], p['tpex_quotes']),
+                 lambda: analyze.parse_tpex(p['tpex_3itrade'], p['tpex_quotes'])),
+    ]
+    for market, legacy_fn, current_fn in cases:
+        legacy_t, legacy_rows = best_of(legacy_fn, args.repeat)
+        current_t, current_rows = best_of(current_fn, args.repeat)
+        status = 'OK' if legacy_rows == current_rows else 'MISMATCH'
+        print(f"{market}: {len(current_rows)} stocks | legacy {legacy_t * 1000:.2f} ms | "
+              f"current {current_t * 1000:.2f} ms | x{legacy_t / current_t:.2f} | {status}")
+        if status != 'OK':
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+整條流程各階段的離線基準測試，使用 benchmarks/fixtures 中簽入的交易所回應 (或 raw_cache)：
+
+    python benchmarks/bench_pipeline.py                       # 與 benchmarks/baseline.json 比較，退步即 exit 1
+    python benchmarks/bench_pipeline.py --save-baseline       # 以本次結果更新基準
+    python benchmarks/bench_pipeline.py --tolerance 0.5 --output result.json
+
+階段:
+  parse              parse_twse + parse_tpex (fetch_twse / fetch_tpex 去掉網路的部分)
+  rank               ranking.rank (analyze() 中的排名)
+  write_sidecar      report_data.write_sidecar
+  write_excel        excel_writer.write_report (openpyxl)
+  get_report_xlsx    report_data.build_report_from_xlsx 以 openpyxl 唯讀模式解析 Excel (沒有 sidecar 的舊報表)
+  get_report_cold    app.get_cached_entry 共用快取也沒有 (由 sidecar 建構各格式 JSON、壓縮結果與索引並寫入 report_store)
+  get_report_store   app.get_cached_entry 行程內未命中、由 report_store 取得 (其他 worker 或 analyze 已寫入)
+  get_report_warm    app.get_cached_entry 快取命中
+
+每個階段回報 wall time (中位數 / 最小值)、CPU time (最小值，比較基準時使用)、tracemalloc 峰值記憶體，以及階段結束時仍存活的新配置區塊數。
+計時與記憶體量測分開執行，tracemalloc 的額外開銷不會算進 wall time。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_DATE = '20260223'
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+def peak_rss_mb():
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def measure(fn, repeat, setup=None):
+    """
+    回傳 (各次 wall time 秒數, 各次 CPU time 秒數, tracemalloc 峰值 bytes, 存活的新配置區塊數)。
+    setup 在每次執行前呼叫且不計時。
+    """
+    times, cpu_times = [], []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        # 與 timeit 相同，計時期間停用 GC，避免前面階段留下的物件讓回收時機影響結果
+        gc.collect()
+        gc.disable()
+        try:
+            start, cpu_start = time.perf_counter(), time.process_time()
+            fn()
+            times.append(time.perf_counter() - start)
+            cpu_times.append(time.process_time() - cpu_start)
+        finally:
+            gc.enable()
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    del result
+    return times, cpu_times, peak, blocks
+
+def calibrate(repeat=5):
+    """
+    固定的純 Python 工作量 (字串處理 + dict 操作，與解析、排名的工作型態相近) 的 CPU time 最小值。
+    共用 / 虛擬機器每次執行的 CPU 速度可能差很多，與基準比較時以此正規化。
+    """
+    def workload():
+        table = {}
+        for i in range(200000):
+            key = f"{i:,}".replace(',', '')
+            table[key] = int(key) * 1.5
+        return sorted(table.values(), reverse=True)[:10]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        workload()
+        best = min(best, time.process_time() - start)
+    return best * 1000
+
+def run(date_str, repeat):
+    from bench_parse import load_payloads
+    payloads = load_payloads(date_str)
+    calibration_ms = calibrate()
+    print(f"calibration      {calibration_ms:>9.2f} ms (CPU 速度參考)")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 報表、sidecar、manifest 等輸出都寫到暫存目錄，不影響工作目錄
+        os.chdir(work_dir)
+        import analyze
+        import ranking
+        import report_data
+        import excel_writer
+        import app
+        import report_store
+
+        report_date = f"{date_str[:4]}/{date_str[4:6]}/{date_str[6:]}"
+        xlsx_path = os.path.join(work_dir, f"market_analysis_{date_str}.xlsx")
+        state = {}
+
+        def parse():
+            state['all_data'] = analyze.parse_twse(payloads['twse_t86'], payloads['twse_mi_index']) + \
+                analyze.parse_tpex(payloads['tpex_3itrade'], payloads['tpex_quotes'])
+            return state['all_data']
+
+        def rank():
+            state['rankings'] = ranking.rank(state['all_data'], k=10)
+            return state['rankings']
+
+        def write_sidecar():
+            state['sidecar'] = report_data.write_sidecar(date_str, state['all_data'])
+
+        def write_excel():
+            excel_writer.write_report(xlsx_path, report_date, state['rankings']['blocks'])
+
+        def signature():
+            st = os.stat(state['sidecar'])
+            return f"{state['sidecar']}:{st.st_mtime_ns}:{st.st_size}"
+
+        def clear_cache():
+            with app._report_cache_lock:
+                app._report_cache.clear()
+
+        def clear_store():
+            clear_cache()
+            with report_store.connect() as conn:
+                conn.execute('DELETE FROM report_variants')
+
+        stages = [
+            ('parse', parse, None),
+            ('rank', rank, None),
+            ('write_sidecar', write_sidecar, None),
+            ('write_excel', write_excel, None),
+            ('get_report_xlsx', lambda: report_data.build_report_from_xlsx(xlsx_path), None),
+            ('get_report_cold', lambda: app.get_cached_entry(date_str, state['sidecar'], signature()), clear_store),
+            ('get_report_store', lambda: app.get_cached_entry(date_str, state['sidecar'], signature()), clear_cache),
+            ('get_report_warm', lambda: app.get_cached_entry(date_str, state['sidecar'], signature()), None),
+        ]
+
+        results = {}
+        for name, fn, setup in stages:
+            # Excel 階段較慢，最多跑 3 次
+            n = min(repeat, 3) if name in ('write_excel', 'get_report_xlsx') else repeat
+            times, cpu_times, peak, blocks = measure(fn, n, setup)
+            results[name] = {
+                'runs': n,
+                'median_ms': statistics.median(times) * 1000,
+                'min_ms': min(times) * 1000,
+                'cpu_min_ms': min(cpu_times) * 1000,
+                'peak_kb': peak / 1024,
+                'alloc_blocks': blocks,
+            }
+            print(f"{name:<16} {results[name]['median_ms']:>9.2f} ms (min {results[name]['min_ms']:.2f}) | "
+                  f"peak {results[name]['peak_kb']:>9.0f} KB | {blocks:>7} blocks")
+        os.chdir(ROOT)
+
+    return {
+        'date': date_str,
+        'stocks': len(state['all_data']),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'peak_rss_mb': peak_rss_mb(),
+        'calibration_ms': calibration_ms,
+        'stages': results,
+    }
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    """
+    與基準比較，回傳退步的項目清單。
+    時間以 CPU time 最小值比較 (wall time 與中位數在共用機器上受其他行程干擾較大)，
+    並以兩次的 calibration 比值換算成同樣的 CPU 速度；換算後差距小於 min_delta_ms 的視為雜訊。
+    """
+    regressions = []
+    speed = baseline['calibration_ms'] / result['calibration_ms'] if baseline.get('calibration_ms') else 1.0
+    print(f"\n對照基準 ({baseline.get('created_at')}, Python {baseline.get('python')}), 容許 +{tolerance:.0%}, "
+          f"CPU 速度換算 x{speed:.2f}:")
+    for name, cur in result['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            print(f"  {name:<16} (基準中沒有此階段)")
+            continue
+        cur_ms = cur['cpu_min_ms'] * speed
+        time_ratio = cur_ms / base['cpu_min_ms'] if base['cpu_min_ms'] else 1.0
+        mem_ratio = cur['peak_kb'] / base['peak_kb'] if base['peak_kb'] else 1.0
+        flags = []
+        if time_ratio > 1 + tolerance and cur_ms - base['cpu_min_ms'] > min_delta_ms:
+            flags.append('TIME')
+        if mem_ratio > 1 + tolerance:
+            flags.append('MEMORY')
+        print(f"  {name:<16} time {time_ratio - 1:+7.1%} | peak {mem_ratio - 1:+7.1%} {' '.join(flags)}")
+        regressions += [f"{name}: {flag}" for flag in flags]
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='各階段離線基準測試')
+    parser.add_argument('date', nargs='?', default=DEFAULT_DATE, help='fixture 或 raw_cache 中的日期 YYYYMMDD')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='比較用的基準檔')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次結果存成基準')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='容許的相對退步幅度 (預設 0.5 = 50%%，專屬機器可調低)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='小於此絕對差距的時間變化不算退步')
+    parser.add_argument('--output', help='結果 JSON 路徑 (預設 benchmarks/results/<date>_<時間>.json)')
+    args = parser.parse_args()
+
+    result = run(args.date, args.repeat)
+    print(f"peak RSS {result['peak_rss_mb']:.1f} MB, {result['stocks']} stocks")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.date}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"結果已寫入 {output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"基準已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("沒有基準檔，略過比較 (可加 --save-baseline 建立)")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print("\nREGRESSION: " + ', '.join(regressions))
+        return 1
+    print("\n沒有退步")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+網頁端冷啟動基準測試：每次以全新的 Python 行程 import app，並送出首頁會發出的請求，量測
+  - import app 的時間與之後的 RSS
+  - 首頁 (/、/get_available_dates、/expected_date、兩個市場的 /api/report) 各請求的時間
+  - 由行程啟動到首頁資料全部回應完成的總時間 (含直譯器啟動，等同主機喚醒後第一位使用者等待的時間)
+並檢查首頁流程沒有載入 pandas / numpy / openpyxl 等重量級套件。
+
+    python benchmarks/bench_startup.py                      # 預設 5 次，超出預算即 exit 1
+    python benchmarks/bench_startup.py --budget-ms 800 --budget-rss-mb 50
+    python benchmarks/bench_startup.py --importtime         # 另外列出 import 時間最長的模組
+
+報表資料由 benchmarks/fixtures 產生在暫存目錄，不影響工作目錄。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+DEFAULT_DATE = '20260223'
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# 冷啟動預算 (Render 免費方案的 512 MB 容器、單一 worker)
+BUDGET_MS = 1000
+BUDGET_RSS_MB = 60
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+# 在全新行程中執行：import app 後依序送出首頁的請求，結果以 JSON 印在最後一行
+PROBE = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+rss_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+client = app.app.test_client()
+requests = {}
+for url in json.loads(sys.argv[1]):
+    t = time.perf_counter()
+    resp = client.get(url)
+    requests[url] = {'status': resp.status_code, 'ms': (time.perf_counter() - t) * 1000}
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_view_ms': (time.perf_counter() - imported) * 1000,
+    'rss_import_kb': rss_import,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'requests': requests,
+    'heavy_modules': [m for m in json.loads(sys.argv[2]) if m in sys.modules],
+}))
+'''
+
+def rss_mb(kb):
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    return kb / (1024 * 1024) if sys.platform == 'darwin' else kb / 1024
+
+def prepare_reports(work_dir, date_str):
+    """在暫存目錄中產出一份已發佈的報表 (sidecar + 報表清單)，與 analyze 產出的相同。"""
+    from bench_parse import load_payloads
+    payloads = load_payloads(date_str)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        import analyze
+        import manifest
+        import report_data
+        all_data = analyze.parse_twse(payloads['twse_t86'], payloads['twse_mi_index']) + \
+            analyze.parse_tpex(payloads['tpex_3itrade'], payloads['tpex_quotes'])
+        sidecar = report_data.write_sidecar(date_str, all_data)
+        counts = {market_key: sum(1 for d in all_data if d['market'] == market_key) for market_key, _ in report_data.MARKETS}
+        manifest.publish(date_str, counts, sidecar_path=sidecar)
+    finally:
+        os.chdir(cwd)
+
+def run_probe(work_dir, urls, extra_args=()):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *extra_args, '-c', PROBE, json.dumps(urls), json.dumps(HEAVY_MODULES)],
+                          cwd=work_dir, env=env, capture_output=True, text=True, encoding='utf-8')
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        sys.exit(f"probe 失敗:\n{proc.stderr}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process_ms'] = wall_ms
+    return result, proc.stderr
+
+def interpreter_ms(repeat):
+    """空白直譯器的啟動時間 (python -c pass)，作為無法再降低的下限參考。"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def slowest_imports(stderr, n=10):
+    """解析 -X importtime 的輸出，回傳 app 直接或間接 import 中累計時間最長的頂層套件。"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        package = name.strip().split('.')[0]
+        # 同一個頂層套件取最大的累計值 (子模組已包含在其中)
+        totals[package] = max(totals.get(package, 0), int(cumulative) / 1000)
+    totals.pop('app', None)
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+def main():
+    parser = argparse.ArgumentParser(description='網頁端冷啟動基準測試')
+    parser.add_argument('date', nargs='?', default=DEFAULT_DATE, help='fixture 或 raw_cache 中的日期 YYYYMMDD')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='行程啟動到首頁資料回應完成的預算 (中位數)')
+    parser.add_argument('--budget-rss-mb', type=float, default=BUDGET_RSS_MB, help='首頁回應後的 RSS 預算')
+    parser.add_argument('--importtime', action='store_true', help='列出 import 時間最長的套件')
+    parser.add_argument('--output', help='結果 JSON 路徑 (預設 benchmarks/results/startup_<時間>.json)')
+    args = parser.parse_args()
+
+    urls = ['/', '/get_available_dates', '/expected_date',
+            f'/api/report/{args.date}?market=TWSE', f'/api/report/{args.date}?market=TPEX']
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_reports(work_dir, args.date)
+        base_ms = interpreter_ms(args.repeat)
+        runs = [run_probe(work_dir, urls)[0] for _ in range(args.repeat)]
+        imports = slowest_imports(run_probe(work_dir, urls, ['-X', 'importtime'])[1]) if args.importtime else None
+
+    failed_requests = {url: r['status'] for run in runs for url, r in run['requests'].items() if r['status'] != 200}
+    if failed_requests:
+        sys.exit(f"首頁請求失敗: {failed_requests}")
+
+    summary = {
+        'process_ms': statistics.median(r['process_ms'] for r in runs),
+        'import_ms': statistics.median(r['import_ms'] for r in runs),
+        'first_view_ms': statistics.median(r['first_view_ms'] for r in runs),
+        'rss_import_mb': rss_mb(max(r['rss_import_kb'] for r in runs)),
+        'rss_mb': rss_mb(max(r['rss_kb'] for r in runs)),
+    }
+    print(f"interpreter      {base_ms:>8.1f} ms (python -c pass)")
+    print(f"import app       {summary['import_ms']:>8.1f} ms | RSS {summary['rss_import_mb']:.1f} MB")
+    for url in urls:
+        print(f"  {url:<40} {statistics.median(r['requests'][url]['ms'] for r in runs):>8.1f} ms")
+    print(f"first view       {summary['first_view_ms']:>8.1f} ms | RSS {summary['rss_mb']:.1f} MB")
+    print(f"process total    {summary['process_ms']:>8.1f} ms (預算 {args.budget_ms:.0f} ms)")
+    if imports:
+        print("\nimport 時間最長的套件:")
+        for package, ms in imports:
+            print(f"  {package:<24} {ms:>8.1f} ms")
+
+    heavy = sorted({m for r in runs for m in r['heavy_modules']})
+    result = {
+        'date': args.date,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'interpreter_ms': base_ms,
+        'summary': summary,
+        'heavy_modules': heavy,
+        'runs': runs,
+        'slowest_imports': imports,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"startup_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"\n結果已寫入 {output}")
+
+    problems = []
+    if summary['process_ms'] > args.budget_ms:
+        problems.append(f"啟動時間 {summary['process_ms']:.0f} ms > {args.budget_ms:.0f} ms")
+    if summary['rss_mb'] > args.budget_rss_mb:
+        problems.append(f"RSS {summary['rss_mb']:.1f} MB > {args.budget_rss_mb:.0f} MB")
+    if heavy:
+        problems.append(f"首頁流程載入了 {', '.join(heavy)}")
+    if problems:
+        print("\nOVER BUDGET: " + '; '.join(problems))
+        return 1
+    print("\n在預算內")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+基準測試用的交易所原始回應 (T86 / MI_INDEX / TPEx 三大法人 / TPEx 收盤行情)，存於 benchmarks/fixtures/<date>/。
+
+    python benchmarks/fixtures.py record 20260223     # 由 raw_cache 複製實際錄下的回應
+    python benchmarks/fixtures.py synth 20260223      # 產生與交易所相同欄位結構的合成資料
+
+目前簽入的 fixture 為合成資料 (欄位、表格結構、千分位字串格式與實際回應相同，數值為固定種子亂數)；
+能連上交易所時可先跑一次 analyze.py 再 record 覆蓋成實際回應。
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import raw_cache
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ENDPOINTS = ('twse_t86', 'twse_mi_index', 'tpex_3itrade', 'tpex_quotes')
+
+TWSE_T86_FIELDS = [
+    "證券代號", "證券名稱",
+    "外陸資買進股數(不含外資自營商)", "外陸資賣出股數(不含外資自營商)", "外陸資買賣超股數(不含外資自營商)",
+    "外資自營商買進股數", "外資自營商賣出股數", "外資自營商買賣超股數",
+    "投信買進股數", "投信賣出股數", "投信買賣超股數",
+    "自營商買賣超股數",
+    "自營商買進股數(自行買賣)", "自營商賣出股數(自行買賣)", "自營商買賣超股數(自行買賣)",
+    "自營商買進股數(避險)", "自營商賣出股數(避險)", "自營商買賣超股數(避險)",
+    "三大法人買賣超股數",
+]
+
+TWSE_MI_FIELDS = [
+    "證券代號", "證券名稱", "成交股數", "成交筆數", "成交金額", "開盤價", "最高價", "最低價", "收盤價",
+    "漲跌(+/-)", "漲跌價差", "最後揭示買價", "最後揭示買量", "最後揭示賣價", "最後揭示賣量", "本益比",
+]
+
+def fixture_path(date_str, endpoint):
+    return os.path.join(FIXTURE_DIR, date_str, f"{endpoint}.json.gz")
+
+def load(date_str):
+    """回傳 {endpoint: payload}；該日期沒有 fixture 時回傳 None。"""
+    payloads = {}
+    for endpoint in ENDPOINTS:
+        path = fixture_path(date_str, endpoint)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            payloads[endpoint] = json.load(f)
+    return payloads
+
+def save(date_str, payloads):
+    os.makedirs(os.path.join(FIXTURE_DIR, date_str), exist_ok=True)
+    for endpoint, payload in payloads.items():
+        raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        # mtime=0: 內容相同時壓出相同的 bytes，重新產生不會造成無意義的 diff
+        with open(fixture_path(date_str, endpoint), 'wb') as f:
+            f.write(gzip.compress(raw, mtime=0))
+
+def record(date_str):
+    payloads = {endpoint: raw_cache.load(endpoint, date_str) for endpoint in ENDPOINTS}
+    missing = [k for k, v in payloads.items() if v is None]
+    if missing:
+        sys.exit(f"raw_cache 中缺少 {date_str} 的 {', '.join(missing)}，請先執行 python analyze.py {date_str}")
+    save(date_str, payloads)
+
+def _fmt(n):
+    return f"{n:,}"
+
+def _twse_payloads(rnd, date_str, n_rows):
+    t86_rows, mi_rows = [], []
+    for i in range(n_rows):
+        # 約 1/12 為 ETF (00 開頭)，會被 is_common_stock 排除
+        code = f"00{50 + i % 900:03d}" if i % 12 == 0 else str(1101 + i)
+        vol = rnd.randint(0, 8_000_000) if i % 50 else 0
+        close = round(rnd.uniform(8, 1200), 2)
+        val = int(vol * close * rnd.uniform(0.98, 1.02))
+        close_str = f"{close:,.2f}" if vol else "--"
+        mi_rows.append([code, f"股{code}", _fmt(vol), _fmt(vol // 1000), _fmt(val), close_str, close_str, close_str, close_str,
+                        "<p style= color:red>+</p>", "0.50", close_str, "10", close_str, "5", "15.20"])
+
+        f_buy, f_sell = rnd.randint(0, 3_000_000), rnd.randint(0, 3_000_000)
+        it_buy, it_sell = (rnd.randint(0, 400_000), rnd.randint(0, 400_000)) if i % 3 else (0, 0)
+        d_buy, d_sell = rnd.randint(0, 200_000), rnd.randint(0, 200_000)
+        total = (f_buy - f_sell) + (it_buy - it_sell) + (d_buy - d_sell)
+        t86_rows.append([code, f"股{code}      ",
+                         _fmt(f_buy), _fmt(f_sell), _fmt(f_buy - f_sell), "0", "0", "0",
+                         _fmt(it_buy), _fmt(it_sell), _fmt(it_buy - it_sell), _fmt(d_buy - d_sell),
+                         _fmt(d_buy), _fmt(d_sell), _fmt(d_buy - d_sell), "0", "0", "0", _fmt(total)])
+    roc = f"{int(date_str[:4]) - 1911}年{date_str[4:6]}月{date_str[6:]}日"
+    t86 = {"stat": "OK", "date": date_str, "title": f"{roc} 三大法人買賣超日報", "fields": TWSE_T86_FIELDS,
+           "data": t86_rows, "selectType": "ALL", "notes": []}
+    mi = {"stat": "OK", "date": date_str, "tables": [
+        {"title": f"{roc} 價格指數(臺灣證券交易所)", "fields": ["指數", "收盤指數", "漲跌(+/-)", "漲跌點數", "漲跌百分比(%)", "特殊處理註記"], "data": []},
+        {"title": f"{roc} 大盤統計資訊", "fields": ["成交統計", "成交金額(元)", "成交股數(股)", "成交筆數"], "data": []},
+        {"title": f"{roc} 每日收盤行情(全部(不含權證、牛熊證))", "fields": TWSE_MI_FIELDS, "data": mi_rows},
+    ]}
+    return t86, mi
+
+def _tpex_payloads(rnd, date_str, n_rows):
+    t86_rows, quote_rows = [], []
+    for i in range(n_rows):
+        code = f"00{700 + i % 300}" if i % 15 == 0 else str(3101 + i)
+        vol = rnd.randint(0, 3_000_000) if i % 40 else 0
+        close = round(rnd.uniform(5, 800), 2)
+        avg = round(close * rnd.uniform(0.98, 1.02), 2)
+        val = int(vol * avg)
+        close_str = f"{close:,.2f}" if vol else "---"
+        quote_rows.append([code, f"櫃{code}", close_str, "+0.30", close_str, close_str, close_str, f"{avg:,.2f}" if vol else "---",
+                           _fmt(vol), _fmt(val), _fmt(vol // 1000), close_str, "3", close_str, "2",
+                           "100,000,000", close_str, close_str, close_str])
+
+        # 欄位: 外資及陸資(不含外資自營商) 買/賣/超、外資自營商 買/賣/超、外資合計 買/賣/超、投信 買/賣/超、
+        #       自營商(自行買賣) 買/賣/超、自營商(避險) 買/賣/超、自營商合計 買/賣/超、三大法人買賣超合計
+        f_buy, f_sell = rnd.randint(0, 1_000_000), rnd.randint(0, 1_000_000)
+        it_buy, it_sell = (rnd.randint(0, 150_000), rnd.randint(0, 150_000)) if i % 4 else (0, 0)
+        ds_buy, ds_sell = rnd.randint(0, 80_000), rnd.randint(0, 80_000)
+        dh_buy, dh_sell = rnd.randint(0, 80_000), rnd.randint(0, 80_000)
+        d_buy, d_sell = ds_buy + dh_buy, ds_sell + dh_sell
+        total = (f_buy - f_sell) + (it_buy - it_sell) + (d_buy - d_sell)
+        row = [code, f"櫃{code}"]
+        for buy, sell in ((f_buy, f_sell), (0, 0), (f_buy, f_sell), (it_buy, it_sell),
+                          (ds_buy, ds_sell), (dh_buy, dh_sell), (d_buy, d_sell)):
+            row += [_fmt(buy), _fmt(sell), _fmt(buy - sell)]
+        row.append(_fmt(total))
+        t86_rows.append(row)
+    roc = f"{int(date_str[:4]) - 1911}/{date_str[4:6]}/{date_str[6:]}"
+    t86 = {"stat": "ok", "date": date_str, "tables": [{"title": "三大法人買賣明細資訊", "date": roc, "data": t86_rows,
+                                                      "totalCount": len(t86_rows)}]}
+    quotes = {"stat": "ok", "date": date_str, "tables": [{"title": "上櫃股票每日收盤行情(不含定價)", "date": roc,
+                                                          "data": quote_rows, "totalCount": len(quote_rows)}]}
+    return t86, quotes
+
+def synthesize(date_str, n_twse=1350, n_tpex=1000, seed=20260223):
+    rnd = random.Random(seed + int(date_str))
+    twse_t86, twse_mi = _twse_payloads(rnd, date_str, n_twse)
+    tpex_t86, tpex_quotes = _tpex_payloads(rnd, date_str, n_tpex)
+    return {'twse_t86': twse_t86, 'twse_mi_index': twse_mi, 'tpex_3itrade': tpex_t86, 'tpex_quotes': tpex_quotes}
+
+def main():
+    parser = argparse.ArgumentParser(description='管理基準測試用的交易所回應 fixture')
+    parser.add_argument('action', choices=['record', 'synth'])
+    parser.add_argument('date', help='YYYYMMDD')
+    args = parser.parse_args()
+    if args.action == 'record':
+        record(args.date)
+    else:
+        save(args.date, synthesize(args.date))
+    print(f"已寫入 {os.path.join(FIXTURE_DIR, args.date)}")
+
+if __name__ == '__main__':
+    main()
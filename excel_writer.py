@@ -0,0 +1,274 @@
+import os
+from copy import copy
+
+import metrics
+import report_data
+
+# Excel 報表輸出。兩種模式產出相同的版面 (合併標題、名稱欄位底色、欄寬、數字格式)：
+#   fast      openpyxl write-only 串流寫入 + 共用 named style，逐列寫出後即釋放 (預設)
+#   standard  原本的逐格設定樣式寫法，整本活頁簿留在記憶體中
+# 可用環境變數 EXCEL_WRITER=standard 切回原本寫法 (LOW_MEMORY=true 時一律使用 fast)。
+
+EXCEL_WRITER = os.environ.get('EXCEL_WRITER', 'fast')
+LOW_MEMORY = os.environ.get('LOW_MEMORY', 'false').lower() == 'true'
+
+FONT_NAME = '微軟正黑體'
+
+# 名稱欄位底色: 同向為紅、反向為綠，成交股數較大的一方用深色
+FILL_COLORS = {
+    'light_red': "FFCCCC",
+    'dark_red': "FF8080",
+    'light_green': "E6FFE6",
+    'dark_green': "80FF80",
+}
+HEADER_COLOR = "4F81BD"
+SUB_HEADER_COLOR = "DCE6F1"
+
+COLUMN_WIDTHS = {}
+for _cols, _width in [
+    (['A', 'H', 'O', 'V'], 10),
+    (['B', 'I', 'P', 'W'], 12),
+    (['C', 'J', 'Q', 'X'], 10),
+    (['D', 'K', 'R', 'Y'], 11),
+    (['E', 'L', 'S', 'Z'], 16),
+    (['F', 'M', 'T', 'AA'], 13),
+    (['G', 'N', 'U'], 3),
+]:
+    for _col in _cols:
+        COLUMN_WIDTHS[_col] = _width
+
+MERGED_HEADERS = ["A2:F2", "H2:M2", "O2:T2", "V2:AA2"]
+
+# 每個區塊 6 欄的數字格式 (代號與名稱不套格式)
+BLOCK_FORMATS = [None, None, '#,##0.00', '#,##0.00', '#,##0', '#,##0.00']
+
+def stock_fills(fb, fs):
+    """
+    計算每檔股票名稱欄位的底色 (同向或反向)，回傳 code -> (外資區塊底色, 投信區塊底色)。
+    外資股數為 0 的股票不會上色，只需看外資兩個區塊。
+    """
+    fills = {}
+    for d in fb + fs:
+        f_val, i_val = d['foreign_shares'], d['it_shares']
+        if (f_val > 0 and i_val > 0) or (f_val < 0 and i_val < 0):
+            if abs(f_val) > abs(i_val):
+                fills[d['code']] = ('dark_red', 'light_red')
+            else:
+                fills[d['code']] = ('light_red', 'dark_red')
+        elif (f_val > 0 and i_val < 0) or (f_val < 0 and i_val > 0):
+            if abs(f_val) > abs(i_val):
+                fills[d['code']] = ('dark_green', 'light_green')
+            else:
+                fills[d['code']] = ('light_green', 'dark_green')
+    return fills
+
+def _block_specs(blocks):
+    fb, fs, ib, isell = blocks
+    # (排序好的清單, 金額欄位, 股數欄位, 是否為外資區塊)
+    return [
+        (fb, 'foreign_val', 'foreign_shares', True),
+        (fs, 'foreign_val', 'foreign_shares', True),
+        (ib, 'it_val', 'it_shares', False),
+        (isell, 'it_val', 'it_shares', False),
+    ]
+
+def _import_openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        import subprocess
+        import sys
+        print("首次執行，正在安裝 openpyxl 套件...")
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "openpyxl"])
+        import openpyxl
+    return openpyxl
+
+def build_standard(report_date, market_blocks):
+    """原本的寫法：一般活頁簿，逐格設定字型、對齊、底色與數字格式。"""
+    openpyxl = _import_openpyxl()
+    from openpyxl.styles import PatternFill, Font, Alignment
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active) # 移除預設工作表
+
+    # 建立格式與字體
+    fill_map = {key: PatternFill(start_color=color, end_color=color, fill_type="solid") for key, color in FILL_COLORS.items()}
+
+    date_font = Font(name=FONT_NAME, size=12, bold=True, color="000000")
+    header_font = Font(name=FONT_NAME, size=12, bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color=HEADER_COLOR, end_color=HEADER_COLOR, fill_type="solid")
+    sub_header_fill = PatternFill(start_color=SUB_HEADER_COLOR, end_color=SUB_HEADER_COLOR, fill_type="solid")
+    sub_header_font = Font(name=FONT_NAME, size=11, bold=True)
+    base_font = Font(name=FONT_NAME, size=11)
+
+    center_align = Alignment(horizontal='center', vertical='center')
+    left_align = Alignment(horizontal='left', vertical='center')
+    right_align = Alignment(horizontal='right', vertical='center')
+
+    for market_key, sheet_name in report_data.MARKETS:
+        ws = wb.create_sheet(title=sheet_name)
+
+        # 第一列: 日期
+        ws.append([f"{report_date}"])
+        ws.cell(row=1, column=1).font = date_font
+        ws.cell(row=1, column=1).alignment = left_align
+
+        # 該市場已排序好的四個區塊 (由大到小 / 由深到淺即負數由小到大)
+        blocks = market_blocks.get(market_key, ([], [], [], []))
+
+        # 第二列: 大標題
+        ws.append(report_data.MAIN_HEADERS)
+
+        # 第三列: 子標題
+        ws.append(report_data.SUB_HEADERS)
+
+        # 合併第二列儲存格
+        for cell_range in MERGED_HEADERS:
+            ws.merge_cells(cell_range)
+
+        # 設定前三列樣式
+        for cell in ws[2]:
+            cell.font = header_font
+            cell.alignment = center_align
+            if cell.value:
+                cell.fill = header_fill
+        for cell in ws[3]:
+            cell.font = sub_header_font
+            cell.alignment = center_align
+            if cell.value:
+                cell.fill = sub_header_fill
+
+        fills = stock_fills(blocks[0], blocks[1])
+
+        # 寫入各分類的排名資料
+        for block_i, (lst, val_key, shares_key, is_foreign) in enumerate(_block_specs(blocks)):
+            first_col = block_i * 7 + 1
+            for row_i, st in enumerate(lst):
+                row_idx = row_i + 4 # 標題佔 3 列
+                fill_key = fills.get(st['code'], (None, None))[0 if is_foreign else 1]
+                values = report_data.block_cells(st, val_key, shares_key)
+                for offset, (val, num_fmt) in enumerate(zip(values, BLOCK_FORMATS)):
+                    cell = ws.cell(row=row_idx, column=first_col + offset, value=val)
+                    cell.font = base_font
+                    cell.alignment = right_align if isinstance(val, (int, float)) else center_align
+                    if fill_key and offset == 1: # Only highlight the Name column
+                        cell.fill = fill_map[fill_key]
+                    if num_fmt and isinstance(val, (int, float)):
+                        cell.number_format = num_fmt
+
+        # 調整欄位寬度
+        for col, width in COLUMN_WIDTHS.items():
+            ws.column_dimensions[col].width = width
+
+    return wb
+
+def _named_styles():
+    from openpyxl.styles import NamedStyle, PatternFill, Font, Alignment
+
+    def solid(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+    center_align = Alignment(horizontal='center', vertical='center')
+    right_align = Alignment(horizontal='right', vertical='center')
+    base_font = Font(name=FONT_NAME, size=11)
+    header_font = Font(name=FONT_NAME, size=12, bold=True, color="FFFFFF")
+    sub_header_font = Font(name=FONT_NAME, size=11, bold=True)
+
+    styles = [
+        NamedStyle(name='report_date', font=Font(name=FONT_NAME, size=12, bold=True, color="000000"),
+                   alignment=Alignment(horizontal='left', vertical='center')),
+        NamedStyle(name='report_header', font=header_font, alignment=center_align, fill=solid(HEADER_COLOR)),
+        NamedStyle(name='report_header_blank', font=header_font, alignment=center_align),
+        NamedStyle(name='report_sub_header', font=sub_header_font, alignment=center_align, fill=solid(SUB_HEADER_COLOR)),
+        NamedStyle(name='report_sub_header_blank', font=sub_header_font, alignment=center_align),
+        NamedStyle(name='report_text', font=base_font, alignment=center_align),
+        NamedStyle(name='report_number', font=base_font, alignment=right_align),
+        NamedStyle(name='report_number_2', font=base_font, alignment=right_align, number_format='#,##0.00'),
+        NamedStyle(name='report_number_0', font=base_font, alignment=right_align, number_format='#,##0'),
+    ]
+    for key, color in FILL_COLORS.items():
+        styles.append(NamedStyle(name=f'report_name_{key}', font=base_font, alignment=center_align, fill=solid(color)))
+    return styles
+
+def build_fast(report_date, market_blocks):
+    """write-only 串流寫法：每列寫出後即交給 writer，不在記憶體保留整張工作表。"""
+    openpyxl = _import_openpyxl()
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.worksheet.cell_range import CellRange
+
+    wb = openpyxl.Workbook(write_only=True)
+    style_names = []
+    for style in _named_styles():
+        wb.add_named_style(style)
+        style_names.append(style.name)
+
+    number_styles = {'#,##0.00': 'report_number_2', '#,##0': 'report_number_0'}
+
+    for market_key, sheet_name in report_data.MARKETS:
+        ws = wb.create_sheet(title=sheet_name)
+        # write-only 模式下欄寬與合併範圍必須在寫入資料前設定
+        for col, width in COLUMN_WIDTHS.items():
+            ws.column_dimensions[col].width = width
+        for cell_range in MERGED_HEADERS:
+            ws.merged_cells.add(CellRange(cell_range))
+
+        # 每個 named style 只解析一次，之後直接複製其樣式索引，省去逐格查找 named style
+        templates = {}
+        for style in style_names:
+            template = WriteOnlyCell(ws)
+            template.style = style
+            templates[style] = template._style
+
+        def styled(value, style):
+            cell = WriteOnlyCell(ws, value=value)
+            cell._style = copy(templates[style])
+            return cell
+
+        ws.append([styled(f"{report_date}", 'report_date')])
+        ws.append([styled(v or None, 'report_header' if v else 'report_header_blank') for v in report_data.MAIN_HEADERS])
+        ws.append([styled(v or None, 'report_sub_header' if v else 'report_sub_header_blank') for v in report_data.SUB_HEADERS])
+
+        blocks = market_blocks.get(market_key, ([], [], [], []))
+        fills = stock_fills(blocks[0], blocks[1])
+        specs = _block_specs(blocks)
+        max_rows = max(len(lst) for lst in blocks)
+        empty_block = [None] * 6
+
+        for row_i in range(max_rows):
+            row = []
+            for block_i, (lst, val_key, shares_key, is_foreign) in enumerate(specs):
+                if row_i < len(lst):
+                    st = lst[row_i]
+                    code_val, name, price, vwap, shares, value = report_data.block_cells(st, val_key, shares_key)
+                    fill_key = fills.get(st['code'], (None, None))[0 if is_foreign else 1]
+                    row.extend([
+                        styled(code_val, 'report_number' if isinstance(code_val, int) else 'report_text'),
+                        styled(name, f'report_name_{fill_key}' if fill_key else 'report_text'),
+                        styled(price, number_styles[BLOCK_FORMATS[2]]),
+                        styled(vwap, number_styles[BLOCK_FORMATS[3]]),
+                        styled(shares, number_styles[BLOCK_FORMATS[4]]),
+                        styled(value, number_styles[BLOCK_FORMATS[5]]),
+                    ])
+                else:
+                    row.extend(empty_block)
+                if block_i < 3:
+                    row.append(None)
+            ws.append(row)
+
+    return wb
+
+def write_report(filename, report_date, market_blocks, mode=None):
+    """market_blocks: {market: (fb, fs, ib, isell)}，即 ranking.rank() 的 'blocks'。"""
+    mode = mode or EXCEL_WRITER
+    if LOW_MEMORY and mode == 'standard':
+        # 記憶體受限模式: 不在記憶體中保留整本活頁簿
+        mode = 'fast'
+    with metrics.stage('workbook.build'):
+        if mode == 'standard':
+            wb = build_standard(report_date, market_blocks)
+        else:
+            wb = build_fast(report_date, market_blocks)
+    # write-only 模式下儲存時才真正序列化工作表內容
+    with metrics.stage('workbook.save'):
+        wb.save(filename)
+    return filename
@@ -0,0 +1,196 @@
+import argparse
+import csv
+import importlib.util
+import io
+import itertools
+import os
+import sys
+
+import report_data
+import stock_history
+
+# 批次匯出：把一段日期的個股資料 (stock_history 的 flows 表，欄位與 fetch_twse / fetch_tpex 產出的相同)
+# 以 CSV 或 Parquet 串流輸出。游標每次取 CHUNK_ROWS 列、寫出後即丟棄，整份結果不會同時放在記憶體中。
+#   python export.py 20260101 20260331 --market TWSE --codes 2330,2317 --format parquet -o q1.parquet
+#   GET /export?start=20260101&end=20260331&market=TWSE&codes=2330,2317&format=csv
+# 分析前就存在的報表需先以 python stock_history.py import 匯入。
+# Parquet 需要選用套件 pyarrow (pip install pyarrow)，未安裝時只提供 CSV。
+
+FIELDS = ['date', 'market', 'code', 'name', 'price', 'vwap', 'foreign_shares', 'it_shares', 'foreign_val', 'it_val']
+FORMATS = ('csv', 'parquet')
+MIMETYPES = {'csv': 'text/csv; charset=utf-8', 'parquet': 'application/vnd.apache.parquet'}
+# 每次由游標取出並寫出的列數 (Parquet 每一批為一個 row group)
+CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '10000'))
+MAX_CODES = 1000
+
+class ExportError(ValueError):
+    """匯出參數不正確 (網頁端回傳 400)。"""
+
+def supported_formats():
+    # 只檢查是否安裝，不在此 import pyarrow (載入很慢，網頁端只在真的匯出 Parquet 時才載入)
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or importlib.util.find_spec('pyarrow') is not None]
+
+def _valid_date(date_str):
+    return isinstance(date_str, str) and len(date_str) == 8 and date_str.isdigit()
+
+def parse_codes(codes):
+    """'2330,2317' 或清單 -> 去重後的代號清單；None / 空字串代表不限。"""
+    if not codes:
+        return None
+    if isinstance(codes, str):
+        codes = codes.split(',')
+    codes = list(dict.fromkeys(str(code).strip() for code in codes if str(code).strip()))
+    if len(codes) > MAX_CODES:
+        raise ExportError(f"too many codes (max {MAX_CODES})")
+    if not all(code.isalnum() for code in codes):
+        raise ExportError("codes must be alphanumeric stock codes")
+    return codes or None
+
+def validate(fmt, start, end, market=None):
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format: {fmt} (csv or parquet)")
+    if fmt not in supported_formats():
+        raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+    if not (_valid_date(start) and _valid_date(end)):
+        raise ExportError("start and end must be dates in YYYYMMDD format")
+    if start > end:
+        raise ExportError("start must not be after end")
+    if market and market not in dict(report_data.MARKETS):
+        raise ExportError(f"Unknown market: {market}")
+
+def query(start, end, market=None, codes=None, path=stock_history.DB_FILE):
+    """依 (date, market, code) 排序的游標；未指定代號時走 flows 的日期索引，不必排序。"""
+    sql = f'SELECT {", ".join(FIELDS)} FROM flows WHERE date BETWEEN ? AND ?'
+    params = [start, end]
+    if market:
+        sql += ' AND market = ?'
+        params.append(market)
+    if codes:
+        sql += f' AND code IN ({", ".join("?" * len(codes))})'
+        params.extend(codes)
+    return stock_history.connect(path).execute(sql + ' ORDER BY date, market, code', params)
+
+def _batches(cursor):
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            return
+        yield rows
+
+def iter_csv(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(FIELDS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+
+class _Chunks:
+    """給 pyarrow 寫入的檔案物件：累積寫入的 bytes，由 drain() 取出後清空。"""
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def iter_parquet(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('date', pa.string()), ('market', pa.string()), ('code', pa.string()), ('name', pa.string()),
+        ('price', pa.float64()), ('vwap', pa.float64()),
+        ('foreign_shares', pa.int64()), ('it_shares', pa.int64()),
+        ('foreign_val', pa.float64()), ('it_val', pa.float64()),
+    ])
+    sink = _Chunks()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for rows in batches:
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            # 每一批寫成一個 row group，寫完即可把這段 bytes 送出
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    # 檔尾的 metadata
+    yield sink.drain()
+
+WRITERS = {'csv': iter_csv, 'parquet': iter_parquet}
+
+def stream(fmt, start, end, market=None, codes=None, path=stock_history.DB_FILE):
+    """
+    檢查參數並回傳逐塊產生檔案內容的 generator；沒有符合的資料時回傳 None。
+    參數不正確時拋出 ExportError。
+    """
+    validate(fmt, start, end, market)
+    codes = parse_codes(codes)
+    batches = _batches(query(start, end, market, codes, path))
+    first = next(batches, None)
+    if first is None:
+        return None
+    return WRITERS[fmt](itertools.chain([first], batches))
+
+def filename(fmt, start, end, market=None):
+    return f"flows_{start}_{end}{'_' + market if market else ''}.{fmt}"
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='export.py', description='匯出一段日期的個股法人買賣超 (CSV / Parquet)')
+    parser.add_argument('start', help='起始日期 YYYYMMDD')
+    parser.add_argument('end', help='結束日期 YYYYMMDD')
+    parser.add_argument('--market', choices=[market_key for market_key, _ in report_data.MARKETS])
+    parser.add_argument('--codes', help='以逗號分隔的證券代號，例如 2330,2317')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('-o', '--output', help='輸出檔 (預設 flows_<起>_<迄>.<格式>；- 代表 stdout，僅限 CSV)')
+    args = parser.parse_args(argv)
+
+    try:
+        chunks = stream(args.format, args.start, args.end, args.market, args.codes)
+    except ExportError as e:
+        parser.error(str(e))
+    if chunks is None:
+        print(f"{args.start} ~ {args.end} 沒有符合的資料 (舊報表需先執行 python stock_history.py import)", file=sys.stderr)
+        return 1
+
+    output = args.output or filename(args.format, args.start, args.end, args.market)
+    if output == '-':
+        if args.format != 'csv':
+            parser.error("only CSV can be written to stdout")
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return 0
+
+    tmp_path = output + '.tmp'
+    nbytes = 0
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            nbytes += len(chunk)
+    os.replace(tmp_path, output)
+    print(f"已匯出 {output} ({nbytes / 1024:.0f} KB)", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,241 @@
+import asyncio
+import concurrent.futures
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# 共用的交易所 HTTP 連線層：
+# - 每個主機一個 Session (連線池 + keep-alive)，避免每次請求重新 TCP/TLS 握手
+# - 5xx / 逾時 / 連線錯誤以指數退避加隨機抖動重試
+# - 每個主機限制同時連線數，避免觸發證交所/櫃買中心的流量限制
+# - 可選的每主機速率上限 (批次回補時使用)
+# - 記錄每次請求的耗時與位元組數
+# - AsyncFetcher: 單一事件迴圈中同時發出多個請求的非同步介面 (analyze 抓取市場、回補預先抓取)
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'Accept-Language': 'zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Connection': 'keep-alive',
+    'Referer': 'https://www.tpex.org.tw/'
+}
+
+TIMEOUT = 15
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+PER_HOST_CONCURRENCY = 2
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# AsyncFetcher 同時進行中的請求總數 (也是實際執行 socket I/O 的執行緒數，與日期數、端點數無關)
+MAX_IN_FLIGHT = int(os.environ.get('HTTP_MAX_IN_FLIGHT', '8'))
+
+# 每個主機每秒最多發出的請求數，None 代表不限制
+RATE_LIMIT = None
+
+_lock = threading.Lock()
+_sessions = {}
+_host_slots = {}
+_rate_limiters = {}
+request_log = deque(maxlen=1000)
+
+class RateLimiter:
+    """簡單的 token bucket：平均每秒 rate 個請求，最多累積 burst 個。"""
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        """取得一個 token 時回傳 0，否則回傳需要等待的秒數。"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+def set_rate_limit(rate):
+    """設定每主機的全域速率上限 (requests/second)，None 代表取消限制。"""
+    global RATE_LIMIT
+    with _lock:
+        RATE_LIMIT = rate
+        _rate_limiters.clear()
+
+def _rate_limiter_for(host):
+    if not RATE_LIMIT:
+        return None
+    with _lock:
+        limiter = _rate_limiters.get(host)
+        if limiter is None:
+            limiter = _rate_limiters[host] = RateLimiter(RATE_LIMIT)
+        return limiter
+
+def _session_for(host):
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(headers)
+            # Disable SSL verification to prevent "CERTIFICATE VERIFY FAILED" on some Linux/Docker environments like Render
+            session.verify = False
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PER_HOST_CONCURRENCY, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+            _host_slots[host] = threading.BoundedSemaphore(PER_HOST_CONCURRENCY)
+        return session, _host_slots[host]
+
+def backoff_delay(attempt):
+    """第 attempt 次重試前的等待秒數 (full jitter)。"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def _record(url, host, status, elapsed, nbytes, attempt, error=None, endpoint=None):
+    metrics.record_http(endpoint or host, status, nbytes, elapsed)
+    request_log.append({
+        'url': url,
+        'host': host,
+        'endpoint': endpoint or host,
+        'status': status,
+        'elapsed': elapsed,
+        'bytes': nbytes,
+        'attempt': attempt,
+        'error': error
+    })
+
+def _attempt(url, host, session, slots, timeout, attempt, retries, endpoint):
+    """
+    發出一次請求 (會阻塞)。回傳 (資料, 重試前的等待秒數)；等待秒數為 None 代表不再重試，
+    此時資料為解析後的 JSON，失敗則為 None。
+    """
+    start = time.perf_counter()
+    try:
+        with slots:
+            res = session.get(url, timeout=timeout)
+            body = res.content
+        _record(url, host, res.status_code, time.perf_counter() - start, len(body), attempt, endpoint=endpoint)
+
+        if res.status_code in RETRY_STATUS and attempt < retries:
+            delay = backoff_delay(attempt)
+            print(f"HTTP {res.status_code} from {host}, retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+            return None, delay
+
+        # Check HTTP response status and throw if not 200
+        res.raise_for_status()
+        return res.json(), None
+    except (requests.Timeout, requests.ConnectionError) as e:
+        _record(url, host, None, time.perf_counter() - start, 0, attempt, error=type(e).__name__, endpoint=endpoint)
+        if attempt < retries:
+            delay = backoff_delay(attempt)
+            print(f"{type(e).__name__} from {host}, retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+            return None, delay
+        print(f"Error fetching {url}: {e}")
+        return None, None
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+        return None, None
+
+def get_json(url, timeout=TIMEOUT, retries=MAX_RETRIES, endpoint=None):
+    """
+    以共用連線池取得 JSON。暫時性錯誤 (5xx、逾時、連線中斷) 會自動重試，
+    全部重試失敗或回應非 JSON 時回傳 None，與原本 get_json 的行為一致。
+    endpoint 為指標用的名稱 (例如 twse_t86)，未指定時以主機名稱統計。
+    """
+    host = urlsplit(url).netloc
+    session, slots = _session_for(host)
+
+    for attempt in range(retries + 1):
+        limiter = _rate_limiter_for(host)
+        if limiter:
+            limiter.acquire()
+        data, delay = _attempt(url, host, session, slots, timeout, attempt, retries, endpoint)
+        if delay is None:
+            return data
+        time.sleep(delay)
+    return None
+
+class AsyncFetcher:
+    """
+    非同步抓取層：在單一事件迴圈中同時發出任意數量的請求，同時進行中的請求最多 max_in_flight 個，
+    每個主機另受 PER_HOST_CONCURRENCY 限制，速率上限、重試與退避都與 get_json 相同。
+    等待名額、速率限制與退避都在事件迴圈中進行，不佔用執行緒；只有實際的 socket I/O 與 JSON 解碼
+    交給固定 max_in_flight 條執行緒的 requests Session (沿用 keep-alive 連線池與 403 繞過的 headers)。
+    須在事件迴圈內以 async with 建立 (asyncio.Semaphore 綁定建立它的迴圈)：
+
+        async with http_client.AsyncFetcher() as fetcher:
+            t86, mi = await asyncio.gather(fetcher.get_json(url1), fetcher.get_json(url2))
+    """
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.host_slots = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='http')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def get_json(self, url, timeout=TIMEOUT, retries=MAX_RETRIES, endpoint=None):
+        host = urlsplit(url).netloc
+        session, slots = _session_for(host)
+        host_slots = self.host_slots.get(host)
+        if host_slots is None:
+            host_slots = self.host_slots[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(retries + 1):
+            limiter = _rate_limiter_for(host)
+            if limiter:
+                await limiter.acquire_async()
+            async with host_slots, self.in_flight:
+                data, delay = await loop.run_in_executor(
+                    self.executor, _attempt, url, host, session, slots, timeout, attempt, retries, endpoint)
+            if delay is None:
+                return data
+            await asyncio.sleep(delay)
+        return None
+
+def get_stats():
+    """依主機彙總請求次數、重試、錯誤、位元組與耗時。"""
+    stats = {}
+    for entry in list(request_log):
+        s = stats.setdefault(entry['host'], {'requests': 0, 'retries': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0})
+        s['requests'] += 1
+        if entry['attempt'] > 0:
+            s['retries'] += 1
+        if entry['error'] or (entry['status'] and entry['status'] >= 400):
+            s['errors'] += 1
+        s['bytes'] += entry['bytes']
+        s['seconds'] += entry['elapsed']
+    return stats
+
+def print_stats():
+    for host, s in get_stats().items():
+        print(f"[HTTP] {host}: {s['requests']} requests ({s['retries']} retries, {s['errors']} errors), "
+              f"{s['bytes'] / 1024:.0f} KB in {s['seconds']:.2f}s")
@@ -0,0 +1,37 @@
+import gzip
+import hashlib
+
+# 回應壓縮與 ETag：報表內容只在 analyze 重新產出時才會變，
+# 因此每份報表只壓縮一次並與快取一起保存，之後直接回傳壓縮好的 bytes。
+# brotli 為選用套件 (pip install brotli)，未安裝時只提供 gzip。
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+def supported_encodings():
+    return (['br'] if brotli else []) + ['gzip']
+
+def choose_encoding(accept_encodings):
+    """依 Accept-Encoding (werkzeug 的 request.accept_encodings) 選出最佳編碼，不支援時回傳 'identity'。"""
+    for encoding in supported_encodings():
+        if accept_encodings[encoding]:
+            return encoding
+    return 'identity'
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 讓同樣的內容每次壓出相同的 bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+def content_etag(body, *variant):
+    """強 ETag：內容雜湊加上格式/編碼，不同表示法的 bytes 不同所以 ETag 也必須不同。"""
+    digest = hashlib.sha1(body).hexdigest()[:20]
+    return '-'.join([digest, *variant])
@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import progress
+
+# 背景分析工作：/trigger_analysis 立即回傳 job_id，由背景執行緒跑 analyze.py，
+# 前端再透過 /jobs/<job_id> 輪詢狀態與日誌，或以 /jobs/<job_id>/events (SSE) 即時接收進度事件。
+# 同一日期的重複觸發會共用同一個工作。
+
+MAX_CONCURRENT = int(os.environ.get('ANALYSIS_MAX_CONCURRENCY', '1'))
+JOB_TIMEOUT = int(os.environ.get('ANALYSIS_TIMEOUT', '600'))
+JOB_HISTORY = 50
+
+class Job:
+    def __init__(self, date_str):
+        self.id = uuid.uuid4().hex[:12]
+        self.date = date_str
+        self.status = 'queued'  # queued -> running -> success / error
+        self.returncode = None
+        self.log_lines = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # 進度事件 (analyze.py 的 progress.emit 與工作本身的狀態變化)，依序累積供 SSE 重播
+        self.events = []
+        self.changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('success', 'error')
+
+    def add_event(self, event):
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    def wait_events(self, since, timeout):
+        """回傳第 since 筆之後的事件；沒有新事件時最多等待 timeout 秒 (可能回傳空清單)。"""
+        with self.changed:
+            if len(self.events) <= since:
+                self.changed.wait(timeout)
+            return self.events[since:]
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'date': self.date,
+            'status': self.status,
+            'returncode': self.returncode,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'debug_log': ''.join(self.log_lines)
+        }
+
+class JobRunner:
+    def __init__(self, max_concurrent=MAX_CONCURRENT, timeout=JOB_TIMEOUT, history=JOB_HISTORY):
+        self.timeout = timeout
+        self.history = history
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active_by_date = {}
+
+    def submit(self, date_str=None):
+        """
+        建立 (或重用) 某日期的分析工作，回傳 (job, created)。
+        date_str 為 None 代表「今天」：先換成與 analyze.py 預設相同的 YYYYMMDD，
+        與明確指定今天的請求共用同一個工作 (analyze.py 同樣會由該日回溯尋找交易日)。
+        """
+        date_str = date_str or datetime.now().strftime('%Y%m%d')
+        key = date_str
+        with self._lock:
+            active = self._active_by_date.get(key)
+            if active and not active.done:
+                return active, False
+
+            job = Job(date_str)
+            self._jobs[job.id] = job
+            self._active_by_date[key] = job
+            while len(self._jobs) > self.history:
+                old_id, old_job = next(iter(self._jobs.items()))
+                if not old_job.done:
+                    break
+                self._jobs.pop(old_id)
+
+        threading.Thread(target=self._run, args=(job, key), daemon=True).start()
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == 'queued')
+
+    def running_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == 'running')
+
+    def _run(self, job, key):
+        cmd = [sys.executable, '-u', 'analyze.py', job.date]
+
+        with self._slots:
+            job.status = 'running'
+            job.started_at = time.time()
+            job.add_event({'event': 'status', 'status': 'running'})
+            try:
+                process = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    text=True, encoding='utf-8', errors='replace',
+                    env=dict(os.environ, ANALYSIS_EVENTS='1')
+                )
+                # 逾時保護：超過時間直接終止子行程
+                timer = threading.Timer(self.timeout, process.kill)
+                timer.start()
+                try:
+                    for line in process.stdout:
+                        text, event = progress.parse_line(line)
+                        if text:
+                            job.log_lines.append(text)
+                        if event:
+                            job.add_event(event)
+                    job.returncode = process.wait()
+                finally:
+                    timer.cancel()
+                if job.returncode < 0:
+                    job.log_lines.append(f"\n[ERROR] 分析逾時 ({self.timeout}s) 或被中止。\n")
+                job.status = 'success' if job.returncode == 0 else 'error'
+            except Exception as e:
+                job.log_lines.append(f"\n[ERROR] 無法啟動分析程序: {e}\n")
+                job.status = 'error'
+            finally:
+                job.finished_at = time.time()
+                # 工作層級的時間摘要，接在 analyze.py 自己印出的各階段耗時之後
+                job.log_lines.append(f"[TIMING] 排隊 {job.started_at - job.created_at:.1f}s, "
+                                     f"執行 {job.finished_at - job.started_at:.1f}s, 結束碼 {job.returncode}\n")
+                with self._lock:
+                    if self._active_by_date.get(key) is job:
+                        del self._active_by_date[key]
+                job.add_event({'event': 'done', 'status': job.status, 'returncode': job.returncode})
@@ -0,0 +1,157 @@
+import glob
+import json
+import os
+import threading
+import time
+
+import report_data
+import storage
+
+# 報表清單 (manifest)：analyze 發佈報表時以原子方式更新 report_manifest.json，
+# 網頁端只讀這個小檔，不必每次 listdir 或逐一檢查檔案是否存在。
+# 每個日期記錄:
+#   status       complete (兩個市場都有資料) / partial (只有一個市場有資料)
+#   in_progress  analyze 正在產出此日期 (重跑時仍保留上一版已發佈的檔案資訊)
+#   xlsx / sidecar  {'path', 'size', 'mtime_ns'}
+#   markets      {market: {'status': 'ok' / 'missing', 'rows': n}}
+
+MANIFEST_FILE = os.environ.get('REPORT_MANIFEST', 'report_manifest.json')
+
+def _file_info(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _write(path, manifest):
+    storage.write_json(path, manifest, indent=1, sort_keys=True)
+
+def _update(date_str, change, path=MANIFEST_FILE):
+    # analyze 可能同時在多個行程 (ANALYSIS_MAX_CONCURRENCY > 1) 或多個執行緒 (backfill) 中更新清單
+    with storage.locked(path):
+        manifest = storage.read_json(path) or {'reports': {}}
+        entry = manifest['reports'].get(date_str, {'date': date_str})
+        entry = change(entry)
+        if entry is None:
+            manifest['reports'].pop(date_str, None)
+        else:
+            manifest['reports'][date_str] = entry
+        _write(path, manifest)
+    return entry
+
+def mark_in_progress(date_str, path=MANIFEST_FILE):
+    def change(entry):
+        entry['in_progress'] = True
+        entry['started_at'] = time.time()
+        return entry
+    return _update(date_str, change, path)
+
+def abort(date_str, path=MANIFEST_FILE):
+    """analyze 沒有產出報表 (休市或失敗)：清除進行中標記，從未發佈過的日期直接移除。"""
+    def change(entry):
+        entry.pop('in_progress', None)
+        entry.pop('started_at', None)
+        return entry if entry.get('status') else None
+    return _update(date_str, change, path)
+
+def publish(date_str, market_rows, xlsx_path=None, sidecar_path=None, path=MANIFEST_FILE):
+    """報表檔寫出後呼叫。market_rows: {market: 筆數}。"""
+    markets = {}
+    for market_key, _ in report_data.MARKETS:
+        rows = market_rows.get(market_key, 0)
+        markets[market_key] = {'status': 'ok' if rows else 'missing', 'rows': rows}
+
+    def change(entry):
+        entry.pop('in_progress', None)
+        entry.pop('started_at', None)
+        entry['status'] = 'complete' if all(m['status'] == 'ok' for m in markets.values()) else 'partial'
+        entry['markets'] = markets
+        entry['xlsx'] = _file_info(xlsx_path) if xlsx_path else None
+        entry['sidecar'] = _file_info(sidecar_path) if sidecar_path else None
+        entry['published_at'] = time.time()
+        return entry
+    return _update(date_str, change, path)
+
+def rebuild(path=MANIFEST_FILE):
+    """由工作目錄中既有的報表檔重建清單 (清單不存在時的一次性遷移)。"""
+    reports = {}
+    dates = set()
+    for filename in glob.glob('market_analysis_*.xlsx') + glob.glob('market_analysis_*.json'):
+        date_str = os.path.splitext(filename)[0][len('market_analysis_'):]
+        if len(date_str) == 8 and date_str.isdigit():
+            dates.add(date_str)
+    for date_str in dates:
+        xlsx_path = f"market_analysis_{date_str}.xlsx"
+        sidecar = _file_info(report_data.sidecar_path(date_str))
+        markets = {}
+        if sidecar:
+            with open(sidecar['path'], encoding='utf-8') as f:
+                counts = {k: len(v) for k, v in json.load(f)['markets'].items()}
+            for market_key, _ in report_data.MARKETS:
+                rows = counts.get(market_key, 0)
+                markets[market_key] = {'status': 'ok' if rows else 'missing', 'rows': rows}
+        reports[date_str] = {
+            'date': date_str,
+            # 沒有 sidecar 的舊報表無法得知各市場筆數，視為完整
+            'status': 'complete' if all(m['status'] == 'ok' for m in markets.values()) else 'partial',
+            'markets': markets,
+            'xlsx': _file_info(xlsx_path),
+            'sidecar': sidecar,
+        }
+    with storage.locked(path):
+        _write(path, {'reports': reports})
+    return len(reports)
+
+class Manifest(storage.WatchedFile):
+    """網頁端使用的唯讀檢視：載入一次，清單檔變動時才重新讀取。"""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.reports = {}
+        if not os.path.exists(path):
+            print(f"[MANIFEST] 找不到 {path}，由既有報表檔建立...")
+            rebuild(path)
+        self.refresh()
+
+    def load(self):
+        # 先取簽章再讀取：讀取期間檔案又被更新時，下一次 refresh 仍會重新載入
+        signature = storage.file_signature(self.path)
+        manifest = storage.read_json(self.path) or {'reports': {}}
+        self.reports = manifest['reports']
+        self.signature = signature
+
+    def refresh(self):
+        self.reload_if_changed()
+
+    def get(self, date_str):
+        self.refresh()
+        return self.reports.get(date_str)
+
+    def dates(self):
+        """已發佈 (有報表檔) 的日期，新到舊。"""
+        self.refresh()
+        return sorted((d for d, e in self.reports.items() if e.get('xlsx') or e.get('sidecar')), reverse=True)
+
+    def downloads(self):
+        """有 Excel 可下載的日期 (Excel 寫出失敗時報表仍會以 sidecar 發佈)。"""
+        self.refresh()
+        return sorted((d for d, e in self.reports.items() if e.get('xlsx')), reverse=True)
+
+    def statuses(self):
+        self.refresh()
+        return {d: 'in_progress' if e.get('in_progress') else e.get('status', 'in_progress')
+                for d, e in self.reports.items()}
+
+    def is_complete(self, date_str):
+        entry = self.get(date_str)
+        return bool(entry) and entry.get('status') == 'complete'
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild':
+        print(f"[MANIFEST] 已重建，共 {rebuild()} 份報表")
+    else:
+        print("Usage: python manifest.py rebuild")
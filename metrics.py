@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import progress
+import storage
+
+# 輕量的計時與指標模組 (不依賴 prometheus_client)：
+#   - stage(name): 量測 analyze 各階段耗時，同時累積成本次執行的計時摘要
+#   - Counter / Histogram: 以 label 區分的累計值，render() 輸出 Prometheus text format
+# analyze.py 在子行程中執行，各階段耗時另外寫到 RUN_TIMINGS_FILE，由網頁端的 /metrics 讀取。
+
+RUN_TIMINGS_FILE = os.environ.get('RUN_TIMINGS_FILE', 'analysis_timings.json')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}  # label_values -> [各 bucket 計數..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                state = self.values[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label_values, state in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, state):
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, [("le", _format_value(bound))])} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, [("le", "+Inf")])} {state[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(state[-2])}')
+                lines.append(f'{self.name}_count{_format_labels(self.labels, label_values)} {state[-1]}')
+        return lines
+
+def gauge_lines(name, help_text, samples, labels=()):
+    """即時計算的 gauge。samples: [(label_values, value), ...]"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for label_values, value in samples:
+        lines.append(f'{name}{_format_labels(labels, label_values)} {_format_value(value)}')
+    return lines
+
+def render(extra_lines=()):
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
+
+# analyze 各階段與交易所請求
+STAGE_SECONDS = Histogram('analysis_stage_seconds', 'Time spent in each analysis stage', ['stage'])
+HTTP_REQUESTS = Counter('exchange_http_requests_total', 'Exchange HTTP requests by endpoint and status', ['endpoint', 'status'])
+HTTP_BYTES = Counter('exchange_http_response_bytes_total', 'Exchange HTTP response bytes by endpoint', ['endpoint'])
+HTTP_SECONDS = Histogram('exchange_http_request_seconds', 'Exchange HTTP request latency by endpoint', ['endpoint'])
+
+# 本次執行的各階段耗時 (依開始順序)，供 run_summary() 與 /metrics 使用
+_run_lock = threading.Lock()
+_run_timings = []
+
+@contextmanager
+def stage(name):
+    progress.emit('stage', stage=name, state='start')
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        with _run_lock:
+            _run_timings.append((name, elapsed))
+        progress.emit('stage', stage=name, state='end', seconds=round(elapsed, 4))
+
+def record_http(endpoint, status, nbytes, elapsed):
+    HTTP_REQUESTS.inc(endpoint, status if status is not None else 'error')
+    HTTP_BYTES.inc(endpoint, amount=nbytes)
+    HTTP_SECONDS.observe(elapsed, endpoint)
+
+def run_timings():
+    """同名階段 (例如回溯時多次預檢) 的耗時相加，保留第一次出現的順序。"""
+    totals = {}
+    with _run_lock:
+        for name, elapsed in _run_timings:
+            totals[name] = totals.get(name, 0.0) + elapsed
+    return totals
+
+def run_summary():
+    lines = ["[TIMING] 各階段耗時:"]
+    for name, elapsed in run_timings().items():
+        lines.append(f"[TIMING]   {name:<24} {elapsed * 1000:>9.1f} ms")
+    with HTTP_REQUESTS.lock:
+        http = sorted(HTTP_REQUESTS.values.items())
+    for (endpoint, status), count in http:
+        nbytes = HTTP_BYTES.values.get((endpoint,), 0)
+        lines.append(f"[TIMING]   http {endpoint:<19} {count} x {status}, {nbytes / 1024:.0f} KB")
+    return '\n'.join(lines)
+
+def write_run_timings(date_str, success, path=RUN_TIMINGS_FILE):
+    payload = {'date': date_str, 'success': success, 'finished_at': time.time(), 'stages': run_timings()}
+    storage.write_json(path, payload)
+
+def last_run_lines(path=RUN_TIMINGS_FILE):
+    """網頁端: 把 analyze 子行程最後一次執行的各階段耗時轉成 gauge。"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            run = json.load(f)
+    except (OSError, ValueError):
+        return []
+    lines = gauge_lines('analysis_last_run_stage_seconds', 'Stage durations of the most recent analysis run',
+                        [((name,), seconds) for name, seconds in run['stages'].items()], ['stage'])
+    lines += gauge_lines('analysis_last_run_timestamp_seconds', 'Finish time of the most recent analysis run',
+                         [((), run['finished_at'])])
+    lines += gauge_lines('analysis_last_run_success', 'Whether the most recent analysis run produced a report',
+                         [((), 1 if run['success'] else 0)])
+    return lines
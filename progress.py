@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+import threading
+
+# analyze.py 子行程回報進度的結構化事件：以前綴標記寫在 stdout 的單獨一行，
+# jobs.py 讀取子行程輸出時把這些行從日誌中分離出來，再由 /jobs/<id>/events 以 SSE 推送給網頁。
+# 只有由網頁觸發 (JobRunner 設定 ANALYSIS_EVENTS=1) 時才輸出，CLI 執行時日誌不受影響。
+
+PREFIX = '@@event '
+ENABLED = os.environ.get('ANALYSIS_EVENTS') == '1'
+
+_lock = threading.Lock()
+
+def emit(event, **fields):
+    if not ENABLED:
+        return
+    line = PREFIX + json.dumps({'event': event, **fields}, ensure_ascii=False) + '\n'
+    # 整行一次寫出，避免與其他執行緒的 print 交錯
+    with _lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+def parse_line(line):
+    """
+    回傳 (一般日誌文字, 事件 dict 或 None)。
+    其他執行緒的 print 可能剛好寫在事件之前 (print 的內容與換行分兩次寫出)，因此前綴不一定在行首。
+    """
+    pos = line.find(PREFIX)
+    if pos < 0:
+        return line, None
+    try:
+        event = json.loads(line[pos + len(PREFIX):])
+    except ValueError:
+        return line, None
+    return line[:pos], event
@@ -0,0 +1,96 @@
+import heapq
+
+# 排名引擎：每檔股票只掃描一次即分入所有類別，
+# 主控台只需要前 K 名的類別用 heap 取 top-K，工作表需要全部列的區塊才做完整排序。
+
+TOP_K = 10
+
+# 主控台排名類別: 名稱 -> (排序鍵, 是否由大到小)
+CONSOLE_BUCKETS = {
+    'foreign_buy': (lambda x: x['foreign_val'], True),
+    'foreign_sell': (lambda x: x['foreign_val'], False),
+    'it_buy': (lambda x: x['it_val'], True),
+    'it_sell': (lambda x: x['it_val'], False),
+    # 土洋同買超 / 同賣超: 依總買賣超金額
+    'same_buy': (lambda x: x['foreign_val'] + x['it_val'], True),
+    'same_sell': (lambda x: x['foreign_val'] + x['it_val'], False),
+    # 土洋對作: 依兩者絕對值加總 (對作規模)
+    'opp_fb_is': (lambda x: abs(x['foreign_val']) + abs(x['it_val']), True),
+    'opp_fs_ib': (lambda x: abs(x['foreign_val']) + abs(x['it_val']), True),
+}
+
+def classify(d):
+    """回傳這檔股票所屬的主控台類別名稱。"""
+    fv, iv = d['foreign_val'], d['it_val']
+    buckets = []
+    if fv > 0:
+        buckets.append('foreign_buy')
+    elif fv < 0:
+        buckets.append('foreign_sell')
+    if iv > 0:
+        buckets.append('it_buy')
+    elif iv < 0:
+        buckets.append('it_sell')
+    if fv > 0 and iv > 0:
+        buckets.append('same_buy')
+    elif fv < 0 and iv < 0:
+        buckets.append('same_sell')
+    elif fv > 0 > iv:
+        buckets.append('opp_fb_is')
+    elif fv < 0 < iv:
+        buckets.append('opp_fs_ib')
+    return buckets
+
+def top_k(items, k, key, largest):
+    """與 sorted(...)[:k] 結果相同 (含同值時的先後順序)，但只需 O(n log k)。"""
+    if k is None or k >= len(items):
+        return sorted(items, key=key, reverse=largest)
+    if largest:
+        return heapq.nlargest(k, items, key=key)
+    return heapq.nsmallest(k, items, key=key)
+
+def _add_to_blocks(d, blocks):
+    fb, fs, ib, isell = blocks
+    if d['foreign_shares'] > 0:
+        fb.append(d)
+    elif d['foreign_shares'] < 0:
+        fs.append(d)
+    if d['it_shares'] > 0:
+        ib.append(d)
+    elif d['it_shares'] < 0:
+        isell.append(d)
+
+def _sort_blocks(blocks):
+    # 依買賣超金額排序 (由大到小 / 由深到淺即負數由小到大)
+    fb, fs, ib, isell = blocks
+    fb.sort(key=lambda x: x['foreign_val'], reverse=True)
+    fs.sort(key=lambda x: x['foreign_val'])
+    ib.sort(key=lambda x: x['it_val'], reverse=True)
+    isell.sort(key=lambda x: x['it_val'])
+    return fb, fs, ib, isell
+
+def market_blocks(market_data):
+    """工作表的四個區塊 (外資買超、外資賣超、投信買超、投信賣超)，需要全部列因此完整排序。"""
+    blocks = ([], [], [], [])
+    for d in market_data:
+        _add_to_blocks(d, blocks)
+    return _sort_blocks(blocks)
+
+def rank(all_data, k=TOP_K):
+    """
+    一次掃描 all_data 完成所有分類，回傳:
+      'top':    {類別名稱: 前 k 名}，供主控台輸出
+      'blocks': {market: (fb, fs, ib, isell)}，供工作表與網頁使用
+    """
+    buckets = {name: [] for name in CONSOLE_BUCKETS}
+    blocks = {}
+    for d in all_data:
+        for name in classify(d):
+            buckets[name].append(d)
+        _add_to_blocks(d, blocks.setdefault(d['market'], ([], [], [], [])))
+
+    top = {}
+    for name, (key, largest) in CONSOLE_BUCKETS.items():
+        top[name] = top_k(buckets[name], k, key, largest)
+
+    return {'top': top, 'blocks': {market: _sort_blocks(b) for market, b in blocks.items()}}
@@ -0,0 +1,66 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+# 交易所原始回應的磁碟快取 (content-addressed)：
+#   raw_cache/objects/<sha256 前兩碼>/<sha256>.json.gz  實際內容 (gzip 壓縮，相同內容只存一份)
+#   raw_cache/refs/<endpoint>/<YYYYMMDD>               指向內容雜湊的參照
+# 過去日期的資料不會再變動，因此可直接由磁碟供應；離線模式則完全不連網。
+
+CACHE_DIR = os.environ.get('RAW_CACHE_DIR', 'raw_cache')
+OFFLINE = os.environ.get('RAW_CACHE_OFFLINE', 'false').lower() == 'true'
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+def today_str():
+    return datetime.now(TAIPEI_TZ).strftime('%Y%m%d')
+
+def is_immutable(date_str):
+    """台北時間今天以前的資料視為已定案。"""
+    return date_str < today_str()
+
+def roc_to_date(date_roc):
+    """'115/02/23' -> '20260223'"""
+    roc_year, month, day = date_roc.split('/')
+    return f"{int(roc_year) + 1911}{month}{day}"
+
+def _ref_path(endpoint, date_str):
+    return os.path.join(CACHE_DIR, 'refs', endpoint, date_str)
+
+def _object_path(digest):
+    return os.path.join(CACHE_DIR, 'objects', digest[:2], digest + '.json.gz')
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    storage.write_bytes(path, data)
+
+def has(endpoint, date_str):
+    """是否已有快取 (不讀取內容)。"""
+    return os.path.exists(_ref_path(endpoint, date_str))
+
+def load(endpoint, date_str):
+    """讀取快取內容，不存在或損毀時回傳 None。"""
+    try:
+        with open(_ref_path(endpoint, date_str), encoding='ascii') as f:
+            digest = f.read().strip()
+        with gzip.open(_object_path(digest), 'rb') as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if hashlib.sha256(raw).hexdigest() != digest:
+        print(f"[CACHE] {endpoint} {date_str} 內容雜湊不符，忽略快取")
+        return None
+    return json.loads(raw)
+
+def store(endpoint, date_str, payload):
+    raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(raw).hexdigest()
+    obj_path = _object_path(digest)
+    if not os.path.exists(obj_path):
+        _atomic_write(obj_path, gzip.compress(raw, compresslevel=6))
+    _atomic_write(_ref_path(endpoint, date_str), digest.encode('ascii'))
+    return digest
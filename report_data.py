@@ -0,0 +1,206 @@
+import json
+import os
+
+import ranking
+import storage
+
+# 報表 sidecar：analyze() 在輸出 Excel 的同時寫出 market_analysis_<date>.json，
+# 讓網頁端直接讀取數值，不必再經過 pandas 解析 xlsx。
+
+MARKETS = [('TWSE', '上市'), ('TPEX', '上櫃')]
+
+# sidecar 中每一列的欄位順序 (與 fetch_twse / fetch_tpex 產出的欄位相同)
+FIELDS = ['code', 'name', 'price', 'vwap', 'foreign_shares', 'it_shares', 'foreign_val', 'it_val']
+
+MAIN_HEADERS = [
+    "外資買超", "", "", "", "", "", "",
+    "外資賣超", "", "", "", "", "", "",
+    "投信買超", "", "", "", "", "", "",
+    "投信賣超", "", "", "", "", ""
+]
+
+SUB_HEADERS = [
+    "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)", "",
+    "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)", "",
+    "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)", "",
+    "證券代號", "證券名稱", "收盤價", "均價", "股數", "估價(百萬)"
+]
+
+def sidecar_path(date_str):
+    return f"market_analysis_{date_str}.json"
+
+def write_sidecar(date_str, all_data):
+    """以原子方式寫出 sidecar，避免網頁端讀到寫到一半的檔案。"""
+    markets = {}
+    for market_key, _ in MARKETS:
+        markets[market_key] = [[d[f] for f in FIELDS] for d in all_data if d['market'] == market_key]
+
+    filename = sidecar_path(date_str)
+    storage.write_json(filename, {'date': date_str, 'fields': FIELDS, 'markets': markets}, separators=(',', ':'))
+    return filename
+
+def load_sidecar(filename):
+    """讀取 sidecar，回傳 {market_key: [stock dict, ...]}。"""
+    with open(filename, encoding='utf-8') as f:
+        payload = json.load(f)
+    fields = payload['fields']
+    result = {}
+    for market_key, rows in payload['markets'].items():
+        result[market_key] = [dict(zip(fields, row), market=market_key) for row in rows]
+    return result
+
+# 各市場的抓取結果分開保存，某個市場失敗時重跑只需重新抓取該市場
+MARKET_PART_DIR = os.environ.get('MARKET_PART_DIR', 'market_parts')
+
+def market_part_path(date_str, market_key):
+    return os.path.join(MARKET_PART_DIR, f"{date_str}_{market_key}.json")
+
+def write_market_part(date_str, market_key, rows, status):
+    """status: ok (有資料) / failed (抓取或解析失敗、交易所沒有回傳資料)。"""
+    os.makedirs(MARKET_PART_DIR, exist_ok=True)
+    filename = market_part_path(date_str, market_key)
+    storage.write_json(filename, {'date': date_str, 'market': market_key, 'status': status, 'fields': FIELDS,
+                                  'rows': [[d[f] for f in FIELDS] for d in rows]}, separators=(',', ':'))
+    return filename
+
+def load_market_part(date_str, market_key):
+    """
+    回傳已成功取得的某市場資料 (stock dict 清單)，沒有或上次失敗時回傳 None。
+    分市場保存之前產出的報表沒有 part 檔，改由 sidecar 中該市場的資料取得。
+    """
+    try:
+        with open(market_part_path(date_str, market_key), encoding='utf-8') as f:
+            part = json.load(f)
+    except FileNotFoundError:
+        sidecar = sidecar_path(date_str)
+        if not os.path.exists(sidecar):
+            return None
+        return load_sidecar(sidecar).get(market_key) or None
+    if part['status'] != 'ok':
+        return None
+    fields = part['fields']
+    return [dict(zip(fields, row), market=market_key) for row in part['rows']]
+
+def block_cells(st, val_key, shares_key):
+    # 代號轉成 int，避免 Excel 出現「以文字儲存的數字」警告
+    code_val = int(st['code']) if st['code'].isdigit() else st['code']
+    return [code_val, st['name'], st['price'], st['vwap'], st[shares_key], st[val_key] / 1000000]
+
+def sheet_rows(market_data=None, blocks=None):
+    """產生與 Excel 工作表第 4 列之後相同版面的 27 欄資料列。可直接傳入已排序好的 blocks。"""
+    fb, fs, ib, isell = blocks or ranking.market_blocks(market_data)
+    blocks = [
+        (fb, 'foreign_val', 'foreign_shares'),
+        (fs, 'foreign_val', 'foreign_shares'),
+        (ib, 'it_val', 'it_shares'),
+        (isell, 'it_val', 'it_shares'),
+    ]
+    max_rows = max(len(fb), len(fs), len(ib), len(isell))
+    rows = []
+    for row_i in range(max_rows):
+        row = []
+        for block_i, (lst, val_key, shares_key) in enumerate(blocks):
+            if row_i < len(lst):
+                row.extend(block_cells(lst[row_i], val_key, shares_key))
+            else:
+                row.extend(["", "", "", "", "", ""])
+            if block_i < 3:
+                row.append("")
+        rows.append(row)
+    return rows
+
+def build_report_from_sidecar(filename):
+    """由 sidecar 重建與 /get_report 讀取 Excel 時完全相同的 JSON 結構。"""
+    markets = load_sidecar(filename)
+    result = {}
+    for market_key, sheet_name in MARKETS:
+        result[sheet_name] = {
+            'main_headers': MAIN_HEADERS,
+            'sub_headers': SUB_HEADERS,
+            'data': sheet_rows(markets.get(market_key, []))
+        }
+    return result
+
+def build_report_from_xlsx(filename):
+    """
+    沒有 sidecar 的舊報表：以 openpyxl 唯讀模式讀取 Excel，產生與 sidecar 相同的 JSON 結構。
+    第 1 列為日期、第 2 列主標題、第 3 列子標題，第 4 列之後為資料；空白儲存格為 ''，全空的資料列略過。
+    (原本以 pandas.read_excel 讀取，結果相同，但 pandas 的 import 就要數百毫秒與數十 MB 記憶體)
+    """
+    from excel_writer import _import_openpyxl
+    openpyxl = _import_openpyxl()
+
+    wb = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    result = {}
+    try:
+        for ws in wb.worksheets:
+            # 逐列讀取、略過空白列，最後才就地補齊欄寬，不保留整張工作表的中間副本
+            # (唯讀模式下 ws.max_column 取自檔案的 dimension 記錄，不一定可靠，因此以實際讀到的為準)
+            headers = []
+            data = []
+            width = 0
+            for row_i, values in enumerate(ws.iter_rows(values_only=True)):
+                row = [_cell_value(v) for v in values]
+                width = max(width, len(row))
+                if row_i < 3:
+                    headers.append(row)
+                elif not all(str(v).strip() == '' for v in row):
+                    data.append(row)
+            while len(headers) < 3:
+                headers.append([])
+            for row in headers + data:
+                if len(row) < width:
+                    row.extend([''] * (width - len(row)))
+            result[ws.title] = {
+                'main_headers': headers[1],
+                'sub_headers': headers[2],
+                'data': data
+            }
+    finally:
+        wb.close()
+    return result
+
+def _cell_value(value):
+    # 與 pandas 相同: 空白為 ''，整數值的浮點數轉回 int
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+# /api/report 的查詢索引: 每個市場、每個區塊依兩種排序鍵預先排好
+SIDES = ['foreign_buy', 'foreign_sell', 'it_buy', 'it_sell']
+SORT_KEYS = {'val': 5, 'shares': 4}
+
+def build_index(report):
+    """
+    由 /get_report 的結構 (不論來源為 sidecar 或 Excel) 建立查詢索引:
+    {market_key: {side: {sort_key: [6 欄資料列, ...]}}}
+    排序與網頁原本的作法相同: 依絕對值由大到小，同值維持工作表中的先後順序。
+    """
+    index = {}
+    for market_key, sheet_name in MARKETS:
+        sheet = report.get(sheet_name)
+        blocks = {side: [] for side in SIDES}
+        for row in (sheet['data'] if sheet else []):
+            for block_i, side in enumerate(SIDES):
+                cells = row[block_i * 7:block_i * 7 + 6]
+                if cells and cells[0] != '':
+                    blocks[side].append(cells)
+        index[market_key] = {
+            side: {key: sorted(rows, key=lambda r, col=col: abs(_as_number(r[col])), reverse=True)
+                   for key, col in SORT_KEYS.items()}
+            for side, rows in blocks.items()
+        }
+    return index
+
+def market_index(rows, market_key):
+    """單一市場的查詢索引 (分析進行中、完整報表尚未產出時，由該市場的 part 資料建立)。"""
+    sheet_name = dict(MARKETS)[market_key]
+    return build_index({sheet_name: {'data': sheet_rows(rows)}})[market_key]
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
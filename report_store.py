@@ -0,0 +1,110 @@
+import json
+import os
+
+import http_encoding
+import report_data
+import storage
+
+# 跨行程的報表快取：每個日期預先序列化好的各種回應 (/get_report 的 JSON、壓縮結果、/api/report 的排序索引)
+# 存在一個 SQLite 檔中。analyze 發佈報表後直接寫入，所有 gunicorn worker 共用同一份，
+# 不必各自解析 sidecar / Excel，也不必在每個 worker 的記憶體中各放一份；讀取時由作業系統的 page cache 提供。
+# 每一列帶有來源檔的簽章 (路徑、mtime、大小，與報表清單相同)，報表重新產出後舊資料自動失效。
+
+DB_FILE = os.environ.get('REPORT_STORE_DB', 'report_store.sqlite3')
+# 發佈時預先壓縮的編碼 (br 需安裝 brotli)；其他編碼在第一次被請求時才壓縮並補存
+PRECOMPRESS = http_encoding.supported_encodings()
+FORMATS = ('rows',)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_variants (
+    date TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (date, variant)
+)
+"""
+
+def connect(path=DB_FILE):
+    return storage.connect(path, SCHEMA)
+
+def source(entry):
+    """由報表清單的項目回傳 (來源檔名, 簽章)；優先使用 sidecar，舊日期沒有 sidecar 時才退回 Excel。"""
+    info = (entry or {}).get('sidecar') or (entry or {}).get('xlsx')
+    if not info:
+        return None, None
+    return info['path'], f"{info['path']}:{info['mtime_ns']}:{info['size']}"
+
+def index_variant(market_key, side, sort_key):
+    return f"index.{market_key}.{side}.{sort_key}"
+
+def encoded_variant(fmt, encoding):
+    return fmt if encoding == 'identity' else f"{fmt}.{encoding}"
+
+def _dumps(obj):
+    # 與 Flask 的 app.json.dumps 相同 (sort_keys、ensure_ascii)，不論由哪個行程產生，內容與 ETag 都一致
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+def build_variants(filename):
+    """由 sidecar (或舊報表的 Excel) 產生所有要保存的回應，回傳 {variant: bytes}。"""
+    if filename.endswith('.json'):
+        report = report_data.build_report_from_sidecar(filename)
+    else:
+        report = report_data.build_report_from_xlsx(filename)
+    variants = {'rows': _dumps(report)}
+    for fmt in FORMATS:
+        for encoding in PRECOMPRESS:
+            variants[encoded_variant(fmt, encoding)] = http_encoding.compress(variants[fmt], encoding)
+    for market_key, sides in report_data.build_index(report).items():
+        for side, sorts in sides.items():
+            for sort_key, rows in sorts.items():
+                variants[index_variant(market_key, side, sort_key)] = _dumps(rows)
+    return variants
+
+def save(date_str, signature, variants, path=DB_FILE):
+    """以單一交易取代某日期的所有資料，讀取端不會看到新舊混雜的內容。回傳 {格式: 內容雜湊}。"""
+    # 壓縮結果的 ETag 以未壓縮內容的雜湊為準，只需為原始格式計算
+    digests = {fmt: http_encoding.content_etag(variants[fmt]) for fmt in FORMATS}
+    conn = connect(path)
+    with conn:
+        conn.execute('DELETE FROM report_variants WHERE date = ?', (date_str,))
+        conn.executemany(
+            'INSERT INTO report_variants (date, variant, signature, digest, body) VALUES (?, ?, ?, ?, ?)',
+            [(date_str, variant, signature, digests.get(variant.split('.')[0], ''), body)
+             for variant, body in variants.items()]
+        )
+    return digests
+
+def put(date_str, signature, variant, body, path=DB_FILE):
+    """補存單一回應 (例如第一次被請求的壓縮編碼)；該日期已被更新的報表取代時不寫入。"""
+    conn = connect(path)
+    with conn:
+        conn.execute(
+            'INSERT OR IGNORE INTO report_variants (date, variant, signature, digest, body) '
+            'SELECT date, ?, signature, digest, ? FROM report_variants WHERE date = ? AND variant = ? AND signature = ?',
+            (variant, body, date_str, variant.split('.')[0], signature)
+        )
+
+def digests(date_str, signature, path=DB_FILE):
+    """回傳 {格式: 內容雜湊}；沒有該日期或簽章不符 (報表已重新產出) 時回傳 None。"""
+    rows = connect(path).execute(
+        f'SELECT variant, digest FROM report_variants WHERE date = ? AND signature = ? '
+        f'AND variant IN ({", ".join("?" * len(FORMATS))})',
+        (date_str, signature, *FORMATS)
+    ).fetchall()
+    return dict(rows) if len(rows) == len(FORMATS) else None
+
+def get(date_str, signature, variant, path=DB_FILE):
+    row = connect(path).execute(
+        'SELECT body FROM report_variants WHERE date = ? AND variant = ? AND signature = ?',
+        (date_str, variant, signature)
+    ).fetchone()
+    return row[0] if row else None
+
+def store_report(date_str, entry, path=DB_FILE):
+    """analyze 發佈報表後呼叫：依報表清單的項目產生並寫入所有回應。"""
+    filename, signature = source(entry)
+    if filename is None:
+        return None
+    return save(date_str, signature, build_variants(filename), path)
@@ -0,0 +1,262 @@
+import glob
+import heapq
+import os
+import sys
+import threading
+from array import array
+
+import report_data
+import storage
+
+# 每檔股票的 N 日滾動法人統計 (增量更新)：
+# 新的一天進來時只加上當天、扣掉離開視窗的那一天，不需重新掃描歷史報表。
+# 保存:
+#   - 各視窗 (預設 5 / 20 日) 的外資、投信買賣超金額合計
+#   - 外資、投信連續買超 (正數) / 賣超 (負數) 天數
+#   - 最近 max(視窗) 天的每日數值，用來在視窗滑動時扣除
+#     每天存成代號清單 + array('d') [外資, 投信, 外資, 投信, ...]，每檔股票的統計為 __slots__ 物件；
+#     全市場 20 天在記憶體中約 1.5 MB (原本每檔、每天各一個 dict/list 時約 9 MB)
+
+STATE_FILE = os.environ.get('ROLLING_STATE_FILE', 'rolling_state.json')
+WINDOWS = (5, 20)
+
+SIDES = ('foreign', 'it')
+
+def metric_names(windows=WINDOWS):
+    names = []
+    for side in SIDES:
+        for w in windows:
+            names.append(f'{side}_sum_{w}')
+            names.append(f'{side}_avg_{w}')
+        names.append(f'{side}_streak')
+    return names
+
+def _pack_day(values):
+    """{code: (foreign_val, it_val)} -> {'codes': [...], 'values': array('d')}"""
+    flat = array('d')
+    for fv, iv in values.values():
+        flat.append(fv)
+        flat.append(iv)
+    return {'codes': [sys.intern(code) for code in values], 'values': flat}
+
+def _day_items(day):
+    values = day['values']
+    for i, code in enumerate(day['codes']):
+        yield code, values[2 * i], values[2 * i + 1]
+
+class _StockState:
+    """單一股票的滾動統計。sums 依視窗順序存放 [外資, 投信, 外資, 投信, ...]。"""
+    __slots__ = ('name', 'market', 'sums', 'streak', 'prev_streak')
+
+    def __init__(self, n_windows):
+        self.name = None
+        self.market = None
+        self.sums = array('d', bytes(16 * n_windows))
+        self.streak = (0, 0)
+        # 最新一天之前的連續天數，補併同一天的其他市場時由此重新計算
+        self.prev_streak = (0, 0)
+
+    def to_json(self, windows):
+        return {'name': self.name, 'market': self.market,
+                'sums': {w: [self.sums[2 * i], self.sums[2 * i + 1]] for i, w in enumerate(windows)},
+                'streak': list(self.streak), 'prev_streak': list(self.prev_streak)}
+
+    @classmethod
+    def from_json(cls, data, windows):
+        state = cls(len(windows))
+        state.name = data['name']
+        state.market = data['market']
+        for i, w in enumerate(windows):
+            state.sums[2 * i], state.sums[2 * i + 1] = data['sums'][str(w)]
+        state.streak = tuple(data['streak'])
+        state.prev_streak = tuple(data.get('prev_streak', (0, 0)))
+        return state
+
+def _streak(previous, value):
+    if value > 0:
+        return previous + 1 if previous > 0 else 1
+    if value < 0:
+        return previous - 1 if previous < 0 else -1
+    return 0
+
+class RollingStore(storage.WatchedFile):
+    def __init__(self, path=STATE_FILE, windows=WINDOWS, load=True):
+        self.path = path
+        self.windows = tuple(windows)
+        self.lock = threading.Lock()
+        self.dates = []        # 視窗內的日期 (由舊到新)，最多 max(windows) 天
+        self.day_values = {}   # date -> {'codes': [code, ...], 'values': array('d') 依序為各檔的外資、投信}
+        self.stocks = {}       # code -> _StockState
+        # load=False: 延後到第一次 reload_if_changed() 才讀取 (網頁端啟動時不必先載入整個狀態檔)
+        if load:
+            self.load()
+
+    @property
+    def as_of(self):
+        return self.dates[-1] if self.dates else None
+
+    def load(self):
+        signature = storage.file_signature(self.path)
+        state = storage.read_json(self.path)
+        if state is None:
+            return
+        if tuple(state.get('windows', ())) != self.windows:
+            print(f"[ROLLING] 視窗設定已變更 ({state.get('windows')} -> {list(self.windows)})，請執行 rebuild")
+            return
+        self.dates = state['dates']
+        self.day_values = {}
+        for date_str, day in state['day_values'].items():
+            if 'codes' in day:
+                self.day_values[date_str] = {'codes': [sys.intern(c) for c in day['codes']], 'values': array('d', day['values'])}
+            else:
+                # 舊格式 {code: [foreign_val, it_val]}
+                self.day_values[date_str] = _pack_day(day)
+        self.stocks = {sys.intern(code): _StockState.from_json(s, self.windows) for code, s in state['stocks'].items()}
+        self.signature = signature
+
+    def save(self):
+        state = {
+            'windows': list(self.windows),
+            'dates': self.dates,
+            'day_values': {d: {'codes': day['codes'], 'values': day['values'].tolist()} for d, day in self.day_values.items()},
+            'stocks': {code: st.to_json(self.windows) for code, st in self.stocks.items()},
+        }
+        storage.write_json(self.path, state, separators=(',', ':'))
+        self.signature = storage.file_signature(self.path)
+
+    def add_day(self, date_str, rows):
+        """
+        加入新的一天 (rows 為 fetch_twse / fetch_tpex 產出的 dict)。
+        只接受比目前最新日期更新的日期；較舊的日期需要 rebuild。
+        與最新日期相同時 (重跑時補上先前失敗的市場)，把當天還沒有的股票併入。回傳是否有更新。
+        """
+        with self.lock:
+            if self.dates and date_str == self.dates[-1]:
+                return self._merge_latest(rows)
+            if self.dates and date_str <= self.dates[-1]:
+                if date_str not in self.dates:
+                    print(f"[ROLLING] {date_str} 早於目前最新日期 {self.dates[-1]}，略過 (可執行 rebuild 重新計算)")
+                return False
+
+            today = {}
+            for d in rows:
+                today[d['code']] = (d['foreign_val'], d['it_val'])
+                self._stock(d)
+
+            self.dates.append(date_str)
+            self.day_values[date_str] = _pack_day(today)
+            n_days = len(self.dates)
+
+            n_windows = len(self.windows)
+            for code, s in self.stocks.items():
+                fv, iv = today.get(code, (0.0, 0.0))
+                sums = s.sums
+                for i in range(n_windows):
+                    sums[2 * i] += fv
+                    sums[2 * i + 1] += iv
+                s.prev_streak = s.streak
+                s.streak = (_streak(s.streak[0], fv), _streak(s.streak[1], iv))
+
+            # 扣掉剛好離開 w 日視窗的那一天 (只需走訪那天有資料的股票)
+            for i, w in enumerate(self.windows):
+                if n_days > w:
+                    for code, old_fv, old_iv in _day_items(self.day_values[self.dates[-w - 1]]):
+                        sums = self.stocks[code].sums
+                        sums[2 * i] -= old_fv
+                        sums[2 * i + 1] -= old_iv
+
+            # 只保留最長視窗所需的日期
+            max_window = max(self.windows)
+            while len(self.dates) > max_window:
+                self.day_values.pop(self.dates.pop(0), None)
+
+            # 視窗內已無資料的股票不再保留
+            active = set()
+            for day in self.day_values.values():
+                active.update(day['codes'])
+            for code in [c for c in self.stocks if c not in active]:
+                del self.stocks[code]
+            return True
+
+    def _merge_latest(self, rows):
+        """最新一天已有的股票不變；新股票的數值加進所有視窗 (最新一天必定在每個視窗內)。"""
+        today = self.day_values[self.dates[-1]]
+        present = set(today['codes'])
+        added = 0
+        for d in rows:
+            if d['code'] in present:
+                continue
+            fv, iv = d['foreign_val'], d['it_val']
+            present.add(d['code'])
+            today['codes'].append(sys.intern(d['code']))
+            today['values'].append(fv)
+            today['values'].append(iv)
+            s = self._stock(d)
+            for i in range(len(self.windows)):
+                s.sums[2 * i] += fv
+                s.sums[2 * i + 1] += iv
+            s.streak = (_streak(s.prev_streak[0], fv), _streak(s.prev_streak[1], iv))
+            added += 1
+        return added > 0
+
+    def _stock(self, d):
+        s = self.stocks.get(d['code'])
+        if s is None:
+            s = self.stocks[sys.intern(d['code'])] = _StockState(len(self.windows))
+        s.name = d['name']
+        s.market = d['market']
+        return s
+
+    def metrics(self, code):
+        s = self.stocks[code]
+        n_days = len(self.dates)
+        result = {'code': code, 'name': s.name, 'market': s.market}
+        for side_i, side in enumerate(SIDES):
+            for i, w in enumerate(self.windows):
+                total = s.sums[2 * i + side_i]
+                result[f'{side}_sum_{w}'] = total
+                result[f'{side}_avg_{w}'] = total / min(w, n_days) if n_days else 0.0
+            result[f'{side}_streak'] = s.streak[side_i]
+        return result
+
+    def top(self, metric, n=20, ascending=False, market=None):
+        if metric not in metric_names(self.windows):
+            raise ValueError(f"unknown metric: {metric}")
+        with self.lock:
+            rows = [self.metrics(code) for code, s in self.stocks.items() if market is None or s.market == market]
+        key = lambda r: r[metric]
+        return heapq.nsmallest(n, rows, key=key) if ascending else heapq.nlargest(n, rows, key=key)
+
+    def rebuild(self, pattern='market_analysis_*.json'):
+        """由既有的 sidecar 依日期順序重新建立 (回補歷史或視窗設定變更時使用)。"""
+        with self.lock:
+            self.dates, self.day_values, self.stocks = [], {}, {}
+        files = sorted(glob.glob(pattern))
+        for filename in files:
+            date_str = os.path.basename(filename)[len('market_analysis_'):-len('.json')]
+            if len(date_str) != 8 or not date_str.isdigit():
+                continue
+            markets = report_data.load_sidecar(filename)
+            self.add_day(date_str, [d for rows in markets.values() for d in rows])
+        with storage.locked(self.path):
+            self.save()
+        return len(self.dates)
+
+def update(date_str, rows, path=STATE_FILE):
+    """analyze() 完成後呼叫：把當天結果併入滾動統計並存檔。"""
+    # 多個 analyze 行程 (ANALYSIS_MAX_CONCURRENCY > 1、回補與網頁觸發同時執行) 或 backfill 的多個執行緒
+    # 可能同時更新，讀改寫整個狀態檔需在檔案鎖內進行
+    with storage.locked(path):
+        store = RollingStore(path)
+        if store.add_day(date_str, rows):
+            store.save()
+            return True
+    return False
+
+if __name__ == '__main__':
+    # 由既有 sidecar 重建: python rolling.py rebuild
+    if len(sys.argv) > 1 and sys.argv[1] == 'rebuild':
+        n = RollingStore().rebuild()
+        print(f"[ROLLING] 已由 sidecar 重建，視窗內共 {n} 個交易日")
+    else:
+        print("Usage: python rolling.py rebuild")
@@ -0,0 +1,120 @@
+import glob
+import os
+
+import report_data
+import storage
+
+# 個股歷史：以 (證券代號, 日期) 為主鍵的 SQLite 表，
+# 查詢「某檔股票最近 N 個交易日的法人買賣超」只需走一次主鍵索引，不必打開 N 個 Excel。
+# analyze() 每次產出報表時寫入當天資料；既有報表可用
+#   python stock_history.py import
+# 匯入 (有 sidecar 時讀 sidecar，沒有時讀 Excel)。
+
+DB_FILE = os.environ.get('STOCK_HISTORY_DB', 'stock_history.sqlite3')
+
+COLUMNS = ['date', 'market', 'name', 'price', 'vwap', 'foreign_shares', 'it_shares', 'foreign_val', 'it_val']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flows (
+    code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    market TEXT NOT NULL,
+    name TEXT,
+    price REAL,
+    vwap REAL,
+    foreign_shares INTEGER,
+    it_shares INTEGER,
+    foreign_val REAL,
+    it_val REAL,
+    PRIMARY KEY (code, date)
+) WITHOUT ROWID
+"""
+
+# 依日期範圍匯出 (export.py) 用；WITHOUT ROWID 表的索引項目附帶主鍵的 code，因此已依 (date, market, code) 排序
+INDEX = "CREATE INDEX IF NOT EXISTS flows_by_date ON flows (date, market)"
+
+def connect(path=DB_FILE):
+    return storage.connect(path, SCHEMA, INDEX)
+
+def record_day(date_str, rows, path=DB_FILE):
+    """寫入 (或覆寫) 某一天所有股票的資料。rows 為 fetch_twse / fetch_tpex 產出的 dict。"""
+    conn = connect(path)
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO flows (code, date, market, name, price, vwap, foreign_shares, it_shares, foreign_val, it_val) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(d['code'], date_str, d['market'], d['name'], d['price'], d['vwap'],
+              d['foreign_shares'], d['it_shares'], d['foreign_val'], d['it_val']) for d in rows]
+        )
+    return len(rows)
+
+def series(code, days=60, path=DB_FILE):
+    """回傳最近 days 個有資料的交易日 (由舊到新)。"""
+    cur = connect(path).execute(
+        f'SELECT {", ".join(COLUMNS)} FROM flows WHERE code = ? ORDER BY date DESC LIMIT ?', (code, days)
+    )
+    rows = [dict(zip(COLUMNS, r)) for r in cur.fetchall()]
+    rows.reverse()
+    return rows
+
+def read_xlsx(filename):
+    """
+    由 Excel 報表還原每檔股票的數值 (舊報表沒有 sidecar 時使用)。
+    外資區塊提供外資股數/金額，投信區塊提供投信股數/金額；不在某一方區塊的股票該方為 0。
+    金額欄位為百萬元，乘回原本的單位。
+    """
+    from excel_writer import _import_openpyxl
+    openpyxl = _import_openpyxl()
+
+    wb = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    sheet_markets = {sheet_name: market_key for market_key, sheet_name in report_data.MARKETS}
+    stocks = {}
+    try:
+        for ws in wb.worksheets:
+            market_key = sheet_markets.get(ws.title)
+            if market_key is None:
+                continue
+            for row in ws.iter_rows(min_row=4, values_only=True):
+                for block_i in range(4):
+                    cells = row[block_i * 7:block_i * 7 + 6]
+                    if len(cells) < 6 or cells[0] in (None, ''):
+                        continue
+                    code, name, price, vwap, shares, value = cells
+                    code = str(code)
+                    d = stocks.get(code)
+                    if d is None:
+                        d = stocks[code] = {'market': market_key, 'code': code, 'name': name, 'price': price, 'vwap': vwap,
+                                            'foreign_shares': 0, 'it_shares': 0, 'foreign_val': 0.0, 'it_val': 0.0}
+                    side = 'foreign' if block_i < 2 else 'it'
+                    d[f'{side}_shares'] = shares or 0
+                    d[f'{side}_val'] = (value or 0) * 1000000
+    finally:
+        wb.close()
+    return list(stocks.values())
+
+def import_reports(path=DB_FILE):
+    """匯入工作目錄中所有既有報表，回傳匯入的日期數。"""
+    imported = 0
+    dates = set()
+    for filename in glob.glob('market_analysis_*.xlsx') + glob.glob('market_analysis_*.json'):
+        date_str = os.path.splitext(filename)[0][len('market_analysis_'):]
+        if len(date_str) == 8 and date_str.isdigit():
+            dates.add(date_str)
+    for date_str in sorted(dates):
+        sidecar = report_data.sidecar_path(date_str)
+        if os.path.exists(sidecar):
+            rows = [d for market_rows in report_data.load_sidecar(sidecar).values() for d in market_rows]
+        else:
+            rows = read_xlsx(f"market_analysis_{date_str}.xlsx")
+        record_day(date_str, rows, path)
+        imported += 1
+        print(f"[HISTORY] {date_str}: {len(rows)} stocks")
+    return imported
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'import':
+        print(f"[HISTORY] 已匯入 {import_reports()} 個日期的報表")
+    else:
+        print("Usage: python stock_history.py import")
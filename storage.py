@@ -0,0 +1,106 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: 只有同一行程內的鎖
+    fcntl = None
+
+# 各模組共用的檔案與 SQLite 工具：
+#   read_json / write_json / write_bytes  原子寫入 (先寫暫存檔再 os.replace)，讀取端不會看到寫到一半的檔案
+#   locked          跨行程 (fcntl) 與行程內 (threading) 的互斥鎖，讀-改-寫 JSON 檔時使用
+#   WatchedFile     以檔案為準的狀態，檔案被其他行程更新後才重新載入
+#   connect         每個執行緒、每個資料庫檔一條 SQLite 連線 (WAL)
+
+def read_json(path):
+    """讀取 JSON 檔，不存在時回傳 None。"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _tmp_path(path):
+    # 暫存檔名帶行程與執行緒編號: 同一個檔可能由多個 analyze 行程或回補的執行緒同時寫入
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+def write_bytes(path, data):
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_json(path, data, **dump_kwargs):
+    """dump_kwargs 傳給 json.dump (indent、separators 等)，預設 ensure_ascii=False。"""
+    dump_kwargs.setdefault('ensure_ascii', False)
+    tmp_path = _tmp_path(path)
+    # 直接寫入檔案，不先組成整個字串 (滾動統計的狀態檔可達數 MB)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+def _thread_lock(path):
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        lock = _path_locks.get(key)
+        if lock is None:
+            lock = _path_locks[key] = threading.Lock()
+        return lock
+
+@contextmanager
+def locked(path):
+    """取得 path 的獨佔鎖 (鎖檔為 path + '.lock')；同一行程的其他執行緒也會被擋住。"""
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def file_signature(path):
+    """(mtime_ns, size)，檔案不存在時回傳 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+class WatchedFile:
+    """
+    由單一檔案載入的狀態 (網頁端使用，檔案由 analyze 行程更新)。
+    子類別提供 self.path、self.lock，並實作 load()；load() 與 save() 之後設定 self.signature = file_signature(self.path)。
+    """
+    signature = None
+
+    def reload_if_changed(self):
+        signature = file_signature(self.path)
+        if signature is not None and signature != self.signature:
+            with self.lock:
+                self.load()
+
+_local = threading.local()
+
+def connect(path, *schema):
+    """每個執行緒共用一條連線 (sqlite3 連線不可跨執行緒使用)；第一次連線時執行 schema 中的各個敘述。"""
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        # WAL: analyze 寫入時網頁端仍可讀取
+        conn.execute('PRAGMA journal_mode=WAL')
+        for statement in schema:
+            conn.execute(statement)
+        conns[path] = conn
+    return conn
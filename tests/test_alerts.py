@@ -0,0 +1,171 @@
+import pytest
+
+import alerts
+import trading_calendar
+
+def _row(code, foreign_val, it_val, market='TWSE', name=None):
+    return {'code': code, 'name': name or f'股{code}', 'market': market, 'price': 100.0, 'vwap': 100.0,
+            'foreign_shares': int(foreign_val / 100), 'it_shares': int(it_val / 100),
+            'foreign_val': foreign_val, 'it_val': it_val}
+
+def _compile(when, watchlists=None, **rule):
+    return alerts.compile_rule(dict({'id': 'r'}, **rule, when=when), watchlists)
+
+# --- 規則語法 ---
+
+def test_units_become_numeric_ranges():
+    rule = _compile('foreign_val > 5億 and it_val >= 1.5萬')
+    assert sorted(rule.ranges) == [('foreign_val', '>', 500000000.0), ('it_val', '>=', 15000.0)]
+    assert rule.predicate is None
+
+def test_units_inside_strings_are_untouched():
+    rule = _compile("name == '5億' and foreign_val > 1億")
+    assert rule.ranges == [('foreign_val', '>', 100000000.0)]
+    assert rule.predicate(_row('1', 2e8, 0, name='5億'))
+    assert not rule.predicate(_row('1', 2e8, 0, name='500000000.0'))
+
+def test_code_conditions_use_code_sets():
+    rule = _compile("code in ['2330', '2317'] and opposite")
+    assert rule.codes == frozenset(['2330', '2317'])
+    assert rule.ranges == [('flow_product', '<', 0)]
+
+def test_code_matches_the_same_on_index_and_predicate_paths():
+    rows = [_row('2330', 1e8, 1e8), _row('2317', -1e8, 1e8), _row('2454', 1e8, -1e8)]
+    # 最上層的 code 條件由代號集合判斷，放在 or 中則由逐檔求值的函式判斷
+    indexed = _compile("code in ['2330', '2317']", id='indexed')
+    predicate = _compile("code in ['2330', '2317'] or price < 0", id='predicate')
+    assert indexed.codes is not None and indexed.predicate is None
+    assert predicate.codes is None and predicate.predicate is not None
+    _, result = alerts.evaluate_day([indexed, predicate], rows, {}, '20260223')
+    assert result['rules']['indexed'] == result['rules']['predicate'] == {'2330': 1, '2317': 1}
+
+@pytest.mark.parametrize('when', [
+    'foreign_val / 2 > it_val',
+    'abs(foreign_val) > max(it_val, 1億)',
+    '-foreign_val > 0 and not same_buy',
+    "code not in ('2330',) or name == '台積電'",
+])
+def test_accepted(when):
+    _compile(when)
+
+@pytest.mark.parametrize('when', [
+    "name == 'a' * 9999999999",     # 字串運算
+    "'a' * 3 == name",
+    'name + 1 > 0',                  # 文字欄位參與運算
+    '-name',
+    'abs(name) > 0',
+    'foreign_val * same_buy > 0',    # 布林衍生欄位參與運算
+    "'x'",                           # 比較以外的字串
+    '[1, 2] == [1]',                 # in 以外的清單
+    "code in ['1', name]",
+    'foreign_val > 1e300',           # 數字超過上限
+    'foreign_val > 10000000000000000',
+    'foreign_val > 5億億',
+    'foreign_val > (1',
+    "__import__('os')",
+    'foreign_val.real > 0',
+    'max() > 0',
+    'unknown_field > 0',
+    'code in [2330]',                # 文字欄位與數字比較
+    "code in ['2330', 2317] or same_buy",
+    'code == 2330',
+    'name != 0',
+    'code in watchlist',             # 規則沒有指定觀察名單
+    'lambda: 1',
+])
+def test_rejected(when):
+    with pytest.raises(alerts.RuleError):
+        _compile(when)
+
+def test_rule_fields_are_validated():
+    with pytest.raises(alerts.RuleError):
+        alerts.compile_rule({'id': 'bad id', 'when': 'foreign_val > 0'})
+    with pytest.raises(alerts.RuleError):
+        alerts.compile_rule({'id': 'r', 'when': 'foreign_val > 0', 'days': 0})
+    with pytest.raises(alerts.RuleError):
+        alerts.compile_rule({'id': 'r', 'when': 'foreign_val > 0', 'market': 'NASDAQ'})
+    with pytest.raises(alerts.RuleError):
+        alerts.compile_rule({'id': 'r', 'when': 'foreign_val > 0', 'watchlist': 'missing'}, {})
+
+def test_failing_predicate_does_not_abort_other_rules():
+    rules = [_compile('foreign_val / it_val > 1', id='ratio'), _compile('same_buy', id='buy')]
+    rows = [_row('1', 5e8, 0), _row('2', 5e8, 1e8)]
+    _, result = alerts.evaluate_day(rules, rows, {}, '20260223')
+    assert result['rules'] == {'ratio': {'2': 1}, 'buy': {'2': 1}}
+
+# --- 觀察名單 ---
+
+def test_watchlist_expansion():
+    watchlists = {'core': ['2330', '2317']}
+    rule = _compile('code in watchlist and foreign_val > 0', watchlist='core', watchlists=watchlists)
+    assert rule.codes == frozenset(['2330', '2317'])
+    rows = [_row('2330', 1e8, -1e8), _row('2317', 3e8, 1e8), _row('2454', 9e8, 9e8), _row('1101', -1e8, 0)]
+    _, result = alerts.evaluate_day([rule], rows, {}, '20260223')
+    assert result['rules'] == {'r': {'2330': 1, '2317': 1}}
+    assert set(result['stocks']) == {'2330', '2317'}
+    # 依買賣超規模排序，帶有當天數值
+    found = alerts.expand(result, 'r')
+    assert [m['code'] for m in found] == ['2317', '2330']
+    assert found[0]['days'] == 1 and found[0]['foreign_val'] == 3e8
+
+def test_watchlist_change_resets_rule_key():
+    before = _compile('code in watchlist', watchlist='core', watchlists={'core': ['2330']})
+    after = _compile('code in watchlist', watchlist='core', watchlists={'core': ['2330', '2317']})
+    assert before.key != after.key
+
+# --- 連續天數 ---
+
+@pytest.fixture
+def calendar(monkeypatch, tmp_path):
+    """只記得 open 中日期的交易日曆 (不讀寫工作目錄中的 trading_calendar.json)。"""
+    calendar = trading_calendar.TradingCalendar(str(tmp_path / 'trading_calendar.json'), str(tmp_path / 'holidays.txt'))
+    monkeypatch.setattr(trading_calendar, '_calendar', calendar)
+    return calendar.open
+
+def _run(rules, days, state=None):
+    """依序計算 [(date, rows), ...]，回傳 (最後狀態, 各日結果)。"""
+    state, results = state or {}, {}
+    for date_str, rows in days:
+        state, results[date_str] = alerts.evaluate_day(rules, rows, state, date_str)
+    return state, results
+
+def test_streak_counts_consecutive_days(calendar):
+    rule = _compile('same_buy', days=2)
+    buy, sell = _row('1', 1e8, 1e8), _row('1', -1e8, 1e8)
+    _, results = _run([rule], [('20260223', [buy]), ('20260224', [buy]), ('20260225', [sell]), ('20260226', [buy])])
+    assert [results[d]['rules']['r'] for d in sorted(results)] == [{}, {'1': 2}, {}, {}]
+
+def test_same_date_rerun_recomputes_from_previous_day(calendar):
+    rule = _compile('same_buy')
+    buy = _row('1', 1e8, 1e8)
+    state, _ = _run([rule], [('20260223', [buy]), ('20260224', [buy])])
+    state, results = _run([rule], [('20260224', [buy, _row('2', 1e8, 1e8)])], state)
+    assert results['20260224']['rules']['r'] == {'1': 2, '2': 1}
+
+def test_streak_continues_over_weekends_and_unknown_days(calendar):
+    rule = _compile('same_buy')
+    buy = _row('1', 1e8, 1e8)
+    # 20260221-22 為週末，20260219-20 未知 (視為休市)
+    _, results = _run([rule], [('20260218', [buy]), ('20260223', [buy])])
+    assert results['20260223']['rules']['r'] == {'1': 2}
+
+def test_streak_resets_across_missed_trading_day(calendar):
+    rule = _compile('same_buy')
+    buy = _row('1', 1e8, 1e8)
+    calendar.add('20260224')
+    _, results = _run([rule], [('20260223', [buy]), ('20260225', [buy])])
+    assert results['20260225']['rules']['r'] == {'1': 1}
+
+def test_older_date_does_not_touch_state_or_results(calendar, tmp_path):
+    rule = _compile('same_buy')
+    buy = _row('1', 1e8, 1e8)
+    store = alerts.AlertStore(str(tmp_path / 'alert_state.json'), load=False)
+    store.add_day('20260223', [buy], [rule])
+    store.add_day('20260224', [buy], [rule])
+    rules_before = store.rules
+    assert store.add_day('20260220', [buy], [rule]) is None
+    assert store.rules is rules_before
+    assert store.dates == ['20260224', '20260223']
+    # evaluate_day 本身也不會讓較舊的日期改變狀態
+    state, results = alerts.evaluate_day([rule], [buy], store.rules, '20260220')
+    assert state == store.rules and results['rules'] == {}
@@ -0,0 +1,34 @@
+import os
+
+import trading_calendar
+
+def _calendars(tmp_path, n=2):
+    """同一個日曆檔的多個檢視，模擬網頁端與 analyze 行程。"""
+    path, holidays = str(tmp_path / 'trading_calendar.json'), str(tmp_path / 'holidays.txt')
+    return [trading_calendar.TradingCalendar(path, holidays) for _ in range(n)]
+
+def test_record_keeps_dates_recorded_by_other_writers(tmp_path):
+    first, second = _calendars(tmp_path)
+    first.record('20260223', True)
+    # second 的記憶體內容還沒有 20260223，寫入前需在鎖內重新讀取
+    second.record('20260216', False)
+    reader, = _calendars(tmp_path, 1)
+    assert reader.lookup('20260223') is True
+    assert reader.lookup('20260216') is False
+
+def test_reader_sees_later_records(tmp_path):
+    web, job = _calendars(tmp_path)
+    assert web.lookup('20260216') is None
+    job.record('20260216', False)
+    assert web.lookup('20260216') is False
+    job.record('20260216', True)
+    assert web.lookup('20260216') is True
+
+def test_holidays_file_marks_closed_days(tmp_path):
+    with open(tmp_path / 'holidays.txt', 'w', encoding='utf-8') as f:
+        f.write('# 春節\n20260216\n20260217  # 除夕\n')
+    calendar, = _calendars(tmp_path, 1)
+    assert calendar.lookup('20260216') is False
+    assert calendar.lookup('20260217') is False
+    assert calendar.lookup('20260218') is None
+    assert not os.path.exists(tmp_path / 'trading_calendar.json')
@@ -0,0 +1,134 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import raw_cache
+import storage
+
+# 本地交易日曆：記錄已確認的開盤日與休市日，讓「D 日以前最近的交易日」
+# 在常見情況下不必連網就能判斷。
+#   trading_calendar.json  由 validate_trading_day 探測結果自動累積
+#   holidays.txt           (選用) 手動整批匯入的休市日，每行一個 YYYYMMDD，# 開頭為註解
+
+CALENDAR_FILE = os.environ.get('TRADING_CALENDAR_FILE', 'trading_calendar.json')
+HOLIDAYS_FILE = os.environ.get('TRADING_HOLIDAYS_FILE', 'holidays.txt')
+
+# 台北時間幾點之後當天的盤後資料才會公布
+DATA_READY_HOUR = 15
+
+class TradingCalendar(storage.WatchedFile):
+    """
+    已知的開盤日與休市日。網頁端與 analyze 行程共用同一個檔案：
+    讀取時檔案被其他行程更新過才重新載入，記錄時在檔案鎖內重新讀取後再寫回，不會蓋掉其他行程剛記錄的日期。
+    holidays.txt 在每次載入時一併讀取 (只改 holidays.txt 時需等日曆檔下次更新或重新啟動)。
+    """
+
+    def __init__(self, path=CALENDAR_FILE, holidays_path=HOLIDAYS_FILE):
+        self.path = path
+        self.holidays_path = holidays_path
+        self.lock = threading.Lock()
+        self.open = set()
+        self.closed = set()
+        self.load()
+
+    def load(self):
+        signature = storage.file_signature(self.path)
+        open_days, closed_days = set(), set()
+        try:
+            data = storage.read_json(self.path) or {}
+            open_days.update(data.get('open', []))
+            closed_days.update(data.get('closed', []))
+        except (OSError, ValueError) as e:
+            print(f"[CALENDAR] 無法讀取 {self.path}: {e}")
+        if os.path.exists(self.holidays_path):
+            with open(self.holidays_path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if len(line) == 8 and line.isdigit():
+                        closed_days.add(line)
+        self.open, self.closed = open_days, closed_days
+        self.signature = signature
+
+    def lookup(self, date_str):
+        self.reload_if_changed()
+        if date_str in self.open:
+            return True
+        if date_str in self.closed:
+            return False
+        return None
+
+    def record(self, date_str, is_open):
+        with storage.locked(self.path), self.lock:
+            self.load()
+            target, other = (self.open, self.closed) if is_open else (self.closed, self.open)
+            if date_str in target:
+                return
+            target.add(date_str)
+            other.discard(date_str)
+            try:
+                storage.write_json(self.path, {'open': sorted(self.open), 'closed': sorted(self.closed)}, indent=0)
+            except OSError as e:
+                print(f"[CALENDAR] 無法寫入 {self.path}: {e}")
+                return
+            self.signature = storage.file_signature(self.path)
+
+_lock = threading.Lock()
+_calendar = None
+
+def _get():
+    global _calendar
+    with _lock:
+        if _calendar is None:
+            _calendar = TradingCalendar(CALENDAR_FILE, HOLIDAYS_FILE)
+        return _calendar
+
+def is_weekend(date_str):
+    return datetime.strptime(date_str, '%Y%m%d').weekday() >= 5
+
+def lookup(date_str):
+    """True = 已知開盤、False = 已知休市 (含週末)、None = 未知需要探測。"""
+    if is_weekend(date_str):
+        return False
+    return _get().lookup(date_str)
+
+def record(date_str, is_open):
+    """
+    記錄探測結果。今天 (含) 以後的「休市」不記錄，
+    因為盤後資料尚未公布時同樣會查無資料。
+    """
+    if not is_open and not raw_cache.is_immutable(date_str):
+        return
+    _get().record(date_str, is_open)
+
+def open_days_between(start_date_str, end_date_str):
+    """start 與 end 之間 (不含兩端) 已知開盤的日期。未知的日期不做網路探測，視為休市。"""
+    start = datetime.strptime(start_date_str, '%Y%m%d') + timedelta(days=1)
+    end = datetime.strptime(end_date_str, '%Y%m%d')
+    days = []
+    while start < end:
+        date_str = start.strftime('%Y%m%d')
+        if lookup(date_str):
+            days.append(date_str)
+        start += timedelta(days=1)
+    return days
+
+def candidate_days(start_date_str, max_days=10):
+    """由 start 往回列出最多 max_days 天中，不是已知休市日的日期。"""
+    start = datetime.strptime(start_date_str, '%Y%m%d')
+    days = []
+    for i in range(max_days):
+        date_str = (start - timedelta(days=i)).strftime('%Y%m%d')
+        if lookup(date_str) is not False:
+            days.append(date_str)
+    return days
+
+def expected_trading_day(now=None):
+    """
+    網頁端預設要抓取的日期：台北時間 15:00 前視為資料尚未公布改看前一天，
+    再往回跳過週末與已知休市日 (未知日期視為開盤，不做網路探測)。
+    """
+    now = now or datetime.now(raw_cache.TAIPEI_TZ)
+    if now.hour < DATA_READY_HOUR:
+        now -= timedelta(days=1)
+    days = candidate_days(now.strftime('%Y%m%d'), max_days=15)
+    return days[0] if days else now.strftime('%Y%m%d')